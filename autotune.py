@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
+
+from cache import cache_key, hash_file
+from engine import check_cancel, get_engine
+from language import AUTO_LANG, probe_language, probe_region
+from preprocess import Decode, Grayscale, build_pipeline
+from result import PageResult
+from timings import stage
+
+# Réglage automatique du prétraitement : au lieu de chercher à la main luminosité, contraste et
+# seuillage en relançant l'OCR de la page entière, une petite recherche évalue des réglages
+# candidats en parallèle sur un extrait de la page (le plus grand bloc de texte, à la taille de
+# reconnaissance) et garde celui que Tesseract lit avec le plus de confiance. Le choix est fait
+# une fois par document et mémorisé par empreinte du contenu.
+
+# Changer les grilles ou le score invalide les choix mémorisés
+AUTOTUNE_VERSION = 1
+
+# Recherche en deux temps : le seuillage (taille du voisinage, constante) à luminosité et contraste
+# neutres, puis luminosité et contraste avec le meilleur seuillage. Les réglages par défaut sont
+# en tête : à égalité de score, ils sont gardés
+THRESHOLD_GRID = [(11, 2), (11, 6), (11, 10), (21, 2), (21, 6), (21, 10), (31, 2), (31, 6), (31, 10)]
+TONE_GRID = [(0, 0), (0, 25), (0, 50), (-20, 0), (-20, 25), (20, 0), (20, 25), (-20, 50), (20, 50)]
+
+# Taille maximale de l'extrait reconnu pour chaque candidat
+SAMPLE_MAX_PIXELS = 400_000
+
+# Un candidat qui lit moins de cette part des caractères du candidat le plus riche est écarté :
+# un seuillage qui efface les lettres ne garde que les mots les plus nets, lus avec confiance
+MIN_TEXT_SHARE = 0.5
+
+# Choix mémorisés dans le processus, en plus du cache des résultats
+MEMO_SIZE = 256
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _remember(key, value):
+    with _memo_lock:
+        _memo[key] = value
+        _memo.move_to_end(key)
+        while len(_memo) > MEMO_SIZE:
+            _memo.popitem(last=False)
+
+
+def _recall(key):
+    with _memo_lock:
+        value = _memo.get(key)
+        if value is not None:
+            _memo.move_to_end(key)
+        return value
+
+
+def _evaluate(engine, sample, options, lang, cancel):
+    check_cancel(cancel)
+    processed = build_pipeline(options).run(sample)
+    height, width = processed.shape
+    return PageResult.from_tsv(engine.image_to_tsv(processed, lang, psm=6, cancel=cancel), width, height)
+
+
+def _best(scores):
+    # Indice du meilleur candidat : confiance moyenne la plus haute parmi ceux qui ont lu assez de texte
+    richest = max(chars for _, chars in scores)
+    eligible = [index for index, (_, chars) in enumerate(scores) if chars and chars >= richest * MIN_TEXT_SHARE]
+    if not eligible:
+        return 0
+    return max(eligible, key=lambda index: (scores[index][0], -index))
+
+
+def _search(engine, sample, options, lang, cancel, workers):
+    # Renvoie (réglages retenus, scores de tous les candidats)
+    base = replace(options, brightness=0, contrast=0)
+    tried = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def run(candidates):
+            results = list(executor.map(lambda candidate: _evaluate(engine, sample, candidate, lang, cancel),
+                                        candidates))
+            scores = [(round(result.mean_confidence, 2), len(result.text.strip())) for result in results]
+            tried.extend({"brightness": candidate.brightness, "contrast": candidate.contrast,
+                          "block_size": candidate.block_size, "threshold_c": candidate.threshold_c,
+                          "confidence": confidence, "chars": chars}
+                         for candidate, (confidence, chars) in zip(candidates, scores))
+            return candidates[_best(scores)]
+
+        best = run([replace(base, block_size=block_size, threshold_c=c) for block_size, c in THRESHOLD_GRID])
+        best = run([replace(best, brightness=brightness, contrast=contrast) for brightness, contrast in TONE_GRID])
+    chosen = {"brightness": best.brightness, "contrast": best.contrast,
+              "block_size": best.block_size, "threshold_c": best.threshold_c}
+    return chosen, tried
+
+
+def autotune_options(pil_img, options, image_path=None, cache=None, trace=None, page=0, cancel=None,
+                     content_hash=None):
+    # Options dont le prétraitement est réglé pour cette image (déjà mise à l'échelle de
+    # reconnaissance). Le choix est mémorisé par empreinte du fichier `image_path`
+    engine = get_engine(options.engine)
+    lang = probe_language(engine.languages()) if options.lang == AUTO_LANG else options.lang
+    with stage(trace, "autotune", page=page) as entry:
+        key = None
+        if image_path is not None:
+            content_hash = content_hash or hash_file(image_path)
+            key = cache_key(content_hash, {"autotune": AUTOTUNE_VERSION, "page": page, "lang": lang,
+                                           "text_height": options.text_height, "deskew": options.deskew},
+                            f"{engine.name} {engine.version()}")
+        stored = _recall(key) if key is not None else None
+        if stored is None and key is not None and cache is not None:
+            stored = cache.get(key)
+            if stored is not None:
+                _remember(key, stored)
+        if stored is not None:
+            chosen = json.loads(stored)["chosen"]
+            entry["memoized"] = True
+        else:
+            sample = probe_region(Grayscale()(Decode()(pil_img)), SAMPLE_MAX_PIXELS)
+            workers = min(len(THRESHOLD_GRID), os.cpu_count() or 1)
+            chosen, tried = _search(engine, sample, options, lang, cancel, workers)
+            entry.update(sample=[sample.shape[1], sample.shape[0]], candidates=len(tried), scores=tried)
+            if key is not None:
+                stored = json.dumps({"chosen": chosen, "scores": tried})
+                _remember(key, stored)
+                if cache is not None:
+                    cache.put(key, stored)
+        entry["chosen"] = chosen
+    if trace is not None:
+        trace.note(tuned=chosen)
+    return replace(options, **chosen)
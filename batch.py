@@ -0,0 +1,260 @@
+import argparse
+import glob
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from cache import DEFAULT_MAX_BYTES, OcrCache
+from discovery import configure_tesseract
+from engine import ENGINE_NAMES
+from export import EXPORT_FORMATS, export_document
+from pages import PAGE_SEPARATOR
+from pipeline import FALLBACK_MODES, TEXT_HEIGHT, OcrOptions, ocr_results
+from regions import format_regions, load_template, ocr_regions, page_results
+from timings import JobTrace
+
+# Traitement OCR sans interface : python main.py batch <dossier|motif> --lang fra+eng --workers N
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".pdf")
+
+
+def collect_inputs(sources, recursive=False):
+    # Un dossier est parcouru à la recherche d'images, sinon la source est traitée comme un motif glob
+    files = []
+    for source in sources:
+        if os.path.isdir(source):
+            pattern = os.path.join(source, "**", "*") if recursive else os.path.join(source, "*")
+            candidates = glob.glob(pattern, recursive=recursive)
+        else:
+            candidates = glob.glob(source, recursive=True)
+        files.extend(path for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    # Dédoublonner en conservant un ordre stable
+    return sorted(set(os.path.abspath(path) for path in files))
+
+
+_worker_cache = None
+
+
+def _init_worker(tesseract_cmd, cache_config):
+    global _worker_cache
+    # Un processus par cœur : éviter que Tesseract et OpenCV lancent eux-mêmes plusieurs threads
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    import cv2
+    cv2.setNumThreads(1)
+    if tesseract_cmd:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+    # Chaque processus ouvre sa propre connexion au cache partagé
+    if cache_config is not None:
+        _worker_cache = OcrCache(*cache_config)
+
+
+def _process(path, options, with_trace=False, export=None, regions=None):
+    # `export` : (format, fichier) pour écrire hOCR, ALTO ou PDF directement depuis le processus de travail
+    # `regions` : zones d'un modèle (liste de Region) à reconnaître au lieu des pages entières
+    start = time.monotonic()
+    trace = JobTrace(path)
+    fields = None
+    try:
+        if regions:
+            region_results = ocr_regions(path, regions, options, cache=_worker_cache, trace=trace)
+            fields = {region.name: result.text for region, result in region_results}
+            text = format_regions(region_results)
+            results = page_results(region_results)
+        else:
+            results = [result for _, _, result in ocr_results(path, options, cache=_worker_cache, trace=trace)]
+            text = PAGE_SEPARATOR.join(result.text for result in results)
+        if export is not None:
+            output_format, target = export
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            export_document(path, results, target, output_format)
+        error = None
+    except Exception as e:
+        text = ""
+        error = str(e)
+    result = {"path": path, "text": text, "error": error, "seconds": round(time.monotonic() - start, 3)}
+    if fields is not None:
+        result["regions"] = fields
+    if with_trace:
+        result["trace"] = trace.to_dict()
+    return result
+
+
+def _output_path(output_dir, base_dir, path, extension):
+    relative = os.path.relpath(path, base_dir) if base_dir else os.path.basename(path)
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + extension)
+
+
+def run_batch(files, options, output_dir, output_format="txt", workers=None, tesseract_cmd=None,
+              cache_config=(None, DEFAULT_MAX_BYTES), with_trace=False, log=print, regions=None):
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        base_dir = os.path.commonpath([os.path.dirname(path) for path in files])
+    except ValueError:
+        # Aucune racine commune (liste vide ou lecteurs différents sous Windows)
+        base_dir = None
+    workers = workers or os.cpu_count() or 1
+
+    summary = {"total": len(files), "succeeded": 0, "empty": 0, "failed": 0,
+               "workers": workers, "options": options.to_dict(), "failures": []}
+    if regions:
+        summary["regions"] = [region.to_dict() for region in regions]
+    start = time.monotonic()
+
+    jsonl = None
+    if output_format == "jsonl":
+        jsonl = open(os.path.join(output_dir, "results.jsonl"), "w", encoding="utf-8")
+    # En sortie texte, les traces vont dans un fichier à part
+    traces = None
+    if with_trace and output_format != "jsonl":
+        traces = open(os.path.join(output_dir, "traces.jsonl"), "w", encoding="utf-8")
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(tesseract_cmd, cache_config)) as executor:
+            # Les formats avec positions des mots sont écrits par les processus de travail
+            structured = output_format not in ("txt", "jsonl")
+
+            def submit(path):
+                export = (output_format, _output_path(output_dir, base_dir, path, EXPORT_FORMATS[output_format])) \
+                    if structured else None
+                return executor.submit(_process, path, options, with_trace, export, regions)
+
+            # Au plus deux fichiers par processus sont soumis : les résultats (texte, traces) ne
+            # s'accumulent pas en mémoire sur un grand lot, chacun est écrit puis oublié dès qu'il est prêt
+            remaining = iter(files)
+            running = {submit(path) for path in itertools.islice(remaining, 2 * workers)}
+            done = 0
+            while running:
+                finished, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    path = next(remaining, None)
+                    if path is not None:
+                        running.add(submit(path))
+                    result = future.result()
+                    done += 1
+                    if result["error"]:
+                        summary["failed"] += 1
+                        summary["failures"].append({"path": result["path"], "error": result["error"]})
+                    elif result["text"].strip():
+                        summary["succeeded"] += 1
+                    else:
+                        summary["empty"] += 1
+
+                    if jsonl is not None:
+                        jsonl.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    elif not result["error"] and not structured:
+                        target = _output_path(output_dir, base_dir, result["path"], ".txt")
+                        os.makedirs(os.path.dirname(target), exist_ok=True)
+                        with open(target, "w", encoding="utf-8") as f:
+                            f.write(result["text"])
+                    if traces is not None:
+                        traces.write(json.dumps(result["trace"], ensure_ascii=False) + "\n")
+
+                    log(f"[{done}/{len(files)}] {result['path']} ({result['seconds']} s)"
+                        + (f" - erreur: {result['error']}" if result["error"] else ""))
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+        if traces is not None:
+            traces.close()
+
+    summary["seconds"] = round(time.monotonic() - start, 3)
+    with open(os.path.join(output_dir, "summary.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def add_ocr_arguments(parser):
+    # Options de reconnaissance communes aux modes sans interface (batch, watch)
+    parser.add_argument("--lang", default="fra", help="Langue(s) Tesseract, ex: fra+eng, ou auto pour la détecter (défaut: fra)")
+    parser.add_argument("--no-preprocessing", action="store_true", help="Désactiver le prétraitement d'image")
+    parser.add_argument("--brightness", type=int, default=0, help="Luminosité (-50 à 50)")
+    parser.add_argument("--contrast", type=int, default=0, help="Contraste (-50 à 50)")
+    parser.add_argument("--block-size", type=int, default=11,
+                        help="Taille du voisinage du seuillage adaptatif, impaire (défaut: %(default)s)")
+    parser.add_argument("--threshold-c", type=int, default=2,
+                        help="Constante soustraite à la moyenne du voisinage (défaut: %(default)s)")
+    parser.add_argument("--auto-tune", action="store_true",
+                        help="Choisir luminosité, contraste et seuillage d'après un extrait de chaque document")
+    parser.add_argument("--engine", choices=ENGINE_NAMES, default="auto",
+                        help="Moteur Tesseract (défaut: auto, tesserocr si installé)")
+    parser.add_argument("--fallback", choices=FALLBACK_MODES, default="serial",
+                        help="Essais supplémentaires si rien n'est lu : l'un après l'autre ou en parallèle")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Découper les grandes images en blocs de texte reconnus en parallèle")
+    parser.add_argument("--tile-workers", type=int, default=0,
+                        help="Threads par image en mode découpé (défaut: nombre de cœurs)")
+    parser.add_argument("--text-height", type=int, default=TEXT_HEIGHT,
+                        help="Hauteur de texte visée en pixels avant l'OCR, 0 pour désactiver (défaut: %(default)s)")
+    parser.add_argument("--no-deskew", action="store_true",
+                        help="Ne pas redresser les pages tournées ou inclinées avant l'OCR")
+    parser.add_argument("--memory-limit", type=int, default=0,
+                        help="Mémoire maximale par page en Mo : pages lues par bandes, fichiers temporaires "
+                             "projetés au-delà (défaut: 0, sans limite)")
+    parser.add_argument("--no-cache", action="store_true", help="Ne pas utiliser le cache des résultats")
+    parser.add_argument("--cache-dir", default=None, help="Dossier du cache (défaut: cache utilisateur)")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="Taille maximale du cache en Mo (défaut: %(default)s)")
+    parser.add_argument("--regions", default=None,
+                        help="Modèle de zones (JSON enregistré depuis la fenêtre) : seules ces zones sont lues")
+    parser.add_argument("--tesseract-cmd", default=None, help="Chemin de l'exécutable Tesseract")
+
+
+def options_from_args(args):
+    use_preprocessing = not args.no_preprocessing
+    return OcrOptions(args.lang, use_preprocessing,
+                      args.brightness if use_preprocessing else 0,
+                      args.contrast if use_preprocessing else 0,
+                      args.engine, args.fallback, args.tiled, args.tile_workers, args.text_height,
+                      not args.no_deskew, args.memory_limit, args.block_size, args.threshold_c,
+                      use_preprocessing and args.auto_tune)
+
+
+def cache_config_from_args(args):
+    return None if args.no_cache else (args.cache_dir, args.cache_size * 1024 * 1024)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py batch", description="Extraction de texte en lot, sans interface")
+    parser.add_argument("sources", nargs="+", help="Dossiers ou motifs glob des images à traiter")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus (défaut: nombre de cœurs)")
+    parser.add_argument("--output", "-o", default="ocr_output", help="Dossier de sortie (défaut: ocr_output)")
+    parser.add_argument("--format", choices=("txt", "jsonl", "hocr", "alto", "pdf"), default="txt",
+                        help="Format des résultats : texte, JSON Lines, hOCR, ALTO XML ou PDF avec couche de texte")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Parcourir les sous-dossiers")
+    parser.add_argument("--trace", action="store_true",
+                        help="Enregistrer la durée de chaque étape (traces.jsonl, ou dans results.jsonl)")
+    add_ocr_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    files = collect_inputs(args.sources, args.recursive)
+    if not files:
+        print("Aucune image trouvée.", file=sys.stderr)
+        return 1
+
+    try:
+        regions = load_template(args.regions) if args.regions else None
+    except (OSError, ValueError) as e:
+        print(f"Modèle de zones inutilisable : {e}", file=sys.stderr)
+        return 1
+
+    summary = run_batch(files, options_from_args(args), args.output, args.format, args.workers,
+                        configure_tesseract(args.tesseract_cmd), cache_config_from_args(args), args.trace,
+                        regions=regions)
+
+    print(f"Terminé en {summary['seconds']} s : {summary['succeeded']} avec texte, "
+          f"{summary['empty']} sans texte, {summary['failed']} en erreur.")
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,346 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+
+from discovery import configure_tesseract
+from engine import ENGINE_NAMES, get_engine
+from pages import iter_pages
+from pipeline import FALLBACK_MODES, OcrOptions, correct_geometry, normalize_scale, preprocess, recognize
+
+# Banc d'essai reproductible : génère un corpus synthétique déterministe (texte connu), fait
+# tourner le pipeline avec plusieurs configurations et mesure latence par étape, débit, mémoire
+# maximale et taux d'erreur caractère (CER). python main.py bench --help
+
+CORPUS_VERSION = 1
+
+SENTENCES = {
+    "fra": ["Le chat dort paisiblement sur le rebord de la fenêtre.",
+            "Veuillez trouver ci-joint la facture du mois de février.",
+            "Les élèves étudient la géographie et l'histoire de leur région.",
+            "Ce contrat prend effet à la date de sa signature par les deux parties.",
+            "Il faut réserver une table pour quatre personnes à vingt heures."],
+    "eng": ["The quick brown fox jumps over the lazy dog.",
+            "Please find attached the invoice for the month of February.",
+            "Students study the geography and history of their region.",
+            "This agreement takes effect on the date of signature by both parties.",
+            "We need to book a table for four people at eight o'clock."],
+    "spa": ["El gato duerme tranquilamente junto a la ventana.",
+            "Adjuntamos la factura correspondiente al mes de febrero.",
+            "Los estudiantes aprenden la geografía y la historia de su región.",
+            "Este contrato entra en vigor en la fecha de su firma.",
+            "Hay que reservar una mesa para cuatro personas a las ocho."],
+    "deu": ["Die Katze schläft ruhig auf der Fensterbank.",
+            "Anbei erhalten Sie die Rechnung für den Monat Februar.",
+            "Die Schüler lernen die Geografie und Geschichte ihrer Region.",
+            "Dieser Vertrag tritt mit der Unterzeichnung beider Parteien in Kraft.",
+            "Wir müssen einen Tisch für vier Personen um acht Uhr reservieren."],
+    "ita": ["Il gatto dorme tranquillo sul davanzale della finestra.",
+            "In allegato troverete la fattura del mese di febbraio.",
+            "Gli studenti studiano la geografia e la storia della loro regione.",
+            "Questo contratto entra in vigore alla data della firma.",
+            "Bisogna prenotare un tavolo per quattro persone alle otto."],
+}
+
+FONT_SIZES = (14, 22, 34)
+NOISE_LEVELS = (0.0, 0.04, 0.12)
+ROTATIONS = (0.0, 1.5, -3.0)
+
+# Polices recherchées sur le système ; la police intégrée à Pillow sert toujours de référence
+FONT_CANDIDATES = (
+    "DejaVuSans.ttf", "DejaVuSerif.ttf", "LiberationSans-Regular.ttf", "LiberationSerif-Regular.ttf",
+    "arial.ttf", "times.ttf", "cour.ttf",
+)
+FONT_DIRS = ("/usr/share/fonts", "/usr/local/share/fonts", "/Library/Fonts", "/System/Library/Fonts",
+             os.path.join(os.environ.get("WINDIR", "C:\\Windows"), "Fonts"))
+
+
+def find_fonts():
+    found = {}
+    for directory in FONT_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name in FONT_CANDIDATES and name not in found:
+                    found[name] = os.path.join(root, name)
+    return ["default"] + [found[name] for name in FONT_CANDIDATES if name in found]
+
+
+def load_font(font, size):
+    if font == "default":
+        try:
+            return ImageFont.load_default(size)
+        except TypeError:
+            # Pillow < 10.1 : police bitmap de taille fixe
+            return ImageFont.load_default()
+    return ImageFont.truetype(font, size)
+
+
+def render_page(lines, font, size, noise, rotation, rng):
+    face = load_font(font, size)
+    line_height = int(size * 1.6)
+    width = max(int(face.getlength(line)) for line in lines) + 2 * size
+    height = line_height * len(lines) + 2 * size
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    for number, line in enumerate(lines):
+        draw.text((size, size + number * line_height), line, font=face, fill=0)
+    if rotation:
+        image = image.rotate(rotation, resample=Image.BICUBIC, expand=True, fillcolor=255)
+    if noise:
+        # Bruit gaussien + poivre et sel, flou léger pour imiter un scan
+        pixels = np.asarray(image, dtype=np.float32)
+        pixels += rng.normal(0, 255 * noise, pixels.shape)
+        speckles = rng.random(pixels.shape)
+        pixels[speckles < noise / 10] = 0
+        pixels[speckles > 1 - noise / 10] = 255
+        image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).filter(ImageFilter.GaussianBlur(0.6))
+    return image
+
+
+def generate_corpus(directory, seed=0, fonts=None, multipage_every=6):
+    # Corpus déterministe : mêmes paramètres et même graine -> mêmes images et même vérité terrain
+    os.makedirs(directory, exist_ok=True)
+    fonts = fonts or find_fonts()
+    choice = random.Random(seed)
+    rng = np.random.default_rng(seed)
+    samples = []
+    combos = [(lang, font, size, noise, rotation)
+              for lang in sorted(SENTENCES) for font in fonts for size in FONT_SIZES
+              for noise in NOISE_LEVELS for rotation in ROTATIONS]
+    for number, (lang, font, size, noise, rotation) in enumerate(combos):
+        page_total = 3 if number % multipage_every == multipage_every - 1 else 1
+        pages = []
+        truths = []
+        for _ in range(page_total):
+            lines = choice.sample(SENTENCES[lang], 3)
+            pages.append(render_page(lines, font, size, noise, rotation, rng))
+            truths.append("\n".join(lines))
+        name = f"{number:04d}_{lang}_{size}px_n{int(noise * 100):02d}_r{rotation:+.1f}"
+        if page_total > 1:
+            path = os.path.join(directory, name + ".tif")
+            pages[0].save(path, save_all=True, append_images=pages[1:], compression="tiff_lzw")
+        else:
+            path = os.path.join(directory, name + ".png")
+            pages[0].save(path)
+        samples.append({"file": os.path.basename(path), "lang": lang, "font": os.path.basename(font),
+                        "size": size, "noise": noise, "rotation": rotation, "pages": truths})
+    manifest = {"version": CORPUS_VERSION, "seed": seed, "samples": samples}
+    with open(os.path.join(directory, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def load_corpus(directory, seed=0):
+    path = os.path.join(directory, "manifest.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == CORPUS_VERSION and manifest.get("seed") == seed:
+            return manifest
+    return generate_corpus(directory, seed)
+
+
+def _normalize(text):
+    return " ".join(text.split())
+
+
+def edit_distance(a, b):
+    # Distance de Levenshtein, une ligne de la matrice à la fois
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def character_error_rate(reference, hypothesis):
+    reference, hypothesis = _normalize(reference), _normalize(hypothesis)
+    if not reference:
+        return 0.0 if not hypothesis else 1.0
+    return edit_distance(reference, hypothesis) / len(reference)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, "peak_wset", info.rss) / (1024 * 1024), 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Octets sous macOS, kilo-octets sous Linux
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+def _summary(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {"mean": round(statistics.fmean(values) * 1000, 2),
+            "p50": round(values[len(values) // 2] * 1000, 2),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))] * 1000, 2)}
+
+
+def _run_config(corpus_dir, samples, config, tesseract_cmd=None):
+    # Exécuté dans un processus neuf par configuration : la mémoire maximale mesurée lui est propre
+    configure_tesseract(tesseract_cmd)
+    options = OcrOptions(**config["options"])
+    stages = {"decode": [], "deskew": [], "scale": [], "preprocess": [], "recognize": []}
+    errors = []
+    characters = 0
+    pages_done = 0
+    started = time.perf_counter()
+    for sample in samples:
+        options.lang = sample["lang"]
+        path = os.path.join(corpus_dir, sample["file"])
+        pages = iter_pages(path)
+        while True:
+            start = time.perf_counter()
+            try:
+                index, _, image = next(pages)
+            except StopIteration:
+                break
+            image.load()
+            stages["decode"].append(time.perf_counter() - start)
+
+            if options.deskew:
+                start = time.perf_counter()
+                image, _ = correct_geometry(image, options)
+                stages["deskew"].append(time.perf_counter() - start)
+
+            if options.text_height:
+                start = time.perf_counter()
+                image = normalize_scale(image, options)
+                stages["scale"].append(time.perf_counter() - start)
+
+            processed = None
+            if options.use_preprocessing:
+                start = time.perf_counter()
+                processed = preprocess(image, options)
+                stages["preprocess"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            text = recognize(image, options, processed=processed).text
+            stages["recognize"].append(time.perf_counter() - start)
+
+            reference = sample["pages"][index]
+            characters += len(_normalize(reference))
+            errors.append(character_error_rate(reference, text) * len(_normalize(reference)))
+            pages_done += 1
+    elapsed = time.perf_counter() - started
+    engine = get_engine(options.engine)
+    return {
+        "name": config["name"],
+        "options": config["options"],
+        "engine": f"{engine.name} {engine.version()}",
+        "pages": pages_done,
+        "seconds": round(elapsed, 3),
+        "throughput_pages_per_s": round(pages_done / elapsed, 3) if elapsed else None,
+        "latency_ms": {stage: _summary(values) for stage, values in stages.items()},
+        "peak_rss_mb": peak_rss_mb(),
+        "cer": round(sum(errors) / characters, 4) if characters else None,
+    }
+
+
+def build_configs(engines, fallbacks, preprocessing):
+    configs = []
+    for engine in engines:
+        for fallback in fallbacks:
+            for use_preprocessing in preprocessing:
+                name = f"{engine}-{fallback}-{'preproc' if use_preprocessing else 'raw'}"
+                configs.append({"name": name, "options": {"engine": engine, "fallback": fallback,
+                                                          "use_preprocessing": use_preprocessing}})
+    return configs
+
+
+def compare(results, baseline, max_slowdown, max_cer_increase):
+    # Régressions par rapport à un précédent rapport : débit plus faible ou CER plus élevé
+    previous = {result["name"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        old = previous.get(result["name"])
+        if old is None:
+            continue
+        if old.get("throughput_pages_per_s") and result.get("throughput_pages_per_s"):
+            slowdown = 1 - result["throughput_pages_per_s"] / old["throughput_pages_per_s"]
+            if slowdown > max_slowdown:
+                regressions.append(f"{result['name']}: débit en baisse de {slowdown:.0%}")
+        if old.get("cer") is not None and result.get("cer") is not None:
+            if result["cer"] - old["cer"] > max_cer_increase:
+                regressions.append(f"{result['name']}: CER {old['cer']:.4f} -> {result['cer']:.4f}")
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py bench", description="Banc d'essai OCR sur un corpus synthétique")
+    parser.add_argument("--corpus", default="bench_corpus", help="Dossier du corpus (généré s'il manque)")
+    parser.add_argument("--seed", type=int, default=0, help="Graine du corpus (défaut: 0)")
+    parser.add_argument("--limit", type=int, default=None, help="Ne traiter que les N premiers échantillons")
+    parser.add_argument("--engines", default="auto", help=f"Moteurs séparés par des virgules parmi {', '.join(ENGINE_NAMES)}")
+    parser.add_argument("--fallbacks", default="serial", help=f"Stratégies parmi {', '.join(FALLBACK_MODES)}")
+    parser.add_argument("--preprocessing", choices=("on", "off", "both"), default="both")
+    parser.add_argument("--output", "-o", default=None, help="Fichier JSON du rapport (défaut: sortie standard)")
+    parser.add_argument("--baseline", default=None, help="Rapport précédent à comparer")
+    parser.add_argument("--max-slowdown", type=float, default=0.10, help="Baisse de débit tolérée (défaut: 0.10)")
+    parser.add_argument("--tesseract-cmd", default=None, help="Chemin de l'exécutable Tesseract")
+    parser.add_argument("--max-cer-increase", type=float, default=0.005, help="Hausse de CER tolérée (défaut: 0.005)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    manifest = load_corpus(args.corpus, args.seed)
+    samples = manifest["samples"][:args.limit] if args.limit else manifest["samples"]
+    preprocessing = {"on": (True,), "off": (False,), "both": (True, False)}[args.preprocessing]
+    configs = build_configs(args.engines.split(","), args.fallbacks.split(","), preprocessing)
+    tesseract_cmd = configure_tesseract(args.tesseract_cmd)
+
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for config in configs:
+        print(f"{config['name']} : {len(samples)} échantillons...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            results.append(executor.submit(_run_config, args.corpus, samples, config, tesseract_cmd).result())
+
+    report = {"corpus": {"seed": manifest["seed"], "version": manifest["version"], "samples": len(samples)},
+              "platform": {"python": platform.python_version(), "machine": platform.machine(),
+                           "system": platform.system(), "cpus": os.cpu_count()},
+              "results": results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_slowdown, args.max_cer_increase)
+        report["regressions"] = regressions
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+    for regression in regressions:
+        print(f"Régression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
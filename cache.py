@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+# Cache des résultats OCR adressé par contenu : clé = empreinte des octets de l'image + paramètres
+# qui influencent le résultat + version du moteur. Stockage SQLite compressé, plafonné en taille,
+# éviction des entrées les moins récemment utilisées. La taille totale est tenue à jour par des
+# déclencheurs dans une table à part, pour ne pas la recalculer à chaque écriture.
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# À incrémenter quand le pipeline change de manière à invalider les anciens résultats
+PIPELINE_VERSION = 3
+
+
+def default_cache_dir():
+    if os.environ.get("READY_CACHE_DIR"):
+        return os.environ["READY_CACHE_DIR"]
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "Ready", "cache")
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ready")
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(content_hash, params, engine_version):
+    payload = json.dumps({"image": content_hash, "params": params, "engine": engine_version,
+                          "pipeline": PIPELINE_VERSION}, sort_keys=True)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+
+class OcrCache:
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, "ocr-cache.sqlite3")
+        self._lock = threading.Lock()
+        # Une seule connexion partagée entre threads (protégée par le verrou) ; plusieurs processus
+        # batch peuvent ouvrir le même fichier, SQLite sérialise les écritures
+        self._db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+        with self._transaction():
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS entries_added AFTER INSERT ON entries BEGIN "
+                             "UPDATE meta SET value = value + NEW.size WHERE name = 'size'; END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS entries_removed AFTER DELETE ON entries BEGIN "
+                             "UPDATE meta SET value = value - OLD.size WHERE name = 'size'; END")
+            self._db.execute("CREATE TRIGGER IF NOT EXISTS entries_resized AFTER UPDATE OF size ON entries BEGIN "
+                             "UPDATE meta SET value = value + NEW.size - OLD.size WHERE name = 'size'; END")
+            # Cache créé par une version précédente : total calculé une fois
+            self._db.execute("INSERT OR IGNORE INTO meta (name, value) "
+                             "SELECT 'size', COALESCE(SUM(size), 0) FROM entries")
+
+    @contextmanager
+    def _transaction(self):
+        # Écritures groupées : plusieurs processus peuvent partager le fichier, le total doit
+        # rester cohérent avec les entrées
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def put(self, key, text):
+        value = zlib.compress(text.encode("utf-8"), 6)
+        with self._lock, self._transaction():
+            # Mise à jour sur place plutôt que REPLACE, dont la suppression ne déclenche pas entries_removed
+            self._db.execute("INSERT INTO entries (key, value, size, last_used) VALUES (?, ?, ?, ?) "
+                             "ON CONFLICT (key) DO UPDATE SET value = excluded.value, size = excluded.size, "
+                             "last_used = excluded.last_used",
+                             (key, value, len(value) + len(key), time.time()))
+            self._evict()
+
+    def size(self):
+        # Taille totale des entrées, en octets
+        with self._lock:
+            return self._total()
+
+    def _total(self):
+        return self._db.execute("SELECT value FROM meta WHERE name = 'size'").fetchone()[0]
+
+    def _evict(self):
+        total = self._total()
+        if total <= self.max_bytes:
+            return
+        # Supprimer les plus anciennes entrées jusqu'à redescendre sous 90 % du plafond
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used"):
+            stale.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        self._db.executemany("DELETE FROM entries WHERE key = ?", stale)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("VACUUM")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_default_cache():
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = OcrCache()
+        return _default_cache
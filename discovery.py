@@ -0,0 +1,129 @@
+import json
+import os
+import re
+import shutil
+import subprocess
+
+# Recherche de l'exécutable Tesseract au démarrage, sans dépendance lourde : variable
+# d'environnement, fichier de configuration, PATH, puis dossiers d'installation usuels sous
+# Windows. La version et les langues installées sont lues ensuite en lançant l'exécutable trouvé.
+
+# Chemin explicite de l'exécutable, prioritaire sur tout le reste
+TESSERACT_ENV = "TESSERACT_CMD"
+
+# Origine du chemin retenu, pour l'affichage
+SOURCE_LABELS = {
+    "env": f"variable {TESSERACT_ENV}",
+    "config": "fichier de configuration",
+    "path": "PATH",
+    "default": "dossier d'installation",
+}
+
+# Délai maximal de chaque appel à l'exécutable (secondes)
+PROBE_TIMEOUT = 10
+
+# Modèles qui ne sont pas des langues de texte
+NOT_LANGUAGES = ("osd", "equ")
+
+_VERSION = re.compile(r"tesseract\s+v?(\S+)", re.IGNORECASE)
+
+
+def default_config_path():
+    if os.environ.get("READY_CONFIG"):
+        return os.environ["READY_CONFIG"]
+    if os.name == "nt":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+        return os.path.join(base, "Ready", "config.json")
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(base, "ready", "config.json")
+
+
+def read_config(path=None):
+    # Réglages de l'utilisateur ({"tesseract_cmd": ...}) ; un fichier absent ou illisible est ignoré
+    try:
+        with open(path or default_config_path(), encoding="utf-8") as f:
+            config = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return config if isinstance(config, dict) else {}
+
+
+def _windows_paths():
+    paths = []
+    for variable in ("ProgramFiles", "ProgramFiles(x86)"):
+        if os.environ.get(variable):
+            paths.append(os.path.join(os.environ[variable], "Tesseract-OCR", "tesseract.exe"))
+    if os.environ.get("LOCALAPPDATA"):
+        paths.append(os.path.join(os.environ["LOCALAPPDATA"], "Programs", "Tesseract-OCR", "tesseract.exe"))
+    return paths
+
+
+def find_tesseract():
+    # (chemin de l'exécutable, origine parmi SOURCE_LABELS), ou (None, None) s'il est introuvable
+    candidates = [(os.environ.get(TESSERACT_ENV), "env"), (read_config().get("tesseract_cmd"), "config"),
+                  ("tesseract", "path")]
+    if os.name == "nt":
+        candidates += [(path, "default") for path in _windows_paths()]
+    for command, source in candidates:
+        path = shutil.which(command) if command else None
+        if path:
+            return path, source
+    return None, None
+
+
+def configure_tesseract(explicit=None):
+    # Modes sans interface : chemin de l'exécutable retenu avant la création des moteurs,
+    # `explicit` (--tesseract-cmd) en priorité, et transmis à pytesseract (moteurs pytesseract et
+    # cli). None si Tesseract est introuvable : pytesseract garde alors sa valeur par défaut
+    command = explicit or find_tesseract()[0]
+    if command:
+        import pytesseract
+        pytesseract.pytesseract.tesseract_cmd = command
+    return command
+
+
+def _run(command, *args):
+    kwargs = {}
+    if os.name == "nt":
+        kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+    result = subprocess.run([command, *args], capture_output=True, text=True, errors="replace",
+                            timeout=PROBE_TIMEOUT, **kwargs)
+    # Les anciennes versions écrivent sur la sortie d'erreur
+    return result.stdout or result.stderr
+
+
+def tesseract_version(command):
+    match = _VERSION.search(_run(command, "--version"))
+    return match.group(1) if match else None
+
+
+def text_languages(codes):
+    # Modèles de langues de texte parmi les modèles installés
+    return [code for code in codes if code not in NOT_LANGUAGES]
+
+
+def parse_languages(output):
+    # Sortie de « tesseract --list-langs » ; première ligne : « List of available languages in "..." (n): »
+    lines = output.splitlines()
+    return text_languages([line.strip() for line in lines[1:] if line.strip()])
+
+
+def installed_languages(command):
+    # Codes des langues installées (fra, eng...), sans les modèles d'orientation et d'équations
+    return parse_languages(_run(command, "--list-langs"))
+
+
+def probe_tesseract():
+    # Chemin, origine, version et langues installées, ou l'erreur rencontrée
+    info = {"command": None, "source": None, "version": None, "languages": [], "error": None}
+    command, source = find_tesseract()
+    if command is None:
+        info["error"] = "introuvable"
+        return info
+    info.update(command=command, source=source)
+    try:
+        info["version"] = tesseract_version(command)
+        info["languages"] = installed_languages(command)
+    except (OSError, subprocess.SubprocessError) as e:
+        info["error"] = str(e)
+    return info
@@ -0,0 +1,322 @@
+import os
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+from discovery import parse_languages, text_languages
+
+# Moteurs Tesseract interchangeables :
+#  - "tesserocr" : liaison en mémoire, les modèles restent chargés entre deux appels
+#  - "cli"       : un processus tesseract alimenté par stdin en PNM brut, sans fichier temporaire ni PNG
+#  - "pytesseract" : l'ancien chemin, conservé en secours
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+ENGINE_NAMES = ("auto", "tesserocr", "cli", "pytesseract")
+
+TSV_HEADER = "level\tpage_num\tblock_num\tpar_num\tline_num\tword_num\tleft\ttop\twidth\theight\tconf\ttext"
+
+
+class OcrCancelled(Exception):
+    pass
+
+
+def check_cancel(cancel):
+    if cancel is not None and cancel.is_set():
+        raise OcrCancelled()
+
+
+def _as_array(image):
+    # Accepte une image PIL ou un tableau numpy, renvoie un tableau uint8 en gris ou RGB
+    if isinstance(image, np.ndarray):
+        return image
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB" if image.mode in ("RGBA", "P", "CMYK", "LA") else "L")
+    return np.asarray(image)
+
+
+def _as_pil(image):
+    if isinstance(image, np.ndarray):
+        return Image.fromarray(image)
+    return image
+
+
+def encode_pnm(image):
+    # PGM/PPM binaire : un en-tête de quelques octets suivi des pixels, lisible par Leptonica sans décodage
+    array = np.ascontiguousarray(_as_array(image))
+    if array.dtype != np.uint8:
+        array = array.astype(np.uint8)
+    height, width = array.shape[:2]
+    magic = b"P5" if array.ndim == 2 else b"P6"
+    return b"%s\n%d %d\n255\n" % (magic, width, height) + array.tobytes()
+
+
+class TesseractEngine:
+    name = None
+    # Le moteur peut-il interrompre une reconnaissance en cours quand `cancel` est levé ? Sinon
+    # l'annulation n'est vérifiée qu'entre deux appels
+    cancellable = False
+
+    def version(self):
+        raise NotImplementedError
+
+    def languages(self):
+        # Codes des modèles de langues installés (fra, eng...), sans osd ni equ
+        raise NotImplementedError
+
+    def image_to_string(self, image, lang, psm=None, oem=None, cancel=None):
+        # Si `cancel` (threading.Event) est levé, le travail en cours est abandonné avec OcrCancelled
+        raise NotImplementedError
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        # Résultat mot à mot (boîtes et confiances) au format TSV de Tesseract, en-tête compris
+        raise NotImplementedError
+
+    def image_to_osd(self, image, cancel=None):
+        # Détection d'orientation (modèle osd), au format texte de Tesseract (« Rotate: 90 »...)
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(TesseractEngine):
+    name = "pytesseract"
+
+    def __init__(self):
+        self._version = None
+        self._languages = None
+
+    def version(self):
+        if self._version is None:
+            self._version = str(pytesseract.get_tesseract_version())
+        return self._version
+
+    def languages(self):
+        if self._languages is None:
+            self._languages = text_languages(pytesseract.get_languages(config=""))
+        return self._languages
+
+    def image_to_string(self, image, lang, psm=None, oem=None, cancel=None):
+        check_cancel(cancel)
+        return pytesseract.image_to_string(_as_pil(image), lang=lang, config=_cli_flags(psm, oem, as_string=True))
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        check_cancel(cancel)
+        return pytesseract.image_to_data(_as_pil(image), lang=lang, config=_cli_flags(psm, oem, as_string=True))
+
+    def image_to_osd(self, image, cancel=None):
+        check_cancel(cancel)
+        return pytesseract.image_to_osd(_as_pil(image))
+
+
+def _cli_flags(psm, oem, as_string=False):
+    flags = []
+    if psm is not None:
+        flags += ["--psm", str(psm)]
+    if oem is not None:
+        flags += ["--oem", str(oem)]
+    return " ".join(flags) if as_string else flags
+
+
+class CliEngine(TesseractEngine):
+    name = "cli"
+    # Le processus tesseract est tué dès que `cancel` est levé
+    cancellable = True
+
+    def __init__(self, tesseract_cmd=None):
+        self.tesseract_cmd = tesseract_cmd
+        self._version = None
+        self._languages = None
+
+    @property
+    def command(self):
+        # Suivre la configuration de pytesseract tant qu'aucun chemin explicite n'est donné
+        return self.tesseract_cmd or pytesseract.pytesseract.tesseract_cmd
+
+    def _run(self, args, data=None, cancel=None):
+        check_cancel(cancel)
+        kwargs = {}
+        if os.name == "nt":
+            kwargs["creationflags"] = subprocess.CREATE_NO_WINDOW
+        try:
+            proc = subprocess.Popen([self.command] + args, stdin=subprocess.PIPE if data is not None else None,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, **kwargs)
+        except FileNotFoundError:
+            raise pytesseract.TesseractNotFoundError()
+        with proc:
+            if cancel is None:
+                stdout, stderr = proc.communicate(data)
+            else:
+                # Vérifier régulièrement l'annulation et tuer tesseract immédiatement si besoin
+                pending = data
+                while True:
+                    try:
+                        stdout, stderr = proc.communicate(pending, timeout=0.05)
+                        break
+                    except subprocess.TimeoutExpired:
+                        pending = None
+                        if cancel.is_set():
+                            proc.kill()
+                            proc.communicate()
+                            raise OcrCancelled()
+        if proc.returncode != 0:
+            raise pytesseract.TesseractError(proc.returncode, stderr.decode("utf-8", "replace").strip())
+        return stdout.decode("utf-8", "replace")
+
+    def version(self):
+        if self._version is None:
+            self._version = self._run(["--version"]).splitlines()[0].split()[-1]
+        return self._version
+
+    def languages(self):
+        if self._languages is None:
+            self._languages = parse_languages(self._run(["--list-langs"]))
+        return self._languages
+
+    def image_to_string(self, image, lang, psm=None, oem=None, cancel=None):
+        return self._run(["stdin", "stdout", "-l", lang] + _cli_flags(psm, oem), encode_pnm(image), cancel)
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        return self._run(["stdin", "stdout", "-l", lang] + _cli_flags(psm, oem) + ["tsv"], encode_pnm(image), cancel)
+
+    def image_to_osd(self, image, cancel=None):
+        return self._run(["stdin", "stdout", "--psm", "0"], encode_pnm(image), cancel)
+
+
+class TesserocrEngine(TesseractEngine):
+    name = "tesserocr"
+
+    def __init__(self):
+        # Pool d'instances PyTessBaseAPI chaudes par (langue, oem) : l'API n'est pas thread-safe,
+        # chaque appel emprunte donc une instance libre et la rend ensuite. Les instances survivent
+        # aux threads (OcrThread en crée un par extraction), ce qui évite de recharger les .traineddata
+        self._idle = {}
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _acquire(self, lang, oem):
+        key = (lang, oem)
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if idle:
+                return key, idle.pop()
+        api = tesserocr.PyTessBaseAPI(lang=lang, oem=tesserocr.OEM(oem) if oem is not None else tesserocr.OEM.DEFAULT)
+        with self._lock:
+            self._all.append(api)
+        return key, api
+
+    def _release(self, key, api):
+        api.Clear()
+        with self._lock:
+            self._idle[key].append(api)
+
+    def version(self):
+        return tesserocr.tesseract_version().splitlines()[0].split()[-1]
+
+    def languages(self):
+        _, codes = tesserocr.get_languages()
+        return text_languages(codes)
+
+    def image_to_string(self, image, lang, psm=None, oem=None, cancel=None):
+        # La liaison ne permet pas d'interrompre une reconnaissance en cours : l'annulation
+        # est vérifiée avant de commencer (voir cancellable_engine pour les travaux annulables)
+        check_cancel(cancel)
+        key, api = self._acquire(lang, oem)
+        try:
+            api.SetPageSegMode(tesserocr.PSM(psm) if psm is not None else tesserocr.PSM.AUTO)
+            api.SetImage(_as_pil(image))
+            return api.GetUTF8Text()
+        finally:
+            self._release(key, api)
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        check_cancel(cancel)
+        key, api = self._acquire(lang, oem)
+        try:
+            api.SetPageSegMode(tesserocr.PSM(psm) if psm is not None else tesserocr.PSM.AUTO)
+            api.SetImage(_as_pil(image))
+            api.Recognize()
+            return TSV_HEADER + "\n" + api.GetTSVText(0)
+        finally:
+            self._release(key, api)
+
+    def image_to_osd(self, image, cancel=None):
+        check_cancel(cancel)
+        key, api = self._acquire("osd", None)
+        try:
+            api.SetPageSegMode(tesserocr.PSM.OSD_ONLY)
+            api.SetImage(_as_pil(image))
+            osd = api.DetectOrientationScript()
+        finally:
+            self._release(key, api)
+        if not osd:
+            return ""
+        # Selon la version de la liaison : dictionnaire ou tuple (degrés, confiance, écriture, confiance)
+        degrees, confidence = (osd["orient_deg"], osd["orient_conf"]) if isinstance(osd, dict) else osd[:2]
+        # Même convention que la sortie de tesseract --psm 0 : rotation horaire qui redresse la page
+        return f"Orientation in degrees: {degrees}\nRotate: {(360 - degrees) % 360}\nOrientation confidence: {confidence:.2f}\n"
+
+    def close(self):
+        with self._lock:
+            for api in self._all:
+                api.End()
+            self._all = []
+            self._idle = {}
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def _create(name):
+    if name == "tesserocr":
+        if tesserocr is None:
+            raise RuntimeError("Le moteur tesserocr n'est pas installé (pip install tesserocr).")
+        return TesserocrEngine()
+    if name == "cli":
+        return CliEngine()
+    if name == "pytesseract":
+        return PytesseractEngine()
+    raise ValueError(f"Moteur OCR inconnu: {name}")
+
+
+def resolve_engine_name(name="auto"):
+    if name != "auto":
+        return name
+    if tesserocr is not None:
+        return "tesserocr"
+    if shutil.which(pytesseract.pytesseract.tesseract_cmd):
+        return "cli"
+    return "pytesseract"
+
+
+def get_engine(name="auto"):
+    # Les moteurs sont partagés dans le processus pour garder les modèles chauds d'un appel à l'autre
+    name = resolve_engine_name(name)
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            engine = _engines[name] = _create(name)
+    return engine
+
+
+def cancellable_engine(engine):
+    # Moteur à utiliser pour un travail qui doit pouvoir être interrompu (candidats spéculatifs,
+    # tâches annulables) : `engine` s'il sait s'arrêter en cours de route, sinon le moteur en ligne
+    # de commande quand l'exécutable tesseract est accessible, à défaut `engine` lui-même
+    if engine.cancellable or not shutil.which(pytesseract.pytesseract.tesseract_cmd):
+        return engine
+    return get_engine("cli")
+
+
+def cancellable_engine_name(name="auto"):
+    # Nom du moteur (OcrOptions.engine) à utiliser pour un travail annulable
+    return cancellable_engine(get_engine(name)).name
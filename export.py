@@ -0,0 +1,255 @@
+import io
+import os
+from xml.sax.saxutils import escape, quoteattr
+
+from pages import PDF_DPI, PAGE_SEPARATOR, iter_pages
+
+# Export des résultats structurés (PageResult) : texte, hOCR, ALTO XML et PDF avec couche de texte
+# invisible sous l'image de la page. Chaque format est écrit page par page dans un flux ouvert :
+# un document de plusieurs centaines de pages n'est jamais assemblé en mémoire.
+
+EXPORT_FORMATS = {
+    "txt": ".txt",
+    "hocr": ".hocr",
+    "alto": ".xml",
+    "pdf": ".pdf",
+}
+
+
+# Résolutions acceptées telles quelles pour dimensionner les pages PDF
+MIN_DPI = 50
+MAX_DPI = 2400
+
+
+def _bbox(box):
+    return "bbox {} {} {} {}".format(*box)
+
+
+class TextWriter:
+    def __init__(self, f):
+        self.f = f
+        self.pages = 0
+
+    def add_page(self, result, image=None):
+        if self.pages:
+            self.f.write(PAGE_SEPARATOR)
+        self.f.write(result.text)
+        self.pages += 1
+
+    def close(self):
+        pass
+
+
+class HocrWriter:
+    def __init__(self, f, source=""):
+        self.f = f
+        self.source = source
+        self.pages = 0
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" '
+                '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml">\n <head>\n'
+                f'  <title>{escape(os.path.basename(source))}</title>\n'
+                '  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>\n'
+                '  <meta name="ocr-system" content="Ready (Tesseract)"/>\n'
+                '  <meta name="ocr-capabilities" content="ocr_page ocr_carea ocr_par ocr_line ocrx_word"/>\n'
+                ' </head>\n <body>\n')
+
+    def add_page(self, result, image=None):
+        page = self.pages = self.pages + 1
+        title = f'image "{os.path.basename(self.source)}"; {_bbox((0, 0, result.width, result.height))}; ppageno {page - 1}'
+        write = self.f.write
+        write(f'  <div class="ocr_page" id="page_{page}" title={quoteattr(title)}>\n')
+        for block, paragraphs in result.layout():
+            indices = [index for _, lines in paragraphs for _, words in lines for index in words]
+            write(f'   <div class="ocr_carea" id="block_{page}_{block}" title="{_bbox(result.bbox(indices))}">\n')
+            for par, lines in paragraphs:
+                indices = [index for _, words in lines for index in words]
+                write(f'    <p class="ocr_par" id="par_{page}_{block}_{par}" title="{_bbox(result.bbox(indices))}">\n')
+                for line, words in lines:
+                    write(f'     <span class="ocr_line" id="line_{page}_{block}_{par}_{line}" '
+                          f'title="{_bbox(result.bbox(words))}">')
+                    for index in words:
+                        left, top, width, height = result.boxes[index].tolist()
+                        write(f'<span class="ocrx_word" id="word_{page}_{index + 1}" '
+                              f'title="{_bbox((left, top, left + width, top + height))}; '
+                              f'x_wconf {max(0, round(float(result.conf[index])))}">{escape(result.word(index))}</span> ')
+                    write('</span>\n')
+                write('    </p>\n')
+            write('   </div>\n')
+        write('  </div>\n')
+
+    def close(self):
+        self.f.write(' </body>\n</html>\n')
+
+
+class AltoWriter:
+    # ALTO v4 ; un TextBlock par paragraphe de Tesseract
+    def __init__(self, f, source=""):
+        self.f = f
+        self.pages = 0
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<alto xmlns="http://www.loc.gov/standards/alto/ns-v4#" '
+                'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:schemaLocation="http://www.loc.gov/standards/alto/ns-v4# '
+                'http://www.loc.gov/alto/v4/alto-4-2.xsd">\n'
+                ' <Description>\n  <MeasurementUnit>pixel</MeasurementUnit>\n'
+                f'  <sourceImageInformation><fileName>{escape(os.path.basename(source))}</fileName>'
+                '</sourceImageInformation>\n'
+                '  <OCRProcessing ID="OCR_0"><ocrProcessingStep><processingSoftware>'
+                '<softwareName>Ready (Tesseract)</softwareName></processingSoftware></ocrProcessingStep>'
+                '</OCRProcessing>\n </Description>\n <Layout>\n')
+
+    def add_page(self, result, image=None):
+        page = self.pages = self.pages + 1
+        write = self.f.write
+        write(f'  <Page ID="page_{page}" PHYSICAL_IMG_NR="{page}" WIDTH="{result.width}" HEIGHT="{result.height}">\n'
+              f'   <PrintSpace HPOS="0" VPOS="0" WIDTH="{result.width}" HEIGHT="{result.height}">\n')
+        for block, paragraphs in result.layout():
+            for par, lines in paragraphs:
+                indices = [index for _, words in lines for index in words]
+                write(f'    <TextBlock ID="block_{page}_{block}_{par}" {self._position(result.bbox(indices))}>\n')
+                for line, words in lines:
+                    write(f'     <TextLine ID="line_{page}_{block}_{par}_{line}" {self._position(result.bbox(words))}>\n')
+                    for position, index in enumerate(words):
+                        if position:
+                            write('      <SP/>\n')
+                        left, top, width, height = result.boxes[index].tolist()
+                        confidence = max(0.0, float(result.conf[index])) / 100
+                        write(f'      <String ID="word_{page}_{index + 1}" HPOS="{left}" VPOS="{top}" '
+                              f'WIDTH="{width}" HEIGHT="{height}" WC="{confidence:.2f}" '
+                              f'CONTENT={quoteattr(result.word(index))}/>\n')
+                    write('     </TextLine>\n')
+                write('    </TextBlock>\n')
+        write('   </PrintSpace>\n  </Page>\n')
+
+    @staticmethod
+    def _position(box):
+        x0, y0, x1, y1 = box
+        return f'HPOS="{x0}" VPOS="{y0}" WIDTH="{x1 - x0}" HEIGHT="{y1 - y0}"'
+
+    def close(self):
+        self.f.write(' </Layout>\n</alto>\n')
+
+
+def _pdf_string(text):
+    # Chaîne PDF en WinAnsi (police standard Helvetica) ; les caractères hors de ce jeu sont remplacés
+    data = text.encode("cp1252", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class PdfWriter:
+    # PDF « cherchable » : l'image de chaque page (JPEG) recouverte du texte reconnu en mode
+    # invisible (3 Tr), chaque mot étiré sur sa boîte pour que la sélection suive l'image.
+    # Les objets sont écrits au fil de l'eau ; seuls leurs décalages sont gardés pour la table finale
+
+    # Largeur moyenne d'un caractère Helvetica, en fraction de la taille de police
+    CHAR_WIDTH = 0.5
+
+    def __init__(self, f, dpi=PDF_DPI, quality=80):
+        self.f = f
+        self.dpi = dpi
+        self.quality = quality
+        self.position = 0
+        self.offsets = {}
+        self.kids = []
+        # 1 : catalogue et 2 : arbre des pages, écrits à la fin ; 3 : police commune
+        self.next_id = 4
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    def _write(self, data):
+        self.f.write(data)
+        self.position += len(data)
+
+    def _new_id(self):
+        self.next_id += 1
+        return self.next_id - 1
+
+    def _object(self, number, body, stream=None):
+        self.offsets[number] = self.position
+        self._write(b"%d 0 obj\n" % number + body)
+        if stream is not None:
+            self._write(b"\nstream\n" + stream + b"\nendstream")
+        self._write(b"\nendobj\n")
+
+    def add_page(self, result, image):
+        # Une résolution absente ou invraisemblable (TIFF sans unité : 1 dpi) est remplacée par défaut
+        dpi = float(image.info.get("dpi", (self.dpi, self.dpi))[0] or 0)
+        if not MIN_DPI <= dpi <= MAX_DPI:
+            dpi = self.dpi
+        scale = 72.0 / dpi
+        page_width, page_height = image.width * scale, image.height * scale
+
+        if image.mode not in ("L", "RGB"):
+            image = image.convert("L" if image.mode in ("1", "LA", "I;16", "I", "F") else "RGB")
+        jpeg = io.BytesIO()
+        image.save(jpeg, "JPEG", quality=self.quality)
+        image_id = self._new_id()
+        colorspace = b"/DeviceGray" if image.mode == "L" else b"/DeviceRGB"
+        self._object(image_id, b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                               b"/BitsPerComponent 8 /Filter /DCTDecode /Length %d >>"
+                     % (image.width, image.height, colorspace, jpeg.tell()), jpeg.getvalue())
+
+        # Les boîtes des mots sont exprimées dans les pixels de l'image source
+        factor_x = page_width / result.width if result.width else scale
+        factor_y = page_height / result.height if result.height else scale
+        content = [b"q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q" % (page_width, page_height), b"BT 3 Tr"]
+        for index in range(len(result)):
+            left, top, width, height = result.boxes[index].tolist()
+            word = result.word(index)
+            size = max(1.0, height * factor_y)
+            stretch = 100.0 * width * factor_x / (size * self.CHAR_WIDTH * len(word))
+            content.append(b"/F1 %.2f Tf %.2f Tz 1 0 0 1 %.2f %.2f Tm %s Tj"
+                           % (size, stretch, left * factor_x, page_height - (top + height) * factor_y,
+                              _pdf_string(word)))
+        content.append(b"ET")
+        stream = b"\n".join(content)
+        content_id = self._new_id()
+        self._object(content_id, b"<< /Length %d >>" % len(stream), stream)
+
+        page_id = self._new_id()
+        self._object(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+                              b"/Resources << /Font << /F1 3 0 R >> /XObject << /Im0 %d 0 R >> >> "
+                              b"/Contents %d 0 R >>" % (page_width, page_height, image_id, content_id))
+        self.kids.append(page_id)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % kid for kid in self.kids)
+        self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.kids)))
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.position
+        count = self.next_id
+        rows = [b"xref\n0 %d\n" % count, b"0000000000 65535 f \n"]
+        rows += [b"%010d 00000 n \n" % self.offsets[number] for number in range(1, count)]
+        self._write(b"".join(rows))
+        self._write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (count, xref))
+
+
+def open_writer(f, output_format, source=""):
+    if output_format == "txt":
+        return TextWriter(f)
+    if output_format == "hocr":
+        return HocrWriter(f, source)
+    if output_format == "alto":
+        return AltoWriter(f, source)
+    if output_format == "pdf":
+        return PdfWriter(f)
+    raise ValueError(f"Format d'export inconnu: {output_format}")
+
+
+def export_document(source, results, target, output_format):
+    # Écrit les résultats (un PageResult par page, dans l'ordre) du document `source` vers `target`.
+    # Le PDF relit les pages du document une à une pour les placer sous le texte
+    if output_format == "pdf":
+        with open(target, "wb") as f:
+            writer = PdfWriter(f)
+            for (_, _, image), result in zip(iter_pages(source), results):
+                writer.add_page(result, image)
+            writer.close()
+        return
+    with open(target, "w", encoding="utf-8") as f:
+        writer = open_writer(f, output_format, source)
+        for result in results:
+            writer.add_page(result)
+        writer.close()
@@ -0,0 +1,264 @@
+import re
+
+import cv2
+import numpy as np
+
+from engine import OcrCancelled
+
+# Redressement des pages avant la reconnaissance : orientation par quart de tour (page tournée
+# de 90, 180 ou 270°) et inclinaison (scan ou photo de travers). Les deux sont estimées sur une
+# vignette binarisée, puis la page pleine résolution est tournée une seule fois. Une page droite
+# n'est ni décodée ni rééchantillonnée ici.
+
+# Dimension maximale de la vignette d'analyse
+GEOMETRY_MAX_SIDE = 1000
+
+# Inclinaison recherchée entre -MAX_SKEW et +MAX_SKEW degrés : d'abord par pas de SKEW_STEP,
+# puis affinée par pas de SKEW_FINE_STEP autour du meilleur angle
+MAX_SKEW = 20.0
+SKEW_STEP = 0.5
+SKEW_FINE_STEP = 0.05
+
+# En dessous de cette inclinaison (degrés), tourner la page coûte plus que ce qu'on y gagne
+MIN_SKEW = 0.3
+
+# Nombre maximal de pixels d'encre projetés par angle candidat
+MAX_POINTS = 20_000
+
+# En dessous de ce nombre de pixels d'encre dans la vignette, la page est laissée telle quelle
+MIN_POINTS = 500
+
+# Le texte est jugé vertical quand au moins cette part des caractères ont leur plus proche voisin
+# au-dessus ou au-dessous plutôt qu'à côté, horizontal quand au plus HORIZONTAL_SHARE l'ont ; entre
+# les deux, la direction reste douteuse et la page n'est pas tournée
+VERTICAL_SHARE = 0.6
+HORIZONTAL_SHARE = 0.4
+
+# Nombre minimal de caractères pour juger de l'orientation ; au-delà de MAX_COMPONENTS, seul un
+# échantillon cherche son plus proche voisin (parmi tous les caractères)
+MIN_COMPONENTS = 20
+MAX_COMPONENTS = 1500
+
+# Page jugée à l'endroit quand l'encre au-dessus de la bande des minuscules (majuscules, chiffres,
+# b d f h k l t) dépasse celle du dessous d'au moins ce facteur. Le cas inverse n'est qu'un indice :
+# certaines polices et certains textes ont plus de jambages que de hampes, et retourner une page
+# droite la rend illisible. L'indice est confirmé par l'OSD de Tesseract ; sans elle, la page
+# n'est retournée qu'au-delà de UPSIDE_DOWN_ALONE_RATIO
+UPSIDE_DOWN_RATIO = 1.6
+UPSIDE_DOWN_ALONE_RATIO = 4.0
+
+# Nombre minimal de lignes de texte pour juger du sens de lecture
+MIN_LINES = 3
+
+# Quand le sens de lecture reste douteux, la détection d'orientation de Tesseract (OSD) est
+# consultée sur une vignette de cette dimension ; son avis compte au-delà de cette confiance
+OSD_MAX_SIDE = 2000
+OSD_MIN_CONFIDENCE = 2.0
+
+_ROTATE = re.compile(r"Rotate:\s*(\d+)")
+_CONFIDENCE = re.compile(r"Orientation confidence:\s*([\d.]+)")
+
+
+def _thumbnail(gray, max_side):
+    height, width = gray.shape
+    scale = min(1.0, max_side / max(height, width))
+    if scale < 1.0:
+        gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def binary_thumbnail(gray):
+    # Vignette binaire : 1 pour l'encre, 0 pour le fond
+    gray = _thumbnail(gray, GEOMETRY_MAX_SIDE)
+    _, binary = cv2.threshold(gray, 0, 1, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    return binary
+
+
+def _profile_scores(ys, xs, angles):
+    # Netteté du profil de projection pour chaque angle (degrés), tous les angles d'un coup :
+    # chaque point d'encre est projeté sur l'axe perpendiculaire aux lignes supposées
+    radians = np.deg2rad(angles)
+    rows = np.rint(ys[None, :] * np.cos(radians)[:, None] - xs[None, :] * np.sin(radians)[:, None]).astype(np.int64)
+    rows -= rows.min()
+    bins = int(rows.max()) + 1
+    rows += np.arange(len(angles), dtype=np.int64)[:, None] * bins
+    profiles = np.bincount(rows.ravel(), minlength=bins * len(angles)).reshape(len(angles), bins)
+    return np.square(np.diff(profiles, axis=1)).sum(axis=1)
+
+
+def estimate_skew(binary):
+    # Inclinaison des lignes de texte en degrés (positive : lignes qui descendent vers la droite)
+    ys, xs = np.nonzero(binary)
+    if len(ys) < MIN_POINTS:
+        return 0.0
+    step = max(1, len(ys) // MAX_POINTS)
+    # Centre entier : des coordonnées demi-entières, arrondies au pair, donneraient un profil
+    # en peigne à 0° qui l'emporterait sur tous les autres angles
+    ys = ys[::step].astype(np.float64) - binary.shape[0] // 2
+    xs = xs[::step].astype(np.float64) - binary.shape[1] // 2
+    angles = np.arange(-MAX_SKEW, MAX_SKEW + SKEW_STEP / 2, SKEW_STEP)
+    coarse = float(angles[np.argmax(_profile_scores(ys, xs, angles))])
+    angles = np.arange(coarse - SKEW_STEP, coarse + SKEW_STEP + SKEW_FINE_STEP / 2, SKEW_FINE_STEP)
+    return float(angles[np.argmax(_profile_scores(ys, xs, angles))])
+
+
+def _ascender_balance(binary):
+    # (encre au-dessus, encre au-dessous) de la bande des minuscules, sommée sur les lignes de
+    # texte, et nombre de lignes. Dans l'alphabet latin, les hampes montantes et les majuscules
+    # l'emportent nettement sur les jambages descendants
+    rows = binary.sum(axis=1)
+    # Quelques points de bruit ne suffisent pas à relier deux lignes
+    text_rows = np.concatenate(([False], rows > rows.max() * 0.02, [False]))
+    starts = np.flatnonzero(~text_rows[:-1] & text_rows[1:])
+    ends = np.flatnonzero(text_rows[:-1] & ~text_rows[1:])
+    heights = ends - starts
+    if not len(heights):
+        return 0, 0, 0
+    # Les bandes minces (accents, points, bruit) ne sont pas des lignes de texte
+    min_height = max(4, np.median(heights[heights >= 4]) * 0.6 if (heights >= 4).any() else 4)
+    above = below = 0
+    lines = 0
+    for start, end in zip(starts, ends):
+        line = rows[start:end]
+        if end - start < min_height:
+            continue
+        core = np.flatnonzero(line >= line.max() * 0.5)
+        above += int(line[:core[0]].sum())
+        below += int(line[core[-1] + 1:].sum())
+        lines += 1
+    return above, below, lines
+
+
+def text_is_vertical(binary):
+    # Dans une ligne de texte, le plus proche voisin d'un caractère est la lettre suivante : on
+    # compte la part des caractères dont le plus proche voisin est au-dessus ou au-dessous.
+    # Renvoie None quand la page a trop peu de caractères pour en juger, ou quand la part est douteuse
+    _, _, stats, centroids = cv2.connectedComponentsWithStats(binary, connectivity=8)
+    stats, centroids = stats[1:], centroids[1:]
+    height, width = binary.shape
+    # Ni bruit, ni filets, ni illustrations
+    keep = ((stats[:, cv2.CC_STAT_AREA] >= 4) & (stats[:, cv2.CC_STAT_HEIGHT] <= height // 4)
+            & (stats[:, cv2.CC_STAT_WIDTH] <= width // 4))
+    points = centroids[keep]
+    if len(points) < MIN_COMPONENTS:
+        return None
+    queries = np.arange(0, len(points), max(1, len(points) // MAX_COMPONENTS))
+    vertical = 0
+    # Par paquets, pour borner la matrice des distances
+    for start in range(0, len(queries), 200):
+        chunk = queries[start:start + 200]
+        deltas = points[None, :, :] - points[chunk, None, :]
+        distances = np.square(deltas).sum(axis=2)
+        distances[np.arange(len(chunk)), chunk] = np.inf
+        nearest = deltas[np.arange(len(chunk)), distances.argmin(axis=1)]
+        vertical += int((np.abs(nearest[:, 1]) > np.abs(nearest[:, 0])).sum())
+    share = vertical / len(queries)
+    if share >= VERTICAL_SHARE:
+        return True
+    if share <= HORIZONTAL_SHARE:
+        return False
+    return None
+
+
+def upside_down(binary, ratio=UPSIDE_DOWN_RATIO):
+    # La page (lignes horizontales) est-elle à l'envers ? None si le jugement n'est pas sûr
+    above, below, lines = _ascender_balance(binary)
+    if lines < MIN_LINES:
+        return None
+    if below > above * ratio:
+        return True
+    if above > below * ratio:
+        return False
+    return None
+
+
+def deskewed_binary(binary, skew):
+    if not skew:
+        return binary
+    height, width = binary.shape
+    matrix, size = rotation_matrix(width, height, 0, skew)
+    return cv2.warpAffine(binary, matrix, size, flags=cv2.INTER_NEAREST)
+
+
+def parse_osd(text):
+    # Sortie de Tesseract en mode OSD (--psm 0) : (rotation horaire, confiance), ou None
+    rotate = _ROTATE.search(text)
+    confidence = _CONFIDENCE.search(text)
+    if rotate is None or confidence is None:
+        return None
+    return int(rotate.group(1)) % 360, float(confidence.group(1))
+
+
+def _osd_rotation(engine, gray, cancel=None):
+    # Avis de Tesseract (rotation horaire), ou None s'il est indisponible (modèle osd absent,
+    # trop peu de texte) ou peu sûr
+    try:
+        osd = parse_osd(engine.image_to_osd(_thumbnail(gray, OSD_MAX_SIDE), cancel))
+    except OcrCancelled:
+        raise
+    except Exception:
+        return None
+    if osd is None or osd[1] < OSD_MIN_CONFIDENCE:
+        return None
+    return osd[0]
+
+
+def detect_geometry(gray, engine=None, cancel=None):
+    # (rotation horaire par quart de tour, inclinaison en degrés, origine de l'orientation) d'une
+    # page en niveaux de gris. Une page nettement à l'endroit d'après la vignette l'est
+    # (« heuristic ») ; un retournement possible ou un sens douteux est tranché par Tesseract
+    # (« osd »). Sans son avis, une page n'est retournée que si la vignette ne laisse aucun doute ;
+    # une page douteuse est laissée à l'endroit
+    binary = binary_thumbnail(gray)
+    vertical = text_is_vertical(binary)
+    if vertical is None:
+        return 0, 0.0, None
+    rotation = 90 if vertical else 0
+    binary = rotated_binary(binary, rotation)
+    skew = estimate_skew(binary)
+    binary = deskewed_binary(binary, skew)
+    if upside_down(binary) is False:
+        return rotation, skew, "heuristic"
+    if engine is not None:
+        osd = _osd_rotation(engine, gray, cancel)
+        # L'OSD ne sert qu'à trancher le sens : la direction des lignes est déjà connue
+        if osd is not None and osd % 180 == rotation:
+            return osd, skew, "osd"
+    if upside_down(binary, UPSIDE_DOWN_ALONE_RATIO):
+        return (rotation + 180) % 360, skew, "heuristic"
+    return rotation, skew, None
+
+
+def rotated_binary(binary, rotation):
+    return np.rot90(binary, -(rotation // 90)) if rotation else binary
+
+
+def rotation_matrix(width, height, rotation, skew):
+    # Matrice affine (2x3) qui tourne une image de `width` x `height` d'un quart de tour `rotation`
+    # (sens horaire) puis redresse une inclinaison `skew`, et taille de l'image obtenue (toile agrandie)
+    angle = skew - rotation
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    cos, sin = abs(matrix[0, 0]), abs(matrix[0, 1])
+    out_width = int(round(height * sin + width * cos))
+    out_height = int(round(height * cos + width * sin))
+    matrix[0, 2] += out_width / 2 - width / 2
+    matrix[1, 2] += out_height / 2 - height / 2
+    return matrix, (out_width, out_height)
+
+
+def rotate_image(image, rotation, skew, allocate=None):
+    # Rotation pleine résolution en une seule opération ; les quarts de tour seuls sont exacts.
+    # `allocate(shape)` fournit le tableau de sortie (mode mémoire bornée).
+    # Renvoie l'image et la matrice qui ramène ses coordonnées à celles de l'image d'origine
+    height, width = image.shape[:2]
+    matrix, size = rotation_matrix(width, height, rotation, skew)
+    out = allocate((size[1], size[0]) + image.shape[2:]) if allocate is not None else None
+    if skew == 0.0:
+        codes = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}
+        rotated = cv2.rotate(image, codes[rotation], dst=out)
+    else:
+        white = 255 if image.ndim == 2 else (255,) * image.shape[2]
+        rotated = cv2.warpAffine(image, matrix, size, dst=out, flags=cv2.INTER_LINEAR,
+                                 borderMode=cv2.BORDER_CONSTANT, borderValue=white)
+    return rotated, cv2.invertAffineTransform(matrix)
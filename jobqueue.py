@@ -0,0 +1,272 @@
+import os
+import threading
+from dataclasses import replace
+
+from PyQt5.QtCore import QObject, QRunnable, QThread, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtWidgets import (QAbstractItemView, QFileDialog, QGroupBox, QHBoxLayout, QListWidget,
+                             QListWidgetItem, QPushButton, QVBoxLayout)
+
+from timings import JobTrace
+
+# File d'attente de l'interface : plusieurs images traitées en même temps (autant que de cœurs),
+# réordonnables par glisser-déposer tant qu'elles attendent et annulables une par une.
+# Annuler un travail en cours tue le processus tesseract qui le traite : les travaux passent par
+# un moteur interruptible (voir engine.cancellable_engine).
+# Les modules de traitement ne sont importés qu'au premier travail, pour ne pas retarder
+# l'ouverture de la fenêtre.
+
+PENDING, RUNNING, DONE, CANCELLED, FAILED = "pending", "running", "done", "cancelled", "failed"
+
+STATUS_LABELS = {
+    PENDING: "En attente",
+    RUNNING: "En cours",
+    DONE: "Terminé",
+    CANCELLED: "Annulé",
+    FAILED: "Erreur",
+}
+
+FINISHED = (DONE, CANCELLED, FAILED)
+
+
+class Job:
+    def __init__(self, path, options, regions=None):
+        self.path = path
+        self.options = options
+        # Zones du modèle courant au moment de l'ajout ; vide : page entière
+        self.regions = regions
+        self.status = PENDING
+        self.progress = 0
+        self.text = ""
+        # Un PageResult par page, pour les enregistrements avec positions des mots
+        self.results = []
+        self.trace = JobTrace(path)
+        self.cancel = threading.Event()
+
+
+class JobSignals(QObject):
+    # Les QRunnable ne sont pas des QObject : leurs signaux passent par cet objet
+    progress = pyqtSignal(object, int)
+    finished = pyqtSignal(object)
+
+
+class JobRunner(QRunnable):
+    def __init__(self, job, signals):
+        super().__init__()
+        self.job = job
+        self.signals = signals
+
+    def run(self):
+        from cache import get_default_cache
+        from engine import OcrCancelled, cancellable_engine_name
+        from pages import format_page
+        from pipeline import NO_TEXT_MESSAGE, ocr_results
+        job = self.job
+        try:
+            options = replace(job.options, engine=cancellable_engine_name(job.options.engine))
+            if job.regions:
+                self.run_regions(options)
+                return
+            pages = []
+            found = False
+            for index, count, result in ocr_results(job.path, options,
+                                                    lambda value: self.signals.progress.emit(job, value),
+                                                    get_default_cache(), trace=job.trace, cancel=job.cancel):
+                found = found or bool(result.text.strip())
+                job.results.append(result)
+                pages.append(format_page(index, count, result.text))
+            job.text = "\n".join(pages) if found else NO_TEXT_MESSAGE
+            job.status = DONE
+        except OcrCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.text = f"Erreur lors de l'extraction de texte: {str(e)}"
+            job.status = FAILED
+        self.signals.finished.emit(job)
+
+    def run_regions(self, options):
+        from cache import get_default_cache
+        from engine import OcrCancelled
+        from pipeline import NO_TEXT_MESSAGE
+        from regions import format_regions, ocr_regions, page_results
+        job = self.job
+        try:
+            region_results = ocr_regions(job.path, job.regions, options,
+                                         lambda value: self.signals.progress.emit(job, value),
+                                         get_default_cache(), trace=job.trace, cancel=job.cancel)
+            job.results = page_results(region_results)
+            text = format_regions(region_results)
+            job.text = text if text.strip() else NO_TEXT_MESSAGE
+            job.status = DONE
+        except OcrCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.text = f"Erreur lors de l'extraction de texte: {str(e)}"
+            job.status = FAILED
+        self.signals.finished.emit(job)
+
+
+class JobList(QListWidget):
+    # Liste réordonnable qui accepte aussi les fichiers et dossiers déposés depuis l'explorateur
+    files_dropped = pyqtSignal(list)
+
+    def __init__(self):
+        super().__init__()
+        self.setDragDropMode(QAbstractItemView.InternalMove)
+        self.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.setAcceptDrops(True)
+
+    def dragEnterEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragEnterEvent(event)
+
+    def dragMoveEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+        else:
+            super().dragMoveEvent(event)
+
+    def dropEvent(self, event):
+        if event.mimeData().hasUrls():
+            event.acceptProposedAction()
+            self.files_dropped.emit([url.toLocalFile() for url in event.mimeData().urls() if url.isLocalFile()])
+        else:
+            super().dropEvent(event)
+
+
+class JobQueuePanel(QGroupBox):
+    # Travail terminé sélectionné dans la liste (pour afficher son texte)
+    job_selected = pyqtSignal(object)
+
+    def __init__(self, options_factory, regions_factory=None):
+        super().__init__("File d'attente")
+        # Fonctions qui renvoient les OcrOptions réglées dans la fenêtre et les zones tracées
+        # au moment de l'ajout
+        self.options_factory = options_factory
+        self.regions_factory = regions_factory
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(QThread.idealThreadCount())
+        self.running = 0
+        self.signals = JobSignals()
+        self.signals.progress.connect(self.update_progress)
+        self.signals.finished.connect(self.job_finished)
+
+        layout = QVBoxLayout(self)
+        self.job_list = JobList()
+        self.job_list.setMinimumHeight(110)
+        self.job_list.setToolTip("Déposez des images ici ; faites glisser les travaux en attente pour changer l'ordre")
+        self.job_list.files_dropped.connect(self.add_files)
+        self.job_list.currentItemChanged.connect(self.select_job)
+        layout.addWidget(self.job_list)
+
+        buttons_layout = QHBoxLayout()
+        self.add_btn = QPushButton("Ajouter")
+        self.add_btn.clicked.connect(self.choose_files)
+        self.cancel_btn = QPushButton("Annuler")
+        self.cancel_btn.clicked.connect(self.cancel_selected)
+        self.clear_btn = QPushButton("Retirer les terminés")
+        self.clear_btn.clicked.connect(self.clear_finished)
+        buttons_layout.addWidget(self.add_btn)
+        buttons_layout.addWidget(self.cancel_btn)
+        buttons_layout.addWidget(self.clear_btn)
+        layout.addLayout(buttons_layout)
+
+    def choose_files(self):
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, "Ajouter des images", "",
+            "Images et documents (*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.pdf)"
+        )
+        self.add_files(paths)
+
+    def add_files(self, paths):
+        from batch import IMAGE_EXTENSIONS, collect_inputs
+        files = []
+        for path in paths:
+            if os.path.isdir(path):
+                files.extend(collect_inputs([path], recursive=True))
+            elif path.lower().endswith(IMAGE_EXTENSIONS):
+                files.append(path)
+        options = self.options_factory()
+        regions = self.regions_factory() if self.regions_factory is not None else None
+        for path in files:
+            job = Job(path, options, regions)
+            item = QListWidgetItem()
+            item.setData(Qt.UserRole, job)
+            item.setToolTip(path)
+            self.job_list.addItem(item)
+            self.refresh(item)
+        self.dispatch()
+
+    def items(self):
+        return [self.job_list.item(row) for row in range(self.job_list.count())]
+
+    def find_item(self, job):
+        for item in self.items():
+            if item.data(Qt.UserRole) is job:
+                return item
+        return None
+
+    def refresh(self, item):
+        job = item.data(Qt.UserRole)
+        label = STATUS_LABELS[job.status]
+        if job.status == RUNNING:
+            label = f"{label} ({job.progress} %)"
+        item.setText(f"{os.path.basename(job.path)} — {label}")
+        # Seuls les travaux en attente peuvent encore changer de place
+        flags = item.flags() | Qt.ItemIsDragEnabled
+        if job.status != PENDING:
+            flags &= ~Qt.ItemIsDragEnabled
+        item.setFlags(flags)
+
+    def dispatch(self):
+        # Les travaux partent dans l'ordre de la liste, au plus un par thread du pool : ceux qui
+        # attendent restent dans la liste, où on peut encore les déplacer ou les annuler
+        for item in self.items():
+            if self.running >= self.pool.maxThreadCount():
+                return
+            job = item.data(Qt.UserRole)
+            if job.status != PENDING:
+                continue
+            job.status = RUNNING
+            self.running += 1
+            self.refresh(item)
+            self.pool.start(JobRunner(job, self.signals))
+
+    def update_progress(self, job, value):
+        job.progress = value
+        item = self.find_item(job)
+        if item is not None:
+            self.refresh(item)
+
+    def job_finished(self, job):
+        self.running -= 1
+        item = self.find_item(job)
+        if item is not None:
+            self.refresh(item)
+            if item is self.job_list.currentItem():
+                self.job_selected.emit(job)
+        self.dispatch()
+
+    def select_job(self, item, previous=None):
+        if item is not None and item.data(Qt.UserRole).status in (DONE, FAILED):
+            self.job_selected.emit(item.data(Qt.UserRole))
+
+    def cancel_selected(self):
+        for item in self.job_list.selectedItems():
+            job = item.data(Qt.UserRole)
+            job.cancel.set()
+            if job.status == PENDING:
+                job.status = CANCELLED
+                self.refresh(item)
+
+    def clear_finished(self):
+        for item in self.items():
+            if item.data(Qt.UserRole).status in FINISHED:
+                self.job_list.takeItem(self.job_list.row(item))
+
+    def shutdown(self):
+        # Fermeture de la fenêtre : tout annuler et attendre que les processus tesseract soient arrêtés
+        for item in self.items():
+            item.data(Qt.UserRole).cancel.set()
+        self.pool.waitForDone()
@@ -0,0 +1,119 @@
+import re
+from collections import Counter
+
+from layout import crop_block, find_text_blocks
+
+# Détection de la langue d'un document : une passe rapide de Tesseract sur un extrait de la page,
+# puis des statistiques de mots-outils et de signes diacritiques pour retenir le plus petit
+# ensemble de langues qui convient (chaque modèle ajouté ralentit la reconnaissance de chaque mot).
+
+AUTO_LANG = "auto"
+
+# Langues proposées dans l'interface, candidates de la détection
+CANDIDATES = ("fra", "eng", "spa", "deu", "ita")
+
+# Ensemble retenu quand l'extrait ne permet pas de conclure (ancienne option multi-langues)
+UNDECIDED = "fra+eng"
+
+# Modèle de la passe rapide : l'anglais est installé avec Tesseract et lit l'alphabet latin
+# (à défaut, une autre candidate installée)
+PROBE_LANG = "eng"
+
+# Taille maximale de l'extrait reconnu pendant la détection
+PROBE_MAX_PIXELS = 1_200_000
+
+# En dessous de ce nombre de mots lus, l'extrait est trop court pour trancher
+MIN_WORDS = 8
+
+# Une deuxième langue est gardée si son score atteint cette part de celui de la première
+SECOND_LANGUAGE_RATIO = 0.6
+
+STOPWORDS = {
+    "fra": frozenset("le la les un une des du de et est au aux ce ces dans pour par sur pas que qui "
+                     "ne se il elle nous vous ils sont avec son sa ses leur mais ou où plus".split()),
+    "eng": frozenset("the of and to in is a that for it with as was on are be by this at from or "
+                     "have an not which you they but his her we their were has".split()),
+    "spa": frozenset("el la los las un una de del y en que es por para con no se su sus al lo "
+                     "como más pero sus este esta está son muy".split()),
+    "deu": frozenset("der die das und ist nicht ein eine zu den von mit sich des auf für im dem "
+                     "auch es an als wird bei sind oder wir sie ich".split()),
+    "ita": frozenset("il lo la gli le un una di del della e è che non per con su sono da al nel "
+                     "anche come più ma ha questo questa".split()),
+}
+
+# Signes propres à une langue parmi les candidates (les accents partagés ne départagent rien)
+DIACRITICS = {
+    "fra": "çœêâîûëÿ",
+    "spa": "ñ¿¡áí",
+    "deu": "äöüß",
+    "ita": "ìò",
+    "eng": "",
+}
+
+_WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def language_scores(text):
+    # Score de chaque langue candidate et nombre de mots lus
+    words = [word.lower() for word in _WORD.findall(text)]
+    counts = Counter(words)
+    letters = Counter(text.lower())
+    scores = {}
+    for lang in CANDIDATES:
+        stopwords = sum(count for word, count in counts.items() if word in STOPWORDS[lang])
+        accents = sum(letters[char] for char in DIACRITICS[lang])
+        scores[lang] = stopwords + 0.5 * accents
+    return scores, len(words)
+
+
+def installed_candidates(installed=None):
+    # Candidates dont le modèle est installé (`installed` : codes des modèles, None : toutes)
+    return [lang for lang in CANDIDATES if installed is None or lang in installed]
+
+
+def probe_language(installed=None):
+    # Modèle de la passe rapide : PROBE_LANG s'il est installé, sinon une candidate installée,
+    # sinon le premier modèle installé
+    if installed is None or PROBE_LANG in installed:
+        return PROBE_LANG
+    candidates = installed_candidates(installed)
+    if candidates:
+        return candidates[0]
+    return installed[0] if installed else PROBE_LANG
+
+
+def undecided_languages(installed=None):
+    # UNDECIDED réduit aux modèles installés, ou à défaut le modèle de la passe rapide
+    kept = [lang for lang in UNDECIDED.split("+") if installed is None or lang in installed]
+    return "+".join(kept) if kept else probe_language(installed)
+
+
+def choose_languages(text, installed=None):
+    # Plus petit ensemble de langues (au plus deux) qui explique le texte lu, parmi les candidates
+    # installées : une langue sans modèle ferait échouer la reconnaissance
+    candidates = installed_candidates(installed)
+    scores, words = language_scores(text)
+    ranked = sorted(candidates, key=lambda lang: -scores[lang])
+    if not ranked or words < MIN_WORDS or scores[ranked[0]] == 0:
+        return undecided_languages(installed)
+    first = ranked[0]
+    if len(ranked) > 1 and scores[ranked[1]] >= scores[first] * SECOND_LANGUAGE_RATIO:
+        return f"{first}+{ranked[1]}"
+    return first
+
+
+def probe_region(image, max_pixels=PROBE_MAX_PIXELS):
+    # Extrait représentatif : le plus grand bloc de texte, tronqué à `max_pixels`
+    blocks = find_text_blocks(image)
+    if not blocks:
+        return image
+    x0, y0, x1, y1 = max(blocks, key=lambda block: (block[2] - block[0]) * (block[3] - block[1]))
+    y1 = min(y1, y0 + max(1, max_pixels // max(1, x1 - x0)))
+    return crop_block(image, (x0, y0, x1, y1))
+
+
+def detect_language(engine, image, cancel=None):
+    # `image` : tableau numpy (de préférence l'image prétraitée). Renvoie (langues, texte lu)
+    installed = engine.languages()
+    text = engine.image_to_string(probe_region(image), probe_language(installed), psm=6, cancel=cancel)
+    return choose_languages(text, installed), text
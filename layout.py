@@ -0,0 +1,171 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from engine import check_cancel
+from memory import WORK_BYTES_PER_PIXEL
+from result import PageResult
+
+# Découpage d'une grande page en blocs de texte (profils de projection, découpe XY récursive)
+# pour les reconnaître en parallèle puis les recoller dans l'ordre de lecture.
+
+# En dessous de cette taille, découper coûte plus cher que de reconnaître la page d'un coup
+TILED_MIN_PIXELS = 12_000_000
+
+# L'analyse de mise en page se fait sur une vignette de cette dimension maximale
+LAYOUT_MAX_SIDE = 1600
+
+# Marge blanche ajoutée autour de chaque bloc (Tesseract lit mal le texte collé au bord)
+TILE_PADDING = 12
+
+# La hauteur des glyphes est mesurée sur une vignette de cette dimension maximale, puis en pleine
+# résolution si les glyphes y font moins de GLYPH_MIN_MEASURE pixels (mesure trop imprécise)
+GLYPH_MAX_SIDE = 2000
+GLYPH_MIN_MEASURE = 8
+
+# En dessous de ce nombre de caractères détectés, la page ne contient pas assez de texte pour conclure
+GLYPH_MIN_COUNT = 20
+
+
+def text_mask(image):
+    # Masque booléen du texte (True = encre) sur une vignette, et le facteur d'échelle associé.
+    # L'image binarisée du prétraitement (texte noir sur blanc) est utilisée telle quelle ;
+    # une image brute est binarisée par Otsu uniquement pour l'analyse
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+    height, width = image.shape
+    scale = max(1.0, max(height, width) / LAYOUT_MAX_SIDE)
+    if scale > 1:
+        image = cv2.resize(image, (int(width / scale), int(height / scale)), interpolation=cv2.INTER_AREA)
+    _, ink = cv2.threshold(image, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    # Supprimer les pixels isolés (poussières, bruit de numérisation)
+    ink = cv2.morphologyEx(ink, cv2.MORPH_OPEN, np.ones((2, 2), np.uint8))
+    return ink > 0, scale
+
+
+def _glyph_heights(gray):
+    # Hauteurs des composantes connexes qui ressemblent à des caractères : ni poussières,
+    # ni mots collés, ni cadres ou filets (peu d'encre dans leur rectangle)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    widths = stats[1:, cv2.CC_STAT_WIDTH]
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = (heights >= 3) & (widths <= 4 * heights) & (areas * 10 >= widths * heights)
+    return heights[keep]
+
+
+def glyph_height(gray, max_pixels=None):
+    # Hauteur dominante des caractères en pixels pleine résolution (médiane, proche de la hauteur
+    # des minuscules), ou None si l'image ne contient pas assez de texte.
+    # Au-delà de `max_pixels`, la mesure pleine résolution se limite au centre de la page
+    height, width = gray.shape
+    scale = max(height, width) / GLYPH_MAX_SIDE
+    if scale > 1:
+        small = cv2.resize(gray, (int(width / scale), int(height / scale)), interpolation=cv2.INTER_AREA)
+        heights = _glyph_heights(small)
+        if heights.size >= GLYPH_MIN_COUNT and np.median(heights) >= GLYPH_MIN_MEASURE:
+            return float(np.median(heights)) * scale
+    if max_pixels and height * width > max_pixels:
+        window_height = min(height, int(max_pixels ** 0.5))
+        window_width = min(width, max_pixels // window_height)
+        top, left = (height - window_height) // 2, (width - window_width) // 2
+        gray = gray[top:top + window_height, left:left + window_width]
+    heights = _glyph_heights(gray)
+    if heights.size < GLYPH_MIN_COUNT:
+        return None
+    return float(np.median(heights))
+
+
+def _runs(profile, min_gap):
+    # Intervalles [début, fin) où le profil contient de l'encre, séparés par au moins min_gap lignes vides
+    filled = np.flatnonzero(profile)
+    if filled.size == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(filled) > min_gap)
+    starts = np.concatenate(([filled[0]], filled[breaks + 1]))
+    ends = np.concatenate((filled[breaks], [filled[-1]])) + 1
+    return list(zip(starts.tolist(), ends.tolist()))
+
+
+def _xy_cut(mask, x0, y0, x1, y1, gap_y, gap_x, blocks):
+    region = mask[y0:y1, x0:x1]
+    # Les colonnes d'abord : une gouttière sur toute la hauteur signifie qu'il faut lire
+    # chaque colonne en entier avant la suivante
+    columns = _runs(region.any(axis=0), gap_x)
+    if len(columns) > 1:
+        for left, right in columns:
+            _xy_cut(mask, x0 + left, y0, x0 + right, y1, gap_y, gap_x, blocks)
+        return
+    # Puis les bandes horizontales, de haut en bas. Des bandes consécutives qui partagent une
+    # gouttière (paragraphes alignés sur deux colonnes) sont regroupées pour que la découpe
+    # en colonnes passe avant celle en paragraphes
+    bands = _runs(region.any(axis=1), gap_y)
+    if len(bands) > 1:
+        groups = [list(bands[0])]
+        for top, bottom in bands[1:]:
+            merged = region[groups[-1][0]:bottom]
+            if (len(_runs(region[groups[-1][0]:groups[-1][1]].any(axis=0), gap_x)) > 1
+                    and len(_runs(merged.any(axis=0), gap_x)) > 1):
+                groups[-1][1] = bottom
+            else:
+                groups.append([top, bottom])
+        if len(groups) == 1:
+            groups = [list(band) for band in bands]
+        for top, bottom in groups:
+            _xy_cut(mask, x0, y0 + top, x1, y0 + bottom, gap_y, gap_x, blocks)
+        return
+    if bands and columns:
+        top, bottom = bands[0]
+        left, right = columns[0]
+        blocks.append((x0 + left, y0 + top, x0 + right, y0 + bottom))
+
+
+def find_text_blocks(image, gap_y=12, gap_x=18):
+    # Blocs (x0, y0, x1, y1) en coordonnées pleine résolution, dans l'ordre de lecture
+    mask, scale = text_mask(image)
+    blocks = []
+    _xy_cut(mask, 0, 0, mask.shape[1], mask.shape[0], gap_y, gap_x, blocks)
+    height, width = image.shape[:2]
+    return [(max(0, int(x0 * scale) - 1), max(0, int(y0 * scale) - 1),
+             min(width, int(np.ceil(x1 * scale)) + 1), min(height, int(np.ceil(y1 * scale)) + 1))
+            for x0, y0, x1, y1 in blocks]
+
+
+def crop_block(image, block):
+    x0, y0, x1, y1 = block
+    white = 255 if image.ndim == 2 else (255, 255, 255)
+    return cv2.copyMakeBorder(image[y0:y1, x0:x1], TILE_PADDING, TILE_PADDING, TILE_PADDING, TILE_PADDING,
+                              cv2.BORDER_CONSTANT, value=white)
+
+
+def _recognize_block(engine, image, block, lang, cancel):
+    check_cancel(cancel)
+    tile = crop_block(image, block)
+    return PageResult.from_tsv(engine.image_to_tsv(tile, lang, cancel=cancel), tile.shape[1], tile.shape[0])
+
+
+def recognize_tiled(engine, image, lang, workers=None, cancel=None, budget=None):
+    # Les appels au moteur libèrent le GIL (processus tesseract ou liaison C++) : des threads suffisent.
+    # Les mots de chaque bloc sont replacés dans les coordonnées de la page entière.
+    # `budget` (MemoryBudget) : chaque bloc doit y tenir, et le nombre de blocs reconnus en même
+    # temps est limité pour que leur total y tienne aussi
+    height, width = image.shape[:2]
+    blocks = find_text_blocks(image)
+    workers = workers or os.cpu_count() or 1
+    if budget is not None:
+        # Page sans texte : rien à confier à Tesseract. Même un bloc unique est découpé avec ses marges
+        # (TILE_PADDING) plutôt que reconnu sur la page entière, qui peut dépasser le budget
+        if not blocks:
+            return PageResult(width, height)
+        largest = max((x1 - x0 + 2 * TILE_PADDING) * (y1 - y0 + 2 * TILE_PADDING) for x0, y0, x1, y1 in blocks)
+        budget.check(largest * WORK_BYTES_PER_PIXEL, f"La reconnaissance d'un bloc de texte de {largest} pixels")
+        workers = max(1, min(workers, budget.limit // (largest * WORK_BYTES_PER_PIXEL)))
+    elif len(blocks) <= 1:
+        return PageResult.from_tsv(engine.image_to_tsv(image, lang, cancel=cancel), width, height)
+    with ThreadPoolExecutor(max_workers=min(workers, len(blocks))) as executor:
+        results = executor.map(lambda block: _recognize_block(engine, image, block, lang, cancel), blocks)
+        return PageResult.concat([(result, x0 - TILE_PADDING, y0 - TILE_PADDING)
+                                  for result, (x0, y0, _, _) in zip(results, blocks)], width, height)
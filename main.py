@@ -1,94 +1,281 @@
 import sys
 import os
-from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel, 
-                            QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, 
-                            QComboBox, QTextEdit, QFrame, QMessageBox, QProgressBar,
-                            QCheckBox, QSlider, QGroupBox)
-from PyQt5.QtGui import QPixmap, QIcon, QFont, QImage
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-import cv2
-import numpy as np
-import pytesseract
-from PIL import Image
+import threading
+import importlib
+from timings import JobTrace
+
+# Démarrage chronométré (affiché avec --profile-startup) : la trace existe avant l'import de Qt
+STARTUP_TRACE = JobTrace("startup")
+
+with STARTUP_TRACE.stage("import", module="PyQt5"):
+    from PyQt5.QtWidgets import (QApplication, QMainWindow, QPushButton, QLabel, 
+                                QVBoxLayout, QHBoxLayout, QWidget, QFileDialog, 
+                                QComboBox, QTextEdit, QFrame, QMessageBox, QProgressBar,
+                                QCheckBox, QSlider, QGroupBox, QRubberBand)
+    from PyQt5.QtGui import QPixmap, QIcon, QFont, QImage, QImageReader, QPainter, QColor, QPen
+    from PyQt5.QtCore import Qt, QThread, QTimer, QRect, QSize, pyqtSignal
+with STARTUP_TRACE.stage("import", module="discovery"):
+    from discovery import SOURCE_LABELS, TESSERACT_ENV, default_config_path, probe_tesseract
+with STARTUP_TRACE.stage("import", module="jobqueue"):
+    from jobqueue import JobQueuePanel
+
+# La fenêtre s'affiche avant que numpy, OpenCV, Pillow et pytesseract soient chargés : les
+# modules de traitement sont importés là où ils servent, et préchargés en arrière-plan
+# (dans cet ordre) dès que la fenêtre est affichée
+WARMUP_MODULES = ("numpy", "cv2", "PIL.Image", "pipeline", "regions", "export")
+
+# Langues proposées en tête de liste quand elles sont installées ; les autres langues installées
+# suivent sous leur code
+LANGUAGE_NAMES = (
+    ("fra", "Français"),
+    ("eng", "Anglais"),
+    ("spa", "Espagnol"),
+    ("deu", "Allemand"),
+    ("ita", "Italien"),
+)
+
+# Formats d'enregistrement avec la position des mots (en plus du texte brut)
+EXPORT_FILTERS = (
+    ("hocr", "hOCR (*.hocr)"),
+    ("alto", "ALTO XML (*.xml)"),
+    ("pdf", "PDF avec texte (*.pdf)"),
+)
 
 class OcrThread(QThread):
     result_ready = pyqtSignal(str)
     progress_update = pyqtSignal(int)
+    # Émis pour chaque page dès qu'elle est reconnue (index, nombre de pages, texte affiché)
+    page_ready = pyqtSignal(int, int, str)
+    # Émis à la fin du traitement avec la trace des étapes (JobTrace)
+    trace_ready = pyqtSignal(object)
+    # Émis à la fin du traitement avec les résultats structurés (un PageResult par page)
+    results_ready = pyqtSignal(object)
     
-    def __init__(self, image_path, lang, use_preprocessing=True, brightness=0, contrast=0):
+    def __init__(self, image_path, options, image=None, regions=None):
         super().__init__()
         self.image_path = image_path
-        self.lang = lang
-        self.use_preprocessing = use_preprocessing
-        self.brightness = brightness
-        self.contrast = contrast
+        self.options = options
+        self.image = image
+        # Zones sélectionnées (liste de Region) : seules celles-ci sont lues
+        self.regions = regions
+        self.trace = JobTrace(image_path)
+        self.cancel_event = threading.Event()
+    
+    def cancel(self):
+        # Arrête l'extraction, processus tesseract en cours compris
+        self.cancel_event.set()
         
     def run(self):
+        from cache import get_default_cache
+        from engine import OcrCancelled
+        from pages import format_page
+        from pipeline import NO_TEXT_MESSAGE, ocr_results
         try:
-            self.progress_update.emit(10)
-            
-            # Lecture directe avec PIL pour compatibilité Tesseract
-            pil_img = Image.open(self.image_path)
-            self.progress_update.emit(30)
-            
-            # Prétraitement optionnel
-            if self.use_preprocessing:
-                # Conversion en numpy array pour OpenCV
-                img = cv2.cvtColor(np.array(pil_img), cv2.COLOR_RGB2BGR)
-                
-                # Appliquer les ajustements de luminosité et contraste
-                if self.brightness != 0 or self.contrast != 0:
-                    img = cv2.convertScaleAbs(img, alpha=(self.contrast/50.0)+1, beta=self.brightness)
-                
-                # Conversion en niveaux de gris
-                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-                
-                # Seuillage adaptatif pour améliorer le contraste
-                thresh = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
-                                              cv2.THRESH_BINARY, 11, 2)
-                
-                # Réduction du bruit
-                kernel = np.ones((1, 1), np.uint8)
-                processed = cv2.morphologyEx(thresh, cv2.MORPH_OPEN, kernel)
-                
-                # Reconversion en image PIL pour Tesseract
-                pil_processed = Image.fromarray(processed)
-                self.progress_update.emit(60)
-                
-                # Extraction avec l'image prétraitée
-                text = pytesseract.image_to_string(pil_processed, lang=self.lang)
-            else:
-                # Extraction directe sans prétraitement
-                text = pytesseract.image_to_string(pil_img, lang=self.lang)
+            if self.regions:
+                self.run_regions()
+                return
+            pages = []
+            results = []
+            found = False
+            for index, count, result in ocr_results(self.image_path, self.options, self.progress_update.emit,
+                                                    get_default_cache(), self.image, self.trace, self.cancel_event):
+                found = found or bool(result.text.strip())
+                results.append(result)
+                pages.append(format_page(index, count, result.text))
+                self.page_ready.emit(index, count, pages[-1])
+            text = "\n".join(pages)
+            self.trace_ready.emit(self.trace)
+            self.results_ready.emit(results)
             
-            self.progress_update.emit(90)
-            
-            # Si le texte est vide, essayer avec d'autres configurations
-            if not text.strip():
-                # Essayer PSM 6 (block de texte unique)
-                text = pytesseract.image_to_string(
-                    pil_img, 
-                    lang=self.lang,
-                    config='--psm 6'
-                )
-            
-            # Si toujours vide, essayer avec PSM 3 (détection automatique complète)
-            if not text.strip():
-                text = pytesseract.image_to_string(
-                    pil_img, 
-                    lang=self.lang,
-                    config='--psm 3 --oem 3'
-                )
-            
-            self.progress_update.emit(100)
-            
-            if not text.strip():
-                self.result_ready.emit("Aucun texte n'a pu être extrait de cette image. Essayez d'ajuster les paramètres de prétraitement ou utilisez une image avec un texte plus clair.")
+            if not found:
+                self.result_ready.emit(NO_TEXT_MESSAGE)
             else:
                 self.result_ready.emit(text)
                 
+        except OcrCancelled:
+            self.result_ready.emit("Extraction annulée.")
         except Exception as e:
             self.result_ready.emit(f"Erreur lors de l'extraction de texte: {str(e)}\n\nAssurez-vous que Tesseract OCR est correctement installé.")
+    
+    def run_regions(self):
+        from cache import get_default_cache
+        from pipeline import NO_TEXT_MESSAGE
+        from regions import format_regions, ocr_regions, page_results
+        region_results = ocr_regions(self.image_path, self.regions, self.options, self.progress_update.emit,
+                                     get_default_cache(), self.image, self.trace, self.cancel_event)
+        self.trace_ready.emit(self.trace)
+        self.results_ready.emit(page_results(region_results))
+        text = format_regions(region_results)
+        self.result_ready.emit(text if text.strip() else NO_TEXT_MESSAGE)
+
+class RegionLabel(QLabel):
+    # Panneau image sur lequel on trace des zones à la souris (clic droit : supprimer une zone).
+    # Les zones sont gardées en fractions de l'image, donc valables pour l'image source en pleine
+    # résolution comme pour l'aperçu affiché, et pour les documents suivants de même mise en page
+    regions_changed = pyqtSignal()
+    
+    def __init__(self, text):
+        super().__init__(text)
+        self.regions = []
+        self._origin = None
+        self._rubber_band = QRubberBand(QRubberBand.Rectangle, self)
+    
+    def image_rect(self):
+        # Position de l'image dans le label (centrée, à sa taille d'affichage)
+        pixmap = self.pixmap()
+        if pixmap is None or pixmap.isNull():
+            return None
+        rect = QRect(0, 0, pixmap.width(), pixmap.height())
+        rect.moveCenter(self.contentsRect().center())
+        return rect
+    
+    def region_rect(self, region, image_rect):
+        x0, y0, x1, y1 = region.pixel_box(image_rect.width(), image_rect.height())
+        return QRect(image_rect.left() + x0, image_rect.top() + y0, x1 - x0, y1 - y0)
+    
+    def set_regions(self, regions):
+        self.regions = list(regions)
+        self.update()
+        self.regions_changed.emit()
+    
+    def mousePressEvent(self, event):
+        image_rect = self.image_rect()
+        if image_rect is None or not image_rect.contains(event.pos()):
+            return super().mousePressEvent(event)
+        if event.button() == Qt.RightButton:
+            for region in reversed(self.regions):
+                if region.page == 0 and self.region_rect(region, image_rect).contains(event.pos()):
+                    self.regions.remove(region)
+                    self.update()
+                    self.regions_changed.emit()
+                    break
+        elif event.button() == Qt.LeftButton:
+            self._origin = event.pos()
+            self._rubber_band.setGeometry(QRect(self._origin, QSize()))
+            self._rubber_band.show()
+    
+    def mouseMoveEvent(self, event):
+        image_rect = self.image_rect()
+        if self._origin is not None and image_rect is not None:
+            self._rubber_band.setGeometry(QRect(self._origin, event.pos()).normalized().intersected(image_rect))
+    
+    def mouseReleaseEvent(self, event):
+        from regions import MIN_REGION_SIDE, region_from_pixels
+        image_rect = self.image_rect()
+        if self._origin is None or image_rect is None:
+            return
+        self._origin = None
+        self._rubber_band.hide()
+        rect = self._rubber_band.geometry()
+        if rect.width() < MIN_REGION_SIDE or rect.height() < MIN_REGION_SIDE:
+            return
+        names = {region.name for region in self.regions}
+        number = 1
+        while f"zone{number}" in names:
+            number += 1
+        box = (rect.left() - image_rect.left(), rect.top() - image_rect.top(),
+               rect.right() + 1 - image_rect.left(), rect.bottom() + 1 - image_rect.top())
+        self.regions.append(region_from_pixels(f"zone{number}", box, image_rect.width(), image_rect.height()))
+        self.update()
+        self.regions_changed.emit()
+    
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        image_rect = self.image_rect()
+        if image_rect is None or not self.regions:
+            return
+        painter = QPainter(self)
+        painter.setPen(QPen(QColor("#0d6efd"), 2))
+        for region in self.regions:
+            # L'aperçu ne montre que la première page
+            if region.page != 0:
+                continue
+            rect = self.region_rect(region, image_rect)
+            painter.fillRect(rect, QColor(13, 110, 253, 40))
+            painter.drawRect(rect)
+            painter.drawText(rect.adjusted(4, 2, 0, 0), Qt.AlignLeft | Qt.AlignTop, region.name)
+        painter.end()
+
+class PreviewThread(QThread):
+    # Aperçu du prétraitement calculé hors du thread graphique, sur une version réduite de
+    # l'image dont le niveau de gris est gardé en mémoire. Seule la dernière demande compte :
+    # les réglages intermédiaires d'un curseur qu'on fait glisser sont ignorés.
+    preview_ready = pyqtSignal(QImage)
+    
+    def __init__(self):
+        super().__init__()
+        self._condition = threading.Condition()
+        self._request = None
+        self._stopping = False
+        self._base_key = None
+        self._base = None
+        self._scale = 1.0
+        
+    def request(self, image, width, height, options):
+        with self._condition:
+            self._request = (image, width, height, options)
+            self._condition.notify()
+    
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.wait()
+        
+    def run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+                request, self._request = self._request, None
+            try:
+                self.preview_ready.emit(self.render(*request))
+            except Exception:
+                # Un aperçu raté n'empêche pas l'extraction : l'image source reste affichée
+                continue
+    
+    def render(self, image, width, height, options):
+        # Le proxy n'est recalculé que si l'image ou la taille d'affichage change ; il est tiré
+        # de l'image pleine résolution partagée avec l'extraction
+        from preprocess import build_preview_pipeline, make_proxy
+        if self._base_key != (image.path, width, height):
+            self._base, self._scale = make_proxy(image.get(), width, height)
+            self._base_key = (image.path, width, height)
+        preview = build_preview_pipeline(options, self._scale).run(self._base)
+        height, width = preview.shape
+        return QImage(preview.data, width, height, width, QImage.Format_Grayscale8).copy()
+
+class StartupThread(QThread):
+    # Travail de démarrage fait hors du thread graphique une fois la fenêtre affichée : recherche
+    # de Tesseract (chemin, version, langues installées), puis préchargement des modules de
+    # traitement pour que la première extraction n'ait pas à les attendre
+    tesseract_ready = pyqtSignal(object)
+    warmed_up = pyqtSignal()
+    
+    def __init__(self, trace):
+        super().__init__()
+        self.trace = trace
+    
+    def run(self):
+        with self.trace.stage("tesseract") as entry:
+            info = probe_tesseract()
+            entry.update(command=info["command"], version=info["version"], error=info["error"])
+        self.tesseract_ready.emit(info)
+        with self.trace.stage("warmup", module="pytesseract"):
+            import pytesseract
+        if info["command"] is not None:
+            # Chemin suivi par les moteurs pytesseract et cli
+            pytesseract.pytesseract.tesseract_cmd = info["command"]
+        for module in WARMUP_MODULES:
+            with self.trace.stage("warmup", module=module) as entry:
+                try:
+                    importlib.import_module(module)
+                except ImportError as e:
+                    # L'erreur sera signalée à la première extraction
+                    entry["error"] = str(e)
+        self.warmed_up.emit()
 
 class OCRApp(QMainWindow):
     def __init__(self):
@@ -226,12 +413,30 @@ class OCRApp(QMainWindow):
         image_layout.addWidget(image_title)
         
         # Label pour l'image
-        self.image_label = QLabel("Aucune image sélectionnée")
+        self.image_label = RegionLabel("Aucune image sélectionnée")
         self.image_label.setAlignment(Qt.AlignCenter)
         self.image_label.setMinimumHeight(250)
         self.image_label.setStyleSheet("background-color: #f8f9fa; border: 2px dashed #ced4da; border-radius: 5px;")
+        self.image_label.setToolTip("Tracez des zones pour ne lire qu'elles ; clic droit sur une zone pour la retirer")
+        self.image_label.regions_changed.connect(self.update_regions_info)
         image_layout.addWidget(self.image_label)
         
+        # Zones à lire (tracées sur l'image ou chargées depuis un modèle)
+        regions_layout = QHBoxLayout()
+        self.regions_info = QLabel()
+        self.load_regions_btn = QPushButton("Charger un modèle")
+        self.load_regions_btn.clicked.connect(self.load_regions)
+        self.save_regions_btn = QPushButton("Enregistrer le modèle")
+        self.save_regions_btn.clicked.connect(self.save_regions)
+        self.clear_regions_btn = QPushButton("Effacer les zones")
+        self.clear_regions_btn.clicked.connect(lambda: self.image_label.set_regions([]))
+        regions_layout.addWidget(self.regions_info)
+        regions_layout.addStretch()
+        regions_layout.addWidget(self.load_regions_btn)
+        regions_layout.addWidget(self.save_regions_btn)
+        regions_layout.addWidget(self.clear_regions_btn)
+        image_layout.addLayout(regions_layout)
+        
         # Bouton pour sélectionner une image
         self.select_btn = QPushButton("Sélectionner une image")
         self.select_btn.setIcon(QIcon("icon.png"))  # Ajoutez une icône si disponible
@@ -246,29 +451,54 @@ class OCRApp(QMainWindow):
         lang_layout = QHBoxLayout()
         lang_label = QLabel("Langue du texte:")
         self.lang_combo = QComboBox()
-        self.lang_combo.addItems([
-            "Français (fra)", 
-            "Anglais (eng)", 
-            "Espagnol (spa)", 
-            "Allemand (deu)", 
-            "Italien (ita)",
-            "Multi-langues (fra+eng)"
-        ])
+        self.set_languages([code for code, _ in LANGUAGE_NAMES])
         lang_layout.addWidget(lang_label)
         lang_layout.addWidget(self.lang_combo)
         options_layout.addLayout(lang_layout)
         
+        # Tesseract est recherché en arrière-plan ; la liste des langues suit les modèles installés
+        self.tesseract_status = QLabel("Recherche de Tesseract...")
+        self.tesseract_status.setStyleSheet("color: #6c757d; font-size: 12px;")
+        options_layout.addWidget(self.tesseract_status)
+        
         # Option de prétraitement
         preproc_layout = QHBoxLayout()
         self.preproc_check = QCheckBox("Utiliser le prétraitement d'image")
         self.preproc_check.setChecked(True)
         self.preproc_check.stateChanged.connect(self.toggle_image_controls)
         preproc_layout.addWidget(self.preproc_check)
+        self.deskew_check = QCheckBox("Redresser les pages")
+        self.deskew_check.setChecked(True)
+        self.deskew_check.setToolTip("Remet à l'endroit les pages tournées ou à l'envers et corrige l'inclinaison")
+        preproc_layout.addWidget(self.deskew_check)
         options_layout.addLayout(preproc_layout)
         
-        # Contrôles d'image (luminosité/contraste)
+        # Essais de configurations en parallèle (le résultat le plus confiant est retenu)
+        self.parallel_check = QCheckBox("Essayer plusieurs configurations en parallèle")
+        self.parallel_check.setToolTip("Plus rapide sur les images difficiles, mais utilise davantage le processeur")
+        options_layout.addWidget(self.parallel_check)
+        
+        # Découpage des très grandes images en blocs reconnus en parallèle
+        self.tiled_check = QCheckBox("Découper les grandes images en blocs")
+        self.tiled_check.setToolTip("Plans, panoramas, scans haute résolution : les blocs de texte sont lus sur tous les cœurs")
+        options_layout.addWidget(self.tiled_check)
+        
+        # Mise à l'échelle du texte vers la taille que Tesseract lit le mieux
+        self.scale_check = QCheckBox("Normaliser la taille du texte")
+        self.scale_check.setChecked(True)
+        self.scale_check.setToolTip("Agrandit les petites captures d'écran et réduit les scans à très haute résolution")
+        options_layout.addWidget(self.scale_check)
+        
+        # Contrôles d'image (luminosité/contraste, seuillage)
         image_controls_layout = QVBoxLayout()
         
+        # Réglage automatique : les valeurs retenues sont reportées sur les curseurs après l'extraction
+        self.autotune_check = QCheckBox("Réglage automatique")
+        self.autotune_check.setToolTip("Essaie plusieurs réglages sur un extrait de la page et garde celui "
+                                       "que Tesseract lit le mieux")
+        self.autotune_check.stateChanged.connect(self.toggle_image_controls)
+        image_controls_layout.addWidget(self.autotune_check)
+        
         brightness_layout = QHBoxLayout()
         brightness_label = QLabel("Luminosité:")
         self.brightness_slider = QSlider(Qt.Horizontal)
@@ -277,6 +507,7 @@ class OCRApp(QMainWindow):
         self.brightness_slider.setTickPosition(QSlider.TicksBelow)
         self.brightness_value = QLabel("0")
         self.brightness_slider.valueChanged.connect(lambda v: self.brightness_value.setText(str(v)))
+        self.brightness_slider.valueChanged.connect(self.schedule_preview)
         brightness_layout.addWidget(brightness_label)
         brightness_layout.addWidget(self.brightness_slider)
         brightness_layout.addWidget(self.brightness_value)
@@ -290,12 +521,47 @@ class OCRApp(QMainWindow):
         self.contrast_slider.setTickPosition(QSlider.TicksBelow)
         self.contrast_value = QLabel("0")
         self.contrast_slider.valueChanged.connect(lambda v: self.contrast_value.setText(str(v)))
+        self.contrast_slider.valueChanged.connect(self.schedule_preview)
         contrast_layout.addWidget(contrast_label)
         contrast_layout.addWidget(self.contrast_slider)
         contrast_layout.addWidget(self.contrast_value)
         image_controls_layout.addLayout(contrast_layout)
         
+        # Taille du voisinage du seuillage adaptatif, toujours impaire (2 x valeur + 1)
+        block_layout = QHBoxLayout()
+        block_label = QLabel("Voisinage du seuillage:")
+        self.block_slider = QSlider(Qt.Horizontal)
+        self.block_slider.setRange(1, 25)
+        self.block_slider.setValue(5)
+        self.block_slider.setTickPosition(QSlider.TicksBelow)
+        self.block_value = QLabel("11")
+        self.block_slider.valueChanged.connect(lambda v: self.block_value.setText(str(2 * v + 1)))
+        self.block_slider.valueChanged.connect(self.schedule_preview)
+        block_layout.addWidget(block_label)
+        block_layout.addWidget(self.block_slider)
+        block_layout.addWidget(self.block_value)
+        image_controls_layout.addLayout(block_layout)
+        
+        threshold_c_layout = QHBoxLayout()
+        threshold_c_label = QLabel("Constante du seuillage:")
+        self.threshold_c_slider = QSlider(Qt.Horizontal)
+        self.threshold_c_slider.setRange(-10, 20)
+        self.threshold_c_slider.setValue(2)
+        self.threshold_c_slider.setTickPosition(QSlider.TicksBelow)
+        self.threshold_c_value = QLabel("2")
+        self.threshold_c_slider.valueChanged.connect(lambda v: self.threshold_c_value.setText(str(v)))
+        self.threshold_c_slider.valueChanged.connect(self.schedule_preview)
+        threshold_c_layout.addWidget(threshold_c_label)
+        threshold_c_layout.addWidget(self.threshold_c_slider)
+        threshold_c_layout.addWidget(self.threshold_c_value)
+        image_controls_layout.addLayout(threshold_c_layout)
+        
         options_layout.addLayout(image_controls_layout)
+        
+        # Aperçu du résultat du prétraitement dans le panneau image
+        self.preview_check = QCheckBox("Aperçu du prétraitement")
+        self.preview_check.stateChanged.connect(self.schedule_preview)
+        options_layout.addWidget(self.preview_check)
         image_layout.addWidget(options_group)
         
         # Bouton d'extraction
@@ -321,6 +587,13 @@ class OCRApp(QMainWindow):
         self.extract_btn.clicked.connect(self.extract_text)
         image_layout.addWidget(self.extract_btn)
         
+        # Bouton d'annulation, visible pendant l'extraction
+        self.cancel_btn = QPushButton("Annuler l'extraction")
+        self.cancel_btn.setStyleSheet("background-color: #dc3545;")
+        self.cancel_btn.clicked.connect(self.cancel_extraction)
+        self.cancel_btn.setVisible(False)
+        image_layout.addWidget(self.cancel_btn)
+        
         # Barre de progression
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
@@ -351,7 +624,8 @@ class OCRApp(QMainWindow):
         self.copy_btn.clicked.connect(self.copy_text)
         self.copy_btn.setEnabled(False)
         
-        self.save_btn = QPushButton("Enregistrer en TXT")
+        self.save_btn = QPushButton("Enregistrer")
+        self.save_btn.setToolTip("Texte, hOCR, ALTO XML ou PDF avec couche de texte")
         self.save_btn.clicked.connect(self.save_text)
         self.save_btn.setEnabled(False)
         
@@ -359,6 +633,30 @@ class OCRApp(QMainWindow):
         text_btn_layout.addWidget(self.save_btn)
         text_layout.addLayout(text_btn_layout)
         
+        # Statistiques du dernier traitement (durée de chaque étape)
+        stats_layout = QHBoxLayout()
+        self.stats_check = QCheckBox("Afficher les statistiques")
+        self.stats_check.stateChanged.connect(lambda state: self.stats_view.setVisible(state == Qt.Checked))
+        self.export_trace_btn = QPushButton("Exporter la trace")
+        self.export_trace_btn.clicked.connect(self.export_trace)
+        self.export_trace_btn.setEnabled(False)
+        stats_layout.addWidget(self.stats_check)
+        stats_layout.addStretch()
+        stats_layout.addWidget(self.export_trace_btn)
+        text_layout.addLayout(stats_layout)
+        
+        self.stats_view = QTextEdit()
+        self.stats_view.setReadOnly(True)
+        self.stats_view.setFont(QFont("Consolas", 10))
+        self.stats_view.setMaximumHeight(140)
+        self.stats_view.setVisible(False)
+        text_layout.addWidget(self.stats_view)
+        
+        # File d'attente : plusieurs images traitées en parallèle avec les options courantes
+        self.queue_panel = JobQueuePanel(self.current_options, lambda: list(self.image_label.regions))
+        self.queue_panel.job_selected.connect(self.show_job)
+        text_layout.addWidget(self.queue_panel)
+        
         # Ajout des deux panneaux au layout principal
         content_layout.addWidget(image_frame, 40)
         content_layout.addWidget(text_frame, 60)
@@ -380,39 +678,183 @@ class OCRApp(QMainWindow):
         
         # Variables pour stocker les données
         self.current_image_path = None
+        self.current_image = None
+        self.source_pixmap = None
         self.ocr_thread = None
+        self.last_trace = None
+        # Résultats structurés du texte affiché : (document source, un PageResult par page)
+        self.last_results = None
+        
+        # Aperçu en direct : les mouvements de curseur sont regroupés (une image par trame au plus)
+        self.preview_thread = PreviewThread()
+        self.preview_thread.preview_ready.connect(self.display_preview)
+        self.preview_thread.start()
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(16)
+        self.preview_timer.timeout.connect(self.request_preview)
+        self.update_regions_info()
+        
+        # Recherche de Tesseract et préchargement, lancés au premier tour de la boucle
+        # d'événements pour ne pas retarder l'affichage
+        self.startup_thread = StartupThread(STARTUP_TRACE)
+        self.startup_thread.tesseract_ready.connect(self.show_tesseract)
+        QTimer.singleShot(0, self.start_background)
+    
+    def start_background(self):
+        STARTUP_TRACE.note(shown_ms=STARTUP_TRACE.elapsed_ms())
+        self.startup_thread.start()
+    
+    def show_tesseract(self, info):
+        if info["command"] is None:
+            self.tesseract_status.setText("Tesseract introuvable : l'extraction ne fonctionnera pas")
+            self.tesseract_status.setToolTip(
+                f"Installez Tesseract OCR et ajoutez-le au PATH, ou indiquez son chemin dans la variable "
+                f"{TESSERACT_ENV} ou dans {default_config_path()} (clé « tesseract_cmd »).")
+            self.tesseract_status.setStyleSheet("color: #dc3545; font-size: 12px;")
+            print("Avertissement: Impossible de trouver Tesseract. Assurez-vous qu'il est correctement installé.")
+            return
+        self.tesseract_status.setToolTip(info["command"])
+        if info["error"] is not None:
+            self.tesseract_status.setText(f"Tesseract ne répond pas : {info['error']}")
+            self.tesseract_status.setStyleSheet("color: #dc3545; font-size: 12px;")
+            return
+        self.tesseract_status.setText(f"Tesseract {info['version'] or ''} ({SOURCE_LABELS[info['source']]})")
+        if info["languages"]:
+            self.set_languages(info["languages"])
+    
+    def set_languages(self, installed):
+        # Langues proposées d'après les modèles installés ; la langue choisie est gardée si possible
+        current = self.lang_combo.currentData()
+        known = [code for code, _ in LANGUAGE_NAMES]
+        items = [(f"{name} ({code})", code) for code, name in LANGUAGE_NAMES if code in installed]
+        items += [(code, code) for code in sorted(installed) if code not in known]
+        if "fra" in installed and "eng" in installed:
+            items.append(("Multi-langues (fra+eng)", "fra+eng"))
+        items.append(("Détection automatique (auto)", "auto"))
+        self.lang_combo.clear()
+        for text, code in items:
+            self.lang_combo.addItem(text, code)
+        index = self.lang_combo.findData(current)
+        if index >= 0:
+            self.lang_combo.setCurrentIndex(index)
+    
+    def closeEvent(self, event):
+        self.startup_thread.wait()
+        self.preview_thread.stop()
+        if self.ocr_thread is not None and self.ocr_thread.isRunning():
+            self.ocr_thread.cancel()
+            self.ocr_thread.wait()
+        self.queue_panel.shutdown()
+        super().closeEvent(event)
     
-    def toggle_image_controls(self, state):
-        enabled = (state == Qt.Checked)
-        self.brightness_slider.setEnabled(enabled)
-        self.contrast_slider.setEnabled(enabled)
-        self.brightness_value.setEnabled(enabled)
-        self.contrast_value.setEnabled(enabled)
+    def update_regions_info(self):
+        count = len(self.image_label.regions)
+        if count:
+            self.regions_info.setText(f"{count} zone(s) : seules ces zones seront lues")
+        else:
+            self.regions_info.setText("Page entière")
+        self.save_regions_btn.setEnabled(bool(count))
+        self.clear_regions_btn.setEnabled(bool(count))
+    
+    def load_regions(self):
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Charger un modèle de zones", "",
+            "Modèles de zones (*.json)"
+        )
+        if not file_path:
+            return
+        from regions import load_template
+        try:
+            self.image_label.set_regions(load_template(file_path))
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.warning(self, "Erreur", f"Impossible de charger le modèle.\n\n{str(e)}")
+    
+    def save_regions(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Enregistrer le modèle de zones", "zones.json",
+            "Modèles de zones (*.json)"
+        )
+        if file_path:
+            from regions import save_template
+            save_template(file_path, self.image_label.regions)
+    
+    def schedule_preview(self, *args):
+        self.preview_timer.start()
+    
+    def request_preview(self):
+        if self.current_image is None:
+            return
+        if not (self.preview_check.isChecked() and self.preproc_check.isChecked()):
+            # Revenir à l'image source
+            if self.source_pixmap is not None:
+                self.image_label.setPixmap(self.source_pixmap)
+            return
+        self.preview_thread.request(
+            self.current_image,
+            self.image_label.width() - 10,
+            self.image_label.height() - 10,
+            self.current_options()
+        )
+    
+    def display_preview(self, image):
+        # Ignorer un aperçu arrivé après la désactivation de l'option
+        if self.preview_check.isChecked() and self.preproc_check.isChecked():
+            self.image_label.setPixmap(QPixmap.fromImage(image))
+    
+    def toggle_image_controls(self, state=None):
+        enabled = self.preproc_check.isChecked()
+        # En réglage automatique, les curseurs affichent les valeurs retenues
+        manual = enabled and not self.autotune_check.isChecked()
+        for widget in (self.brightness_slider, self.contrast_slider, self.block_slider, self.threshold_c_slider,
+                       self.brightness_value, self.contrast_value, self.block_value, self.threshold_c_value):
+            widget.setEnabled(manual)
+        self.autotune_check.setEnabled(enabled)
+        self.preview_check.setEnabled(enabled)
+        self.schedule_preview()
     
     def select_image(self):
         file_dialog = QFileDialog()
         file_path, _ = file_dialog.getOpenFileName(
             self, "Sélectionner une image", "", 
-            "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff)"
+            "Images et documents (*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.pdf)"
         )
         
         if file_path:
             self.current_image_path = file_path
             
-            # Afficher l'image
-            pixmap = QPixmap(file_path)
+            self.current_image = None
+            
+            # Taille d'affichage disponible
+            max_height = self.image_label.height() - 10  # Marge
+            max_width = self.image_label.width() - 10    # Marge
+            
+            # Afficher l'image (première page pour un PDF)
+            from pages import SharedImage, is_pdf, page_count
+            try:
+                if is_pdf(file_path):
+                    pixmap = self.pdf_preview(file_path)
+                else:
+                    pixmap = self.scaled_preview(file_path, max_width, max_height)
+                    if page_count(file_path) == 1:
+                        # Décodage pleine résolution unique, partagé par l'aperçu et l'extraction
+                        self.current_image = SharedImage(file_path)
+                        self.current_image.preload()
+            except Exception as e:
+                QMessageBox.warning(self, "Erreur", f"Impossible de charger le document.\n\n{str(e)}")
+                return
             if not pixmap.isNull():
                 # Redimensionner pour s'adapter au label tout en conservant les proportions
-                max_height = self.image_label.height() - 10  # Marge
-                max_width = self.image_label.width() - 10    # Marge
-                
-                pixmap = pixmap.scaled(
-                    max_width, 
-                    max_height,
-                    Qt.AspectRatioMode.KeepAspectRatio,
-                    Qt.TransformationMode.SmoothTransformation
-                )
+                if pixmap.width() > max_width or pixmap.height() > max_height:
+                    pixmap = pixmap.scaled(
+                        max_width, 
+                        max_height,
+                        Qt.AspectRatioMode.KeepAspectRatio,
+                        Qt.TransformationMode.SmoothTransformation
+                    )
+                self.source_pixmap = pixmap
                 self.image_label.setPixmap(pixmap)
+                self.schedule_preview()
                 self.extract_btn.setEnabled(True)
                 
                 # Afficher le nom du fichier
@@ -421,25 +863,62 @@ class OCRApp(QMainWindow):
             else:
                 QMessageBox.warning(self, "Erreur", "Impossible de charger l'image.")
     
-    def extract_text(self):
-        if not self.current_image_path:
-            return
-        
+    def scaled_preview(self, file_path, max_width, max_height):
+        # Décodage directement à la taille d'affichage (réduite pendant le décodage pour le JPEG),
+        # sans passer par une copie pleine résolution dans le thread graphique
+        reader = QImageReader(file_path)
+        size = reader.size()
+        if size.isValid() and (size.width() > max_width or size.height() > max_height):
+            size.scale(max_width, max_height, Qt.AspectRatioMode.KeepAspectRatio)
+            reader.setScaledSize(size)
+        return QPixmap.fromImage(reader.read())
+    
+    def pdf_preview(self, file_path):
+        # Rendu basse résolution de la première page, suffisant pour l'aperçu
+        from pages import iter_pages
+        pages = iter_pages(file_path, {0}, dpi=72)
+        try:
+            _, _, page = next(pages)
+        finally:
+            pages.close()
+        page = page.convert("RGB")
+        image = QImage(page.tobytes(), page.width, page.height, 3 * page.width, QImage.Format_RGB888)
+        return QPixmap.fromImage(image.copy())
+    
+    def current_options(self):
+        # Options d'extraction réglées dans la fenêtre
         # Obtenir le code de langue du texte sélectionné
-        selected_lang = self.lang_combo.currentText()
-        lang_code = selected_lang.split("(")[1].split(")")[0]
+        from pipeline import OcrOptions, TEXT_HEIGHT
+        lang_code = self.lang_combo.currentData()
         
         # Obtenir les paramètres de prétraitement
         use_preprocessing = self.preproc_check.isChecked()
-        brightness = self.brightness_slider.value() if use_preprocessing else 0
-        contrast = self.contrast_slider.value() if use_preprocessing else 0
+        return OcrOptions(
+            lang_code,
+            use_preprocessing,
+            self.brightness_slider.value() if use_preprocessing else 0,
+            self.contrast_slider.value() if use_preprocessing else 0,
+            block_size=2 * self.block_slider.value() + 1,
+            threshold_c=self.threshold_c_slider.value(),
+            autotune=use_preprocessing and self.autotune_check.isChecked(),
+            fallback="parallel" if self.parallel_check.isChecked() else "serial",
+            tiled=self.tiled_check.isChecked(),
+            text_height=TEXT_HEIGHT if self.scale_check.isChecked() else 0,
+            deskew=self.deskew_check.isChecked()
+        )
+    
+    def extract_text(self):
+        if not self.current_image_path:
+            return
         
         # Désactiver les boutons pendant le traitement
         self.extract_btn.setEnabled(False)
         self.select_btn.setEnabled(False)
+        self.cancel_btn.setVisible(True)
         
         # Vider le texte précédent
         self.text_edit.clear()
+        self.last_results = None
         
         # Afficher un message d'attente
         self.text_edit.setPlaceholderText("Extraction en cours... Veuillez patienter...")
@@ -453,20 +932,67 @@ class OCRApp(QMainWindow):
             # Créer et démarrer le thread
             self.ocr_thread = OcrThread(
                 self.current_image_path, 
-                lang_code,
-                use_preprocessing,
-                brightness,
-                contrast
+                self.current_options(),
+                self.current_image,
+                list(self.image_label.regions)
             )
             self.ocr_thread.result_ready.connect(self.display_result)
+            self.ocr_thread.page_ready.connect(self.display_page)
+            self.ocr_thread.trace_ready.connect(self.display_trace)
+            self.ocr_thread.results_ready.connect(self.store_results)
             self.ocr_thread.progress_update.connect(self.update_progress)
             self.ocr_thread.start()
         except Exception as e:
             self.display_result(f"Erreur: {str(e)}\n\nVérifiez que Tesseract OCR est correctement installé sur votre système.")
     
+    def cancel_extraction(self):
+        if self.ocr_thread is not None:
+            self.ocr_thread.cancel()
+    
+    def show_job(self, job):
+        # Résultat d'un travail de la file d'attente, sélectionné dans la liste
+        self.text_edit.setText(job.text)
+        self.last_results = (job.path, job.results) if job.results else None
+        self.copy_btn.setEnabled(bool(job.text))
+        self.save_btn.setEnabled(bool(job.text))
+        self.display_trace(job.trace)
+    
+    def store_results(self, results):
+        self.last_results = (self.ocr_thread.image_path, results)
+    
     def update_progress(self, value):
         self.progress_bar.setValue(value)
     
+    def display_page(self, index, count, text):
+        # Remplissage progressif : chaque page s'affiche dès qu'elle est prête
+        self.text_edit.append(text)
+    
+    def display_trace(self, trace):
+        self.last_trace = trace
+        self.stats_view.setPlainText(trace.format_table())
+        self.export_trace_btn.setEnabled(True)
+        self.show_tuned(trace.info.get("tuned"))
+    
+    def show_tuned(self, tuned):
+        # Valeurs choisies par le réglage automatique, reportées sur les curseurs
+        if not tuned:
+            return
+        self.brightness_slider.setValue(tuned["brightness"])
+        self.contrast_slider.setValue(tuned["contrast"])
+        self.block_slider.setValue((tuned["block_size"] - 1) // 2)
+        self.threshold_c_slider.setValue(tuned["threshold_c"])
+    
+    def export_trace(self):
+        if self.last_trace is None:
+            return
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Exporter la trace", "trace.json",
+            "Fichiers JSON (*.json)"
+        )
+        if file_path:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(self.last_trace.to_json(indent=2))
+    
     def display_result(self, text):
         # Afficher le texte extrait
         self.text_edit.setPlaceholderText("Le texte extrait de l'image apparaîtra ici")
@@ -475,6 +1001,7 @@ class OCRApp(QMainWindow):
         # Réactiver les boutons
         self.extract_btn.setEnabled(True)
         self.select_btn.setEnabled(True)
+        self.cancel_btn.setVisible(False)
         self.copy_btn.setEnabled(bool(text))
         self.save_btn.setEnabled(bool(text))
         
@@ -498,15 +1025,30 @@ class OCRApp(QMainWindow):
         if not self.text_edit.toPlainText():
             return
             
+        # Les formats avec positions des mots ne sont proposés qu'après une extraction réussie
+        filters = ["Fichiers texte (*.txt)"]
+        if self.last_results is not None:
+            filters += [name_filter for _, name_filter in EXPORT_FILTERS]
+        
         file_dialog = QFileDialog()
-        file_path, _ = file_dialog.getSaveFileName(
+        file_path, selected_filter = file_dialog.getSaveFileName(
             self, "Enregistrer le texte", "", 
-            "Fichiers texte (*.txt)"
+            ";;".join(filters)
         )
         
         if file_path:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                f.write(self.text_edit.toPlainText())
+            output_format = next((name for name, name_filter in EXPORT_FILTERS if name_filter == selected_filter), "txt")
+            try:
+                if output_format == "txt":
+                    with open(file_path, 'w', encoding='utf-8') as f:
+                        f.write(self.text_edit.toPlainText())
+                else:
+                    from export import export_document
+                    source, results = self.last_results
+                    export_document(source, results, file_path, output_format)
+            except Exception as e:
+                QMessageBox.warning(self, "Erreur", f"Impossible d'enregistrer le fichier.\n\n{str(e)}")
+                return
             
             # Notification plus élégante
             msg = QMessageBox(self)
@@ -517,22 +1059,43 @@ class OCRApp(QMainWindow):
             msg.setStandardButtons(QMessageBox.Ok)
             msg.exec_()
 
+def print_startup_profile(trace):
+    # --profile-startup : étapes du démarrage dans l'ordre, avec leur début et leur durée
+    trace.finish()
+    print(f"Démarrage : fenêtre affichée à {trace.info['shown_ms']:.0f} ms, "
+          f"préchargement terminé à {trace.total_ms:.0f} ms", file=sys.stderr)
+    for entry in sorted(trace.to_dict()["stages"], key=lambda entry: entry["start_ms"]):
+        details = " ".join(f"{key}={value}" for key, value in entry.items()
+                           if key not in ("stage", "start_ms", "ms") and value is not None)
+        print(f"{entry['start_ms']:>9.1f} {entry['ms']:>9.1f} ms  {entry['stage']:<10} {details}", file=sys.stderr)
+
 if __name__ == "__main__":
-    # Vérifier et configurer Tesseract
+    # Modes sans interface : python main.py batch <dossier|motif> ... / bench ... / serve ... / watch ...
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from batch import main as batch_main
+        sys.exit(batch_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        from bench import main as bench_main
+        sys.exit(bench_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        from service import main as service_main
+        sys.exit(service_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == "watch":
+        from watch import main as watch_main
+        sys.exit(watch_main(sys.argv[2:]))
+    
+    # Tesseract est recherché après l'affichage de la fenêtre (StartupThread)
+    profile_startup = "--profile-startup" in sys.argv
+    if profile_startup:
+        sys.argv.remove("--profile-startup")
     try:
-        # Sur Windows, décommentez et adaptez cette ligne si nécessaire:
-        pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        
-        # Vérifier la version de Tesseract
-        try:
-            tesseract_version = pytesseract.get_tesseract_version()
-            print(f"Tesseract OCR version: {tesseract_version}")
-        except:
-            print("Avertissement: Impossible de détecter la version de Tesseract. Assurez-vous qu'il est correctement installé.")
-        
-        app = QApplication(sys.argv)
-        window = OCRApp()
-        window.show()
+        with STARTUP_TRACE.stage("app"):
+            app = QApplication(sys.argv)
+        with STARTUP_TRACE.stage("window"):
+            window = OCRApp()
+            window.show()
+        if profile_startup:
+            window.startup_thread.warmed_up.connect(lambda: print_startup_profile(STARTUP_TRACE))
         sys.exit(app.exec_())
     except Exception as e:
         print(f"Erreur au démarrage: {str(e)}")
@@ -0,0 +1,67 @@
+import tempfile
+
+import numpy as np
+
+# Mode mémoire bornée pour les très grandes images (plans, cartes, scans grand format) : la page
+# est lue en niveaux de gris bande par bande, chaque étape écrit dans un seul tableau de sortie,
+# et un tableau qui ne tient pas dans le budget est projeté depuis un fichier temporaire (le
+# système le garde sur disque au besoin). Tesseract ne reçoit que des blocs qui tiennent dans le
+# budget. Une page impossible à traiter ainsi est refusée avant d'être décodée.
+
+MB = 1024 * 1024
+
+# Taille visée des bandes traitées d'un coup
+STRIP_BYTES = 8 * MB
+
+# Mémoire de travail par pixel d'une image confiée d'un bloc à Tesseract (copie PNM, image
+# interne, binarisation) ou à l'analyse des composantes connexes (seuil, étiquettes sur 32 bits)
+WORK_BYTES_PER_PIXEL = 6
+
+# Tableaux pleine page présents en même temps : l'entrée et la sortie d'une étape
+STAGE_ARRAYS = 2
+
+
+class MemoryBudgetError(Exception):
+    pass
+
+
+def _megabytes(nbytes):
+    return f"{nbytes / MB:.0f} Mo"
+
+
+class MemoryBudget:
+    # Mémoire maximale pour le traitement d'une page, en octets
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def check(self, nbytes, what):
+        if nbytes > self.limit:
+            raise MemoryBudgetError(f"{what} demande {_megabytes(nbytes)}, "
+                                    f"au-delà du budget mémoire de {_megabytes(self.limit)}")
+
+    def allocate(self, shape, dtype=np.uint8):
+        # Tableau de sortie d'une étape : en mémoire s'il y tient avec l'entrée de l'étape,
+        # sinon projeté depuis un fichier temporaire, effacé dès que le tableau est libéré
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if nbytes * STAGE_ARRAYS <= self.limit:
+            return np.empty(shape, dtype)
+        with tempfile.TemporaryFile(prefix="ready-") as f:
+            return np.memmap(f, dtype=dtype, mode="w+", shape=shape)
+
+    def strip_rows(self, row_bytes):
+        # Lignes par bande : STRIP_BYTES, ou moins si le budget est très serré
+        return max(1, min(STRIP_BYTES, self.limit // 8) // max(1, row_bytes))
+
+    def work_pixels(self):
+        # Plus grande image confiée d'un bloc à Tesseract ou à l'analyse des caractères
+        return self.limit // WORK_BYTES_PER_PIXEL
+
+
+def memory_budget(megabytes):
+    # Budget réglé dans les options (Mo), ou None sans limite
+    return MemoryBudget(megabytes * MB) if megabytes else None
+
+
+def is_mapped(array):
+    return isinstance(array, np.memmap)
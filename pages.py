@@ -0,0 +1,323 @@
+import os
+import queue
+import threading
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from memory import MemoryBudgetError
+from preprocess import Decode, Grayscale
+
+# Lecture page par page des documents multipages (TIFF, PDF) : une seule page décodée à la fois,
+# et un préchargement borné pour enchaîner décodage, prétraitement et OCR en parallèle.
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+try:
+    import tifffile
+except ImportError:
+    tifffile = None
+
+# Résolution de rendu des PDF
+PDF_DPI = 300
+
+# Séparateur de pages dans le texte complet (celui de Tesseract en sortie texte)
+PAGE_SEPARATOR = "\f"
+
+
+def format_page(index, count, text):
+    # Texte d'une page tel qu'affiché : un en-tête par page pour les documents multipages
+    if count == 1:
+        return text
+    return f"--- Page {index + 1}/{count} ---\n{text.strip()}\n"
+
+
+def is_pdf(path):
+    return path.lower().endswith(".pdf")
+
+
+# Signatures des fichiers TIFF et BigTIFF, pour les données reçues sans nom de fichier
+TIFF_SIGNATURES = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+
+def is_tiff(path):
+    return path.lower().endswith((".tif", ".tiff"))
+
+
+def _too_large(path):
+    return MemoryBudgetError(f"Image trop grande pour être décodée d'un bloc : {os.path.basename(path)}. "
+                             "Le mode mémoire bornée (--memory-limit) lit les TIFF de cette taille "
+                             "avec tifffile (pip install tifffile).")
+
+
+def open_image(path):
+    # Image.open, avec une erreur explicite au-delà de la limite de sécurité de PIL (bombe de décompression)
+    try:
+        return Image.open(path)
+    except Image.DecompressionBombError:
+        raise _too_large(path) from None
+
+
+def _open_pdf(path):
+    if pdfium is None:
+        raise RuntimeError("La lecture des PDF nécessite le module pypdfium2 (pip install pypdfium2).")
+    return pdfium.PdfDocument(path)
+
+
+def page_count(path):
+    if is_pdf(path):
+        pdf = _open_pdf(path)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+    try:
+        with Image.open(path) as img:
+            return getattr(img, "n_frames", 1)
+    except Image.DecompressionBombError:
+        if tifffile is None or not is_tiff(path):
+            raise _too_large(path) from None
+    with tifffile.TiffFile(path) as tif:
+        return len(tif.pages)
+
+
+def render_pdf_page(pdf, index, dpi=PDF_DPI):
+    page = pdf[index]
+    try:
+        bitmap = page.render(scale=dpi / 72.0)
+        return bitmap.to_pil()
+    finally:
+        page.close()
+
+
+def iter_pages(path, wanted=None, dpi=PDF_DPI):
+    # Génère (index, nombre de pages, image PIL) ; seules les pages de `wanted` sont décodées
+    if is_pdf(path):
+        pdf = _open_pdf(path)
+        try:
+            count = len(pdf)
+            for index in range(count):
+                if wanted is None or index in wanted:
+                    yield index, count, render_pdf_page(pdf, index, dpi)
+        finally:
+            pdf.close()
+        return
+
+    img = open_image(path)
+    count = getattr(img, "n_frames", 1)
+    if count == 1:
+        if wanted is None or 0 in wanted:
+            img.load()
+            yield 0, 1, img
+        return
+
+    with img:
+        for index in range(count):
+            if wanted is not None and index not in wanted:
+                continue
+            img.seek(index)
+            # copy() décode la trame courante et la détache du fichier avant de passer à la suivante
+            yield index, count, img.copy()
+
+
+def _decoded_bytes(img):
+    # Taille de l'image une fois décodée par PIL
+    depth = 4 if img.mode in ("I", "F") else 2 if img.mode.startswith("I;16") else 1
+    return img.width * img.height * len(img.getbands()) * depth
+
+
+def _gray_strip(strip):
+    return Grayscale()(Decode()(strip))
+
+
+def gray_image(image, budget, convert=_gray_strip):
+    # Page (image PIL ou tableau, éventuellement projeté) en niveaux de gris, convertie bande par
+    # bande dans un tableau alloué par `budget` (MemoryBudget) : jamais de copie couleur entière
+    if isinstance(image, np.ndarray):
+        height, width = image.shape[:2]
+        row_bytes = image[:1].nbytes
+    else:
+        width, height = image.size
+        row_bytes = _decoded_bytes(image) // max(1, height)
+    out = budget.allocate((height, width))
+    rows = budget.strip_rows(row_bytes)
+    for top in range(0, height, rows):
+        bottom = min(height, top + rows)
+        strip = image[top:bottom] if isinstance(image, np.ndarray) else image.crop((0, top, width, bottom))
+        out[top:bottom] = convert(strip)
+    return out
+
+
+def _tiff_readable(page):
+    # Codages convertis bande par bande depuis tifffile ; les autres (palette, CMJN, plans séparés)
+    # passent par PIL
+    photometric = int(page.photometric)
+    return (photometric in (0, 1, 2) and page.dtype in (np.bool_, np.uint8, np.uint16)
+            and (page.samplesperpixel == 1 or int(page.planarconfig) == 1))
+
+
+def _tiff_gray_strip(strip, photometric):
+    if strip.dtype == np.bool_:
+        strip = strip.astype(np.uint8) * 255
+    elif strip.dtype == np.uint16:
+        strip = (strip >> 8).astype(np.uint8)
+    if strip.ndim == 3:
+        strip = cv2.cvtColor(np.ascontiguousarray(strip[..., :3]), cv2.COLOR_RGB2GRAY)
+    # 0 : blanc quand il n'y a pas d'encre (MinIsWhite, fréquent en fax et en bitonal)
+    if photometric == 0:
+        strip = 255 - strip
+    return strip
+
+
+def _pil_gray_page(path, index, budget):
+    # Une page ouverte à part, libérée (fermée) dès sa conversion en niveaux de gris
+    with open_image(path) as img:
+        img.seek(index)
+        budget.check(_decoded_bytes(img), f"Le décodage de la page {index + 1} ({img.width} x {img.height} pixels)")
+        return gray_image(img, budget)
+
+
+def _tiff_gray_page(tif, path, index, budget):
+    page = tif.pages[index]
+    if _tiff_readable(page):
+        try:
+            # Directement projetée depuis le fichier si elle n'est pas compressée, sinon décodée
+            # dans un fichier temporaire projeté
+            data = page.asarray(out="memmap")
+        except ValueError:
+            # Compression que tifffile ne sait pas décoder sans imagecodecs
+            data = None
+        if data is not None:
+            photometric = int(page.photometric)
+            return gray_image(data, budget, lambda strip: _tiff_gray_strip(strip, photometric))
+    return _pil_gray_page(path, index, budget)
+
+
+def _render_gray(pdf, index, dpi, budget):
+    page = pdf[index]
+    try:
+        width, height = page.get_size()
+        size = (round(width * dpi / 72.0), round(height * dpi / 72.0))
+        budget.check(size[0] * size[1], f"Le rendu de la page {index + 1} à {dpi} dpi")
+        pixels = page.render(scale=dpi / 72.0, grayscale=True).to_numpy()
+        gray = budget.allocate(pixels.shape[:2])
+        gray[:] = pixels.reshape(gray.shape)
+        return gray
+    finally:
+        page.close()
+
+
+def iter_gray_pages(path, wanted=None, budget=None, dpi=PDF_DPI):
+    # Comme iter_pages, en mode mémoire bornée (`budget` : MemoryBudget) : chaque page est lue
+    # directement en niveaux de gris, bande par bande. Avec tifffile, les TIFF sont lus depuis le
+    # fichier projeté en mémoire, sans la limite de taille de PIL ; les autres images sont décodées
+    # par PIL une fois vérifié que la page décodée tient dans le budget
+    if is_pdf(path):
+        pdf = _open_pdf(path)
+        try:
+            count = len(pdf)
+            for index in range(count):
+                if wanted is None or index in wanted:
+                    yield index, count, _render_gray(pdf, index, dpi, budget)
+        finally:
+            pdf.close()
+        return
+
+    if tifffile is not None and is_tiff(path):
+        with tifffile.TiffFile(path) as tif:
+            count = len(tif.pages)
+            for index in range(count):
+                if wanted is None or index in wanted:
+                    yield index, count, _tiff_gray_page(tif, path, index, budget)
+        return
+
+    count = page_count(path)
+    for index in range(count):
+        if wanted is None or index in wanted:
+            yield index, count, _pil_gray_page(path, index, budget)
+
+
+class SharedImage:
+    # Image décodée une seule fois en pleine résolution, puis partagée entre l'aperçu du
+    # prétraitement et les extractions successives (changer un réglage ne redécode pas le fichier)
+
+    def __init__(self, path):
+        self.path = path
+        self._image = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._image is None:
+                image = open_image(self.path)
+                image.load()
+                self._image = image
+            return self._image
+
+    def preload(self):
+        # Décodage anticipé en arrière-plan, pendant que l'utilisateur règle les options
+        threading.Thread(target=self._preload, daemon=True).start()
+
+    def _preload(self):
+        try:
+            self.get()
+        except Exception:
+            # L'erreur sera signalée au moment de l'extraction
+            pass
+
+
+class _End:
+    pass
+
+
+class Prefetch:
+    # Consomme un itérable dans un thread d'arrière-plan en gardant au plus `depth` éléments
+    # d'avance. Les exceptions sont relancées côté consommateur.
+
+    def __init__(self, iterable, depth=1):
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._fill, args=(iterable,), daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _fill(self, iterable):
+        try:
+            for item in iterable:
+                if not self._put(item):
+                    return
+        except BaseException as e:
+            self._put(e)
+            return
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None and self._stop.is_set():
+                close()
+        self._put(_End)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _End:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
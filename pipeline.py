@@ -0,0 +1,474 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, asdict, replace
+
+import cv2
+
+from autotune import autotune_options
+from cache import cache_key, hash_file
+from engine import OcrCancelled, cancellable_engine, check_cancel, get_engine
+from geometry import MIN_SKEW, detect_geometry, rotate_image
+from language import AUTO_LANG, detect_language, installed_candidates, probe_language
+from layout import TILED_MIN_PIXELS, glyph_height, recognize_tiled
+from memory import is_mapped, memory_budget
+from pages import PAGE_SEPARATOR, Prefetch, gray_image, iter_gray_pages, iter_pages, page_count
+from preprocess import Decode, Grayscale, build_pipeline
+from result import PageResult
+from timings import JobTrace, stage
+
+# Pipeline OCR indépendant de l'interface : utilisé par OcrThread et par le mode batch.
+# Chaque page est reconnue en une seule passe qui donne le texte et les mots positionnés (PageResult)
+
+NO_TEXT_MESSAGE = ("Aucun texte n'a pu être extrait de cette image. Essayez d'ajuster les paramètres "
+                   "de prétraitement ou utilisez une image avec un texte plus clair.")
+
+# Stratégies quand la première passe ne renvoie rien :
+#  - "serial"   : PSM 6 puis PSM 3, l'un après l'autre (comportement historique)
+#  - "parallel" : toutes les configurations candidates en même temps, la plus confiante l'emporte
+FALLBACK_MODES = ("serial", "parallel")
+
+# Confiance moyenne (0-100) à partir de laquelle un candidat est retenu sans attendre les autres
+CONFIDENT_SCORE = 85
+
+# Hauteur de texte visée (hauteur dominante des glyphes, en pixels) : Tesseract est le plus précis
+# vers 20-30 px, mais lit bien de 10 à 40 px. Seul un texte hors de cette plage est rééchantillonné
+# (facteurs de SCALE_TOLERANCE, soit 10-40 px pour la cible de 24 px) : agrandir une capture d'écran
+# lisible coûte plus de temps qu'il n'apporte. L'agrandissement est plafonné
+TEXT_HEIGHT = 24
+SCALE_TOLERANCE = (0.6, 2.4)
+MAX_UPSCALE = 4.0
+
+
+@dataclass
+class OcrOptions:
+    lang: str = "fra"
+    use_preprocessing: bool = True
+    brightness: int = 0
+    contrast: int = 0
+    engine: str = "auto"
+    fallback: str = "serial"
+    tiled: bool = False
+    tile_workers: int = 0
+    # 0 désactive la normalisation de la taille du texte
+    text_height: int = TEXT_HEIGHT
+    # Redresser les pages tournées ou inclinées avant la reconnaissance
+    deskew: bool = True
+    # Mémoire maximale pour traiter une page, en Mo (mode mémoire bornée) ; 0 : sans limite
+    memory_limit: int = 0
+    # Seuillage adaptatif : taille du voisinage (impaire) et constante soustraite à sa moyenne
+    block_size: int = 11
+    threshold_c: int = 2
+    # Régler luminosité, contraste et seuillage d'après un extrait de la première page
+    autotune: bool = False
+
+    def to_dict(self):
+        return asdict(self)
+
+    def cache_params(self):
+        # Paramètres qui influencent le texte produit ; le moteur est identifié par sa version
+        params = self.to_dict()
+        del params["engine"]
+        del params["tile_workers"]
+        # Réglage automatique : les valeurs retenues ne dépendent que de l'image et du moteur
+        if self.autotune:
+            for name in ("brightness", "contrast", "block_size", "threshold_c"):
+                del params[name]
+        return params
+
+
+def _image_bytes(image):
+    # Volume de pixels transmis à l'étape suivante
+    if hasattr(image, "nbytes"):
+        return image.nbytes
+    return image.width * image.height * len(image.getbands())
+
+
+def _image_mode(image):
+    # Les pages lues en mode mémoire bornée sont déjà des tableaux en niveaux de gris
+    return "L" if hasattr(image, "shape") else image.mode
+
+
+def _image_size(image):
+    if hasattr(image, "shape"):
+        return [image.shape[1], image.shape[0]]
+    return list(image.size)
+
+
+def scale_factor(height, target):
+    # Facteur de rééchantillonnage pour ramener des glyphes de `height` pixels à `target`
+    if not height or not target:
+        return 1.0
+    factor = target / height
+    if SCALE_TOLERANCE[0] <= factor <= SCALE_TOLERANCE[1]:
+        return 1.0
+    return min(factor, MAX_UPSCALE)
+
+
+def correct_geometry(pil_img, options, trace=None, page=0, cancel=None):
+    # Remet la page à l'endroit et redresse son inclinaison, en une seule rotation pleine résolution.
+    # Renvoie l'image et la matrice affine qui ramène ses coordonnées à celles de la page d'origine
+    # (None si la page n'a pas été tournée)
+    if not options.deskew:
+        return pil_img, None
+    with stage(trace, "deskew", page=page, size=_image_size(pil_img)) as entry:
+        image = Decode()(pil_img)
+        rotation, skew, method = detect_geometry(Grayscale()(image), get_engine(options.engine), cancel)
+        if abs(skew) < MIN_SKEW:
+            skew = 0.0
+        entry.update(rotation=rotation, skew=round(skew, 2), orientation=method)
+        if not rotation and not skew:
+            return image, None
+        budget = memory_budget(options.memory_limit)
+        image, to_source = rotate_image(image, rotation, skew, budget.allocate if budget is not None else None)
+        entry.update(size_out=_image_size(image), mapped=is_mapped(image))
+    return image, to_source
+
+
+def normalize_scale(pil_img, options, trace=None, page=0):
+    # Rééchantillonne la page pour que le texte ait la hauteur visée : les petites captures
+    # d'écran sont agrandies, les scans à très haute résolution réduits. L'image est renvoyée
+    # décodée (tableau numpy), ce qui évite de la redécoder au prétraitement
+    if not options.text_height:
+        return pil_img
+    with stage(trace, "scale", page=page, size=_image_size(pil_img)) as entry:
+        image = Decode()(pil_img)
+        budget = memory_budget(options.memory_limit)
+        height = glyph_height(Grayscale()(image), budget.work_pixels() if budget is not None else None)
+        factor = scale_factor(height, options.text_height)
+        entry.update(glyph_height=round(height, 1) if height else None, factor=round(factor, 3))
+        if factor != 1.0:
+            size = (max(1, round(image.shape[1] * factor)), max(1, round(image.shape[0] * factor)))
+            out = budget.allocate((size[1], size[0]) + image.shape[2:]) if budget is not None else None
+            image = cv2.resize(image, size, dst=out,
+                               interpolation=cv2.INTER_AREA if factor < 1 else cv2.INTER_CUBIC)
+            entry.update(size_out=list(size), mapped=is_mapped(image))
+    return image
+
+
+def preprocess(pil_img, options, trace=None, page=0):
+    # Le tableau binarisé est transmis tel quel au moteur, sans repasser par une image PIL
+    with stage(trace, "preprocess", page=page) as entry:
+        steps = [] if trace is not None else None
+        budget = memory_budget(options.memory_limit)
+        if budget is None:
+            processed = build_pipeline(options).run(pil_img, steps)
+        else:
+            # Par bandes, dans un tableau à part : l'image d'entrée reste disponible pour les essais
+            image = Decode()(pil_img)
+            processed = build_pipeline(options).run_strips(image, budget.allocate(image.shape[:2]),
+                                                           budget.strip_rows(image[:1].nbytes), steps)
+            entry["mapped"] = is_mapped(processed)
+        entry.update(steps=steps, bytes_out=processed.nbytes)
+    return processed
+
+
+def _fallback_candidates(pil_img, processed):
+    # Les essais portent en priorité sur l'image prétraitée ; l'image brute reste candidate
+    # au cas où le prétraitement aurait effacé le texte
+    if processed is None:
+        return [(pil_img, None, None), (pil_img, 6, None)]
+    return [(processed, None, None), (processed, 6, None), (pil_img, 3, 3)]
+
+
+class _Cancellation:
+    # Annulation propre à un calcul (candidats devenus inutiles), levée aussi quand l'appelant
+    # annule tout le traitement
+    def __init__(self, parent=None):
+        self.parent = parent
+        self._event = threading.Event()
+
+    def set(self):
+        self._event.set()
+
+    def is_set(self):
+        return self._event.is_set() or (self.parent is not None and self.parent.is_set())
+
+
+def _recognize_page(engine, image, lang, psm=None, oem=None, cancel=None):
+    width, height = _image_size(image)
+    return PageResult.from_tsv(engine.image_to_tsv(image, lang, psm, oem, cancel), width, height)
+
+
+def recognize_speculative(engine, candidates, lang, report=None, cancel=None):
+    # Lance toutes les configurations en parallèle, garde le texte le plus confiant et annule
+    # les autres dès qu'un résultat suffisamment sûr arrive. `report` reçoit le candidat retenu.
+    # Les perdants doivent vraiment s'arrêter : ils passent par un moteur interruptible
+    outer = cancel
+    cancel = _Cancellation(outer)
+    engine = cancellable_engine(engine)
+    best, best_score, best_index = None, -1.0, None
+    error = None
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    futures = {executor.submit(_recognize_page, engine, image, lang, psm, oem, cancel): index
+               for index, (image, psm, oem) in enumerate(candidates)}
+    try:
+        for future in as_completed(futures):
+            try:
+                page = future.result()
+            except OcrCancelled:
+                continue
+            except Exception as e:
+                # Un candidat en échec n'empêche pas les autres de répondre
+                error = error or e
+                continue
+            score = page.mean_confidence
+            if page.text.strip() and score > best_score:
+                best, best_score, best_index = page, score, futures[future]
+            if best_score >= CONFIDENT_SCORE:
+                break
+    finally:
+        cancel.set()
+        # Sans attendre les candidats perdants, qui s'arrêtent d'eux-mêmes
+        executor.shutdown(wait=False, cancel_futures=True)
+    check_cancel(outer)
+    if report is not None and best_index is not None:
+        _, psm, oem = candidates[best_index]
+        report.update(winner={"psm": psm, "oem": oem}, confidence=round(best_score, 1))
+    if best is None and error is not None:
+        raise error
+    if best is None:
+        width, height = _image_size(candidates[0][0])
+        return PageResult(width, height)
+    return best
+
+
+def _fits(pil_img, options, copies=1):
+    # La page peut-elle être confiée entière à Tesseract (`copies` fois en même temps) sans
+    # dépasser le budget mémoire ?
+    budget = memory_budget(options.memory_limit)
+    width, height = _image_size(pil_img)
+    return budget is None or width * height * copies <= budget.work_pixels()
+
+
+def _use_tiles(pil_img, options):
+    width, height = _image_size(pil_img)
+    # En mode mémoire bornée, une page trop grande pour Tesseract est toujours découpée
+    return (options.tiled and width * height >= TILED_MIN_PIXELS) or not _fits(pil_img, options)
+
+
+def _recognize_first_pass(engine, pil_img, processed, options, trace=None, page=0, cancel=None):
+    image = processed if processed is not None else pil_img
+    with stage(trace, "recognize", page=page, engine=engine.name, size=_image_size(image),
+               bytes_in=_image_bytes(image)) as entry:
+        # Mode tuilé : les grandes pages sont découpées en blocs reconnus en parallèle
+        if _use_tiles(pil_img, options):
+            entry["tiled"] = True
+            return recognize_tiled(engine, image if processed is not None else Decode()(pil_img),
+                                   options.lang, options.tile_workers, cancel, memory_budget(options.memory_limit))
+        return _recognize_page(engine, image, options.lang, cancel=cancel)
+
+
+def _fallback(engine, pil_img, options, psm, oem, trace, page, cancel=None):
+    if trace is not None:
+        trace.plan("fallback")
+        trace.note(fallback=f"psm {psm}")
+    with stage(trace, "fallback", page=page, psm=psm, oem=oem, bytes_in=_image_bytes(pil_img)):
+        return _recognize_page(engine, pil_img, options.lang, psm, oem, cancel)
+
+
+def resolve_language(engine, pil_img, processed, trace=None, page=0, cancel=None):
+    # Langues retenues en mode automatique, d'après une passe rapide sur un extrait de la page
+    with stage(trace, "language", page=page, probe=probe_language(engine.languages())) as entry:
+        lang, text = detect_language(engine, processed if processed is not None else Decode()(pil_img), cancel)
+        entry.update(detected=lang, chars=len(text.strip()))
+    return lang
+
+
+def recognize(pil_img, options, trace=None, processed=None, page=0, cancel=None):
+    # `processed` permet de fournir une image déjà prétraitée (traitement des pages en chaîne).
+    # `cancel` (threading.Event) interrompt la reconnaissance en cours avec OcrCancelled.
+    # Renvoie un PageResult dont les coordonnées se rapportent à l'image reconnue
+    engine = get_engine(options.engine)
+
+    # Prétraitement optionnel
+    if options.use_preprocessing and processed is None:
+        processed = preprocess(pil_img, options, trace, page)
+
+    if options.lang == AUTO_LANG:
+        options = replace(options, lang=resolve_language(engine, pil_img, processed, trace, page, cancel))
+
+    # Les essais en parallèle confient la page entière à plusieurs Tesseract à la fois
+    if options.fallback == "parallel" and _fits(pil_img, options, 3):
+        result = None
+        if _use_tiles(pil_img, options):
+            result = _recognize_first_pass(engine, pil_img, processed, options, trace, page, cancel)
+        if result is None or not result.text.strip():
+            candidates = _fallback_candidates(pil_img, processed)
+            with stage(trace, "recognize", page=page, engine=engine.name, mode="parallel",
+                       candidates=len(candidates)) as entry:
+                result = recognize_speculative(engine, candidates, options.lang, entry, cancel)
+        return result
+
+    result = _recognize_first_pass(engine, pil_img, processed, options, trace, page, cancel)
+
+    # Une page trop grande pour le budget mémoire n'est lue que par blocs
+    if not _fits(pil_img, options):
+        return result
+
+    # Si le texte est vide, essayer avec d'autres configurations
+    if not result.text.strip():
+        # Essayer PSM 6 (block de texte unique)
+        result = _fallback(engine, pil_img, options, 6, None, trace, page, cancel)
+
+    # Si toujours vide, essayer avec PSM 3 (détection automatique complète)
+    if not result.text.strip():
+        result = _fallback(engine, pil_img, options, 3, 3, trace, page, cancel)
+
+    return result
+
+
+def language_cache_key(content_hash, engine_version, installed=None):
+    # Langue détectée pour un document, gardée dans le cache des résultats ; elle dépend des
+    # modèles installés (`installed`)
+    return cache_key(content_hash, {"language": installed_candidates(installed), "probe": probe_language(installed)},
+                     engine_version)
+
+
+def ocr_results(image_path, options, progress=None, cache=None, image=None, trace=None, cancel=None):
+    # Génère (index, nombre de pages, PageResult) page par page, dès que chaque page est prête ;
+    # les coordonnées des mots se rapportent à la page source.
+    # Décodage, prétraitement et OCR travaillent en chaîne sur des pages différentes, avec au plus
+    # une page d'avance à chaque étape pour borner la mémoire. En mode mémoire bornée
+    # (options.memory_limit), les pages sont lues en niveaux de gris par bandes et traitées une à une.
+    # `image` : image d'une seule page déjà décodée (SharedImage), réutilisée sans relire le fichier
+    # `trace` : JobTrace à remplir ; l'avancement (`progress`, 0-100) est calculé à partir des étapes
+    # `cancel` : threading.Event qui arrête le traitement (OcrCancelled) et tue le processus tesseract en cours
+    if trace is None:
+        trace = JobTrace(image_path, progress)
+    elif progress is not None:
+        trace.progress = progress
+    count = 1 if image is not None else page_count(image_path)
+    page_stages = ["load"]
+    if options.deskew:
+        page_stages.append("deskew")
+    if options.text_height:
+        page_stages.append("scale")
+    if options.use_preprocessing:
+        page_stages.append("preprocess")
+    page_stages.append("recognize")
+    trace.note(pages=count, engine=options.engine, lang=options.lang)
+    trace.plan(*page_stages, repeat=count)
+    tune = options.autotune and options.use_preprocessing
+
+    cached = {}
+    keys = {}
+    content_hash = None
+    # Mode automatique : la langue est détectée une seule fois par document (sur la première page
+    # à reconnaître) et la décision est gardée en cache avec les résultats
+    detected = None
+    language_key = None
+    if cache is not None:
+        trace.plan("cache")
+        with trace.stage("cache") as entry:
+            engine = get_engine(options.engine)
+            content_hash = hash_file(image_path)
+            engine_version = f"{engine.name} {engine.version()}"
+            for index in range(count):
+                keys[index] = cache_key(content_hash, dict(options.cache_params(), page=index), engine_version)
+                tsv = cache.get(keys[index])
+                if tsv is not None:
+                    cached[index] = PageResult.from_tsv(tsv)
+            if options.lang == AUTO_LANG:
+                language_key = language_cache_key(content_hash, engine_version, engine.languages())
+                detected = cache.get(language_key)
+            entry["hits"] = len(cached)
+        trace.note(cache_hits=len(cached))
+        trace.complete(*page_stages, repeat=len(cached))
+
+    wanted = set(range(count)) - set(cached)
+    if tune and wanted:
+        trace.plan("autotune")
+    if options.lang == AUTO_LANG:
+        if detected is not None:
+            trace.note(lang_detected=detected)
+        elif wanted:
+            trace.plan("language")
+
+    budget = memory_budget(options.memory_limit)
+    if budget is not None:
+        trace.note(memory_limit=options.memory_limit)
+
+    def load_shared():
+        with trace.stage("load", page=0, shared=True) as entry:
+            pil_img = image.get()
+            if budget is not None:
+                pil_img = gray_image(pil_img, budget)
+            entry.update(size=_image_size(pil_img), mode=_image_mode(pil_img), bytes=_image_bytes(pil_img))
+        return 0, pil_img
+
+    def load(pages):
+        with trace.stage("load") as entry:
+            index, _, pil_img = next(pages)
+            entry.update(page=index, size=_image_size(pil_img), mode=_image_mode(pil_img),
+                         bytes=_image_bytes(pil_img))
+            if budget is not None:
+                entry["mapped"] = is_mapped(pil_img)
+        return index, pil_img
+
+    def loaded():
+        # Les pages sont produites par des fonctions : le générateur n'en garde aucune référence
+        # pendant qu'elles sont traitées
+        if image is not None:
+            yield load_shared()
+            return
+        pages = iter_pages(image_path, wanted) if budget is None else iter_gray_pages(image_path, wanted, budget)
+        try:
+            for _ in range(len(wanted)):
+                yield load(pages)
+        finally:
+            pages.close()
+
+    def ahead(iterable):
+        # Une page d'avance par étape, sauf en mode mémoire bornée : une seule page à la fois
+        return Prefetch(iterable, 1) if budget is None else iterable
+
+    def prepared():
+        # Réglage automatique : une seule recherche par document, sur la première page à reconnaître
+        tuned = None
+        for index, pil_img in ahead(loaded()):
+            source_size = _image_size(pil_img)
+            pil_img, to_source = correct_geometry(pil_img, options, trace, index, cancel)
+            corrected_size = _image_size(pil_img)
+            pil_img = normalize_scale(pil_img, options, trace, index)
+            if tune and tuned is None:
+                tuned = autotune_options(pil_img, options, image_path, cache, trace, index, cancel, content_hash)
+            page_options = tuned or options
+            processed = preprocess(pil_img, page_options, trace, index) if options.use_preprocessing else None
+            yield index, page_options, pil_img, processed, source_size, corrected_size, to_source
+            # Page libérée avant le chargement de la suivante
+            pil_img = processed = None
+
+    pending = iter(ahead(prepared())) if wanted else iter(())
+    for index in range(count):
+        if index in cached:
+            yield index, count, cached[index]
+            continue
+        check_cancel(cancel)
+        _, page_options, pil_img, processed, source_size, corrected_size, to_source = next(pending)
+        if options.lang == AUTO_LANG:
+            if detected is None:
+                detected = resolve_language(get_engine(options.engine), pil_img, processed, trace, index, cancel)
+                trace.note(lang_detected=detected)
+                if cache is not None:
+                    cache.put(language_key, detected)
+            page_options = replace(page_options, lang=detected)
+        result = recognize(pil_img, page_options, trace, processed, index, cancel).rescaled(*corrected_size)
+        pil_img = processed = None
+        if to_source is not None:
+            # Mots reconnus sur la page redressée, replacés sur la page d'origine
+            result = result.transformed(to_source, *source_size)
+        if cache is not None:
+            cache.put(keys[index], result.to_tsv())
+        yield index, count, result
+    trace.finish()
+
+
+def ocr_pages(image_path, options, progress=None, cache=None, image=None, trace=None, cancel=None):
+    # Comme ocr_results, mais ne génère que le texte de chaque page
+    for index, count, result in ocr_results(image_path, options, progress, cache, image, trace, cancel):
+        yield index, count, result.text
+
+
+def ocr_file(image_path, options, progress=None, cache=None, trace=None):
+    # Texte complet du document, pages séparées par un saut de page
+    return PAGE_SEPARATOR.join(text for _, _, text in ocr_pages(image_path, options, progress, cache, trace=trace))
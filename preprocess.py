@@ -0,0 +1,197 @@
+import time
+from functools import lru_cache
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Prétraitement déclaratif : une suite d'étapes appliquées à un tableau numpy, en place dès que
+# possible pour éviter les copies pleine résolution. Partagé par l'interface et le mode batch.
+
+
+class Stage:
+    name = None
+    # Lignes voisines lues de part et d'autre de chaque ligne produite (traitement par bandes)
+    halo = 0
+    # L'étape écrit son résultat dans le tableau reçu
+    in_place = False
+
+    def __call__(self, image):
+        raise NotImplementedError
+
+    def __repr__(self):
+        params = ", ".join(f"{key}={value!r}" for key, value in vars(self).items())
+        return f"{type(self).__name__}({params})"
+
+
+class Decode(Stage):
+    # Image PIL -> tableau uint8 (2D en gris, 3D en RGB) avec une seule copie des pixels.
+    # La transparence est aplatie sur fond blanc pour ne pas noircir le texte sur fond transparent
+    name = "decode"
+
+    def __call__(self, image):
+        if isinstance(image, np.ndarray):
+            return image
+        mode = image.mode
+        if mode == "P":
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            mode = image.mode
+        if mode in ("RGBA", "LA", "PA"):
+            background = Image.new("RGB" if mode == "RGBA" else "L", image.size, "white")
+            background.paste(image.convert(background.mode), mask=image.getchannel("A"))
+            image = background
+        elif mode == "1":
+            image = image.convert("L")
+        elif mode.startswith("I;16"):
+            return (np.array(image, dtype=np.uint16) >> 8).astype(np.uint8)
+        elif mode in ("I", "F"):
+            return cv2.normalize(np.array(image), None, 0, 255, cv2.NORM_MINMAX, cv2.CV_8U)
+        elif mode not in ("L", "RGB"):
+            image = image.convert("RGB")
+        return np.array(image)
+
+
+class Grayscale(Stage):
+    name = "grayscale"
+
+    def __call__(self, image):
+        if image.ndim == 2:
+            return image
+        return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+
+@lru_cache(maxsize=64)
+def brightness_contrast_lut(brightness, contrast):
+    # Même formule que convertScaleAbs(alpha=contrast/50+1, beta=brightness), précalculée sur 256 valeurs
+    alpha = (contrast / 50.0) + 1
+    values = np.abs(np.arange(256, dtype=np.float32) * alpha + brightness)
+    lut = np.clip(np.rint(values), 0, 255).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+
+class BrightnessContrast(Stage):
+    # Appliqué après le passage en gris : une seule table de correspondance sur un seul canal
+    name = "brightness_contrast"
+    in_place = True
+
+    def __init__(self, brightness=0, contrast=0):
+        self.brightness = brightness
+        self.contrast = contrast
+
+    def __call__(self, image):
+        if self.brightness == 0 and self.contrast == 0:
+            return image
+        return cv2.LUT(image, brightness_contrast_lut(self.brightness, self.contrast), dst=image)
+
+
+class AdaptiveThreshold(Stage):
+    name = "threshold"
+    in_place = True
+
+    def __init__(self, block_size=11, c=2):
+        self.block_size = block_size
+        self.c = c
+        self.halo = block_size // 2
+
+    def __call__(self, image):
+        return cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY,
+                                     self.block_size, self.c, dst=image)
+
+
+class Denoise(Stage):
+    # Ouverture morphologique ; un noyau 1x1 ne change rien et n'est donc pas exécuté
+    name = "denoise"
+    in_place = True
+
+    def __init__(self, kernel_size=1):
+        self.kernel_size = kernel_size
+        # Érosion puis dilatation
+        self.halo = 2 * (kernel_size // 2)
+
+    def __call__(self, image):
+        if self.kernel_size <= 1:
+            return image
+        kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (self.kernel_size, self.kernel_size))
+        return cv2.morphologyEx(image, cv2.MORPH_OPEN, kernel, dst=image)
+
+
+class Pipeline:
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    def __repr__(self):
+        return f"Pipeline({self.stages!r})"
+
+    def run(self, image, timings=None):
+        # Chaque résultat intermédiaire est libéré dès que l'étape suivante a produit le sien.
+        # Le tableau reçu n'est jamais modifié : la première étape en place qui le rencontre
+        # (image déjà décodée en gris) travaille sur une copie, et l'image brute reste intacte
+        # pour les essais de secours. Si `timings` est une liste, la durée de chaque étape y est ajoutée
+        source = image
+        for stage in self.stages:
+            if stage.in_place and image is source:
+                image = image.copy()
+            if timings is None:
+                image = stage(image)
+                continue
+            start = time.monotonic()
+            image = stage(image)
+            timings.append({"step": stage.name, "ms": round((time.monotonic() - start) * 1000, 3)})
+        return image
+
+    def run_strips(self, image, out, rows, timings=None):
+        # Même traitement, bande par bande de `rows` lignes écrites dans `out` (mode mémoire bornée).
+        # Chaque bande est lue avec assez de lignes voisines pour que les étapes à voisinage
+        # (seuillage adaptatif, ouverture) donnent exactement le résultat d'un passage unique
+        halo = sum(stage.halo for stage in self.stages)
+        height = image.shape[0]
+        spent = {stage.name: 0.0 for stage in self.stages}
+        for top in range(0, height, rows):
+            bottom = min(height, top + rows)
+            low, high = max(0, top - halo), min(height, bottom + halo)
+            # Copie de la bande : les étapes travaillent en place
+            strip = np.array(image[low:high])
+            for stage in self.stages:
+                start = time.monotonic()
+                strip = stage(strip)
+                spent[stage.name] += time.monotonic() - start
+            out[top:bottom] = strip[top - low:bottom - low]
+        if timings is not None:
+            timings.extend({"step": name, "ms": round(seconds * 1000, 3)} for name, seconds in spent.items())
+        return out
+
+
+def make_proxy(pil_img, max_width, max_height):
+    # Version réduite en niveaux de gris pour l'aperçu, ramenée à la taille d'affichage. Une image
+    # JPEG pas encore chargée est décodée directement à l'échelle réduite (mode brouillon).
+    # Renvoie le tableau et le facteur d'échelle appliqué
+    width, height = pil_img.size
+    scale = min(1.0, max_width / width, max_height / height)
+    pil_img.draft("L", (max(1, int(width * scale)), max(1, int(height * scale))))
+    gray = Grayscale()(Decode()(pil_img))
+    target = (max(1, int(width * scale)), max(1, int(height * scale)))
+    if (gray.shape[1], gray.shape[0]) != target:
+        gray = cv2.resize(gray, target, interpolation=cv2.INTER_AREA)
+    return gray, scale
+
+
+def build_preview_pipeline(options, scale):
+    # Étapes appliquées au proxy déjà en gris ; le voisinage du seuillage suit la réduction
+    # pour que l'aperçu ressemble au résultat pleine résolution
+    block_size = max(3, int(round(options.block_size * scale)) | 1)
+    return Pipeline([
+        BrightnessContrast(options.brightness, options.contrast),
+        AdaptiveThreshold(block_size, options.threshold_c),
+    ])
+
+
+def build_pipeline(options):
+    return Pipeline([
+        Decode(),
+        Grayscale(),
+        BrightnessContrast(options.brightness, options.contrast),
+        # OpenCV exige un voisinage impair d'au moins 3 pixels
+        AdaptiveThreshold(max(3, options.block_size | 1), options.threshold_c),
+        Denoise(1),
+    ])
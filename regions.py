@@ -0,0 +1,217 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+
+from cache import cache_key, hash_file
+from engine import check_cancel, get_engine
+from language import AUTO_LANG
+from memory import memory_budget
+from pages import gray_image, iter_gray_pages, iter_pages
+from pipeline import _image_mode, _image_size, language_cache_key, normalize_scale, preprocess, recognize, \
+    resolve_language
+from result import PageResult
+from timings import JobTrace
+
+# Reconnaissance limitée à des zones de la page (un champ de formulaire, le total d'une facture) :
+# seules les zones découpées sont mises à l'échelle, prétraitées et reconnues, en parallèle.
+# Les zones sont exprimées en fractions de la page, pour qu'un même modèle enregistré serve à tous
+# les documents de même mise en page, quelle que soit leur résolution.
+
+TEMPLATE_VERSION = 1
+
+# Une zone plus petite que cela (en pixels de la page) est ignorée : clic sans glisser
+MIN_REGION_SIDE = 4
+
+
+@dataclass
+class Region:
+    name: str
+    # (x0, y0, x1, y1) en fractions de la largeur et de la hauteur de la page, entre 0 et 1
+    box: tuple
+    page: int = 0
+
+    def pixel_box(self, width, height):
+        x0, y0, x1, y1 = self.box
+        x0, x1 = sorted((min(max(x0, 0.0), 1.0), min(max(x1, 0.0), 1.0)))
+        y0, y1 = sorted((min(max(y0, 0.0), 1.0), min(max(y1, 0.0), 1.0)))
+        return round(x0 * width), round(y0 * height), round(x1 * width), round(y1 * height)
+
+    def to_dict(self):
+        return {"name": self.name, "page": self.page, "box": [round(value, 5) for value in self.box]}
+
+    @classmethod
+    def from_dict(cls, data):
+        box = tuple(float(value) for value in data["box"])
+        if len(box) != 4:
+            raise ValueError(f"Zone {data.get('name')!r} : la boîte doit contenir 4 valeurs (x0, y0, x1, y1)")
+        return cls(str(data["name"]), box, int(data.get("page", 0)))
+
+
+def region_from_pixels(name, box, width, height, page=0):
+    # Zone tracée en pixels sur une image de `width` x `height` (l'image affichée ou la page)
+    x0, y0, x1, y1 = box
+    return Region(name, (x0 / width, y0 / height, x1 / width, y1 / height), page)
+
+
+def load_template(path):
+    with open(path, encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ValueError(f"Modèle de zones illisible ({os.path.basename(path)}) : {e}")
+    entries = data.get("regions") if isinstance(data, dict) else data
+    if not isinstance(entries, list):
+        raise ValueError(f"Modèle de zones sans liste \"regions\" : {os.path.basename(path)}")
+    regions = [Region.from_dict(entry) for entry in entries]
+    names = [region.name for region in regions]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Noms de zones en double : {', '.join(duplicates)}")
+    return regions
+
+
+def save_template(path, regions):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"version": TEMPLATE_VERSION, "regions": [region.to_dict() for region in regions]},
+                  f, ensure_ascii=False, indent=2)
+
+
+def _region_key(content_hash, options, region, engine_version):
+    return cache_key(content_hash, dict(options.cache_params(), page=region.page, region=region.to_dict()["box"]),
+                     engine_version)
+
+
+def _recognize_region(page_img, region, options, trace=None, cancel=None):
+    # PageResult de la zone, ses coordonnées ramenées à la page entière. `page_img` : image PIL,
+    # ou tableau en niveaux de gris (éventuellement projeté) en mode mémoire bornée
+    width, height = _image_size(page_img)
+    x0, y0, x1, y1 = region.pixel_box(width, height)
+    if x1 - x0 < MIN_REGION_SIDE or y1 - y0 < MIN_REGION_SIDE:
+        return PageResult(width, height)
+    check_cancel(cancel)
+    if hasattr(page_img, "shape"):
+        crop = page_img[y0:y1, x0:x1]
+    else:
+        crop = page_img.crop((x0, y0, x1, y1))
+    scaled = normalize_scale(crop, options, trace, region.page)
+    processed = preprocess(scaled, options, trace, region.page) if options.use_preprocessing else None
+    result = recognize(scaled, options, trace, processed, region.page, cancel).rescaled(x1 - x0, y1 - y0)
+    return PageResult.concat([(result, x0, y0)], width, height)
+
+
+def ocr_regions(image_path, regions, options, progress=None, cache=None, image=None, trace=None, cancel=None,
+                workers=None):
+    # Renvoie [(Region, PageResult)] dans l'ordre des zones ; les coordonnées des mots se rapportent
+    # à la page. Chaque page concernée est décodée une fois, puis ses zones sont reconnues en parallèle.
+    # `image`, `trace` et `cancel` : comme pour ocr_results
+    # Pas de réglage automatique sur les zones : elles sont lues avec les réglages donnés, qui
+    # doivent donc rester dans la clé du cache
+    options = replace(options, autotune=False)
+    if trace is None:
+        trace = JobTrace(image_path, progress)
+    elif progress is not None:
+        trace.progress = progress
+    region_stages = []
+    if options.text_height:
+        region_stages.append("scale")
+    if options.use_preprocessing:
+        region_stages.append("preprocess")
+    region_stages.append("recognize")
+    pages = sorted({region.page for region in regions})
+    trace.note(regions=len(regions), engine=options.engine, lang=options.lang)
+    trace.plan("load", repeat=len(pages))
+    trace.plan(*region_stages, repeat=len(regions))
+
+    results = {}
+    keys = {}
+    detected = None
+    language_key = None
+    if cache is not None:
+        trace.plan("cache")
+        with trace.stage("cache") as entry:
+            engine = get_engine(options.engine)
+            content_hash = hash_file(image_path)
+            engine_version = f"{engine.name} {engine.version()}"
+            for index, region in enumerate(regions):
+                keys[index] = _region_key(content_hash, options, region, engine_version)
+                tsv = cache.get(keys[index])
+                if tsv is not None:
+                    results[index] = PageResult.from_tsv(tsv)
+            if options.lang == AUTO_LANG:
+                language_key = language_cache_key(content_hash, engine_version, engine.languages())
+                detected = cache.get(language_key)
+            entry["hits"] = len(results)
+        trace.note(cache_hits=len(results))
+        trace.complete(*region_stages, repeat=len(results))
+
+    wanted = {region.page for index, region in enumerate(regions) if index not in results}
+    trace.complete("load", repeat=len(pages) - len(wanted))
+    if wanted:
+        workers = workers or min(len(regions), os.cpu_count() or 1)
+        # En mode mémoire bornée, les pages sont lues en niveaux de gris par bandes, comme dans ocr_results
+        budget = memory_budget(options.memory_limit)
+        if image is not None:
+            loaded = iter([(0, 1, image.get() if budget is None else gray_image(image.get(), budget))])
+        elif budget is not None:
+            trace.note(memory_limit=options.memory_limit)
+            loaded = iter_gray_pages(image_path, wanted, budget)
+        else:
+            loaded = iter_pages(image_path, wanted)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for _ in range(len(wanted)):
+                    with trace.stage("load") as entry:
+                        item = next(loaded, None)
+                        if item is not None:
+                            entry.update(page=item[0], size=_image_size(item[2]), mode=_image_mode(item[2]))
+                    # Modèle prévu pour un document plus long : les zones des pages absentes restent vides
+                    if item is None:
+                        break
+                    page, _, page_img = item
+                    check_cancel(cancel)
+                    page_options = options
+                    if options.lang == AUTO_LANG:
+                        # Langue détectée une fois par document, sur la page entière (comme ocr_results) :
+                        # un champ isolé est trop court pour conclure
+                        if detected is None:
+                            trace.plan("language")
+                            detected = resolve_language(get_engine(options.engine), page_img, None, trace, page,
+                                                        cancel)
+                            if cache is not None:
+                                cache.put(language_key, detected)
+                        trace.note(lang_detected=detected)
+                        page_options = replace(options, lang=detected)
+                    futures = {index: executor.submit(_recognize_region, page_img, region, page_options, trace, cancel)
+                               for index, region in enumerate(regions)
+                               if region.page == page and index not in results}
+                    for index, future in futures.items():
+                        results[index] = future.result()
+                        if cache is not None:
+                            cache.put(keys[index], results[index].to_tsv())
+        finally:
+            if hasattr(loaded, "close"):
+                loaded.close()
+    trace.finish()
+    return [(region, results.get(index, PageResult(0, 0))) for index, region in enumerate(regions)]
+
+
+def format_regions(region_results):
+    # Texte affiché : un en-tête par zone quand il y en a plusieurs
+    if len(region_results) == 1:
+        return region_results[0][1].text
+    return "\n".join(f"--- {region.name} ---\n{result.text.strip()}\n" for region, result in region_results)
+
+
+def page_results(region_results):
+    # Un PageResult par page (jusqu'à la dernière page concernée) réunissant les mots de ses zones,
+    # pour les exports hOCR, ALTO et PDF ; une page sans zone reste vide
+    if not region_results:
+        return []
+    count = max(region.page for region, _ in region_results) + 1
+    pages = []
+    for page in range(count):
+        parts = [result for region, result in region_results if region.page == page]
+        width, height = (parts[0].width, parts[0].height) if parts else (0, 0)
+        pages.append(PageResult.concat([(part, 0, 0) for part in parts], width, height))
+    return pages
@@ -0,0 +1,174 @@
+import numpy as np
+
+from engine import TSV_HEADER
+
+# Résultat structuré d'une page, issu d'une seule passe de Tesseract (sortie TSV) : les mots sont
+# rangés en colonnes numpy (boîtes, confiances, numéros de bloc, paragraphe et ligne) et leur texte
+# concaténé avec un tableau de positions, plutôt qu'un dictionnaire par mot. Le texte affiché,
+# les exports et le cache sont tous dérivés de cette même structure.
+
+
+class PageResult:
+    def __init__(self, width, height, chars="", offsets=None, boxes=None, conf=None, ids=None):
+        self.width = width
+        self.height = height
+        # Texte des mots bout à bout ; le mot i est chars[offsets[i]:offsets[i + 1]]
+        self.chars = chars
+        self.offsets = offsets if offsets is not None else np.zeros(1, dtype=np.int32)
+        # (left, top, width, height) par mot, en pixels de l'image source
+        self.boxes = boxes if boxes is not None else np.zeros((0, 4), dtype=np.int32)
+        # Confiance 0-100 (-1 quand Tesseract n'en donne pas)
+        self.conf = conf if conf is not None else np.zeros(0, dtype=np.float32)
+        # (bloc, paragraphe, ligne) par mot
+        self.ids = ids if ids is not None else np.zeros((0, 3), dtype=np.int32)
+        self._text = None
+
+    def __len__(self):
+        return len(self.conf)
+
+    def word(self, index):
+        return self.chars[self.offsets[index]:self.offsets[index + 1]]
+
+    def words(self):
+        return [self.word(index) for index in range(len(self))]
+
+    @classmethod
+    def from_tsv(cls, tsv, width=0, height=0):
+        # Lecture en une passe de la sortie TSV de Tesseract ; seules les lignes de mots (niveau 5)
+        # non vides sont gardées. Les dimensions de la page y sont lues si elles ne sont pas fournies
+        words = []
+        numbers = []
+        for row in tsv.splitlines():
+            fields = row.split("\t")
+            if len(fields) < 12:
+                continue
+            if fields[0] == "1" and not width:
+                width, height = int(fields[8]), int(fields[9])
+                continue
+            if fields[0] != "5":
+                continue
+            word = fields[11].strip()
+            if not word:
+                continue
+            words.append(word)
+            numbers.append((int(fields[6]), int(fields[7]), int(fields[8]), int(fields[9]),
+                            int(fields[2]), int(fields[3]), int(fields[4]), float(fields[10])))
+        table = np.array(numbers, dtype=np.float64).reshape(-1, 8)
+        offsets = np.zeros(len(words) + 1, dtype=np.int32)
+        np.cumsum([len(word) for word in words], out=offsets[1:])
+        return cls(width, height, "".join(words), offsets, table[:, :4].astype(np.int32),
+                   table[:, 7].astype(np.float32), table[:, 4:7].astype(np.int32))
+
+    def to_tsv(self):
+        # Sérialisation au format TSV de Tesseract (relue par from_tsv), utilisée par le cache
+        rows = [TSV_HEADER, f"1\t1\t0\t0\t0\t0\t0\t0\t{self.width}\t{self.height}\t-1\t"]
+        for index in range(len(self)):
+            left, top, width, height = self.boxes[index].tolist()
+            block, par, line = self.ids[index].tolist()
+            rows.append(f"5\t1\t{block}\t{par}\t{line}\t{index + 1}\t{left}\t{top}\t{width}\t{height}\t"
+                        f"{self.conf[index]:g}\t{self.word(index)}")
+        return "\n".join(rows)
+
+    @classmethod
+    def concat(cls, parts, width, height):
+        # Assemble des résultats partiels (blocs reconnus séparément) : `parts` contient des
+        # (résultat, dx, dy) ; les boîtes sont décalées et les numéros de bloc rendus uniques
+        parts = [(part, dx, dy) for part, dx, dy in parts if len(part)]
+        if not parts:
+            return cls(width, height)
+        chars = "".join(part.chars for part, _, _ in parts)
+        lengths = np.concatenate([np.diff(part.offsets) for part, _, _ in parts])
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+        np.cumsum(lengths, out=offsets[1:])
+        boxes = np.concatenate([part.boxes + np.array([dx, dy, 0, 0], dtype=np.int32) for part, dx, dy in parts])
+        ids = []
+        next_block = 0
+        for part, _, _ in parts:
+            part_ids = part.ids.copy()
+            part_ids[:, 0] += next_block
+            next_block = int(part_ids[:, 0].max()) + 1
+            ids.append(part_ids)
+        return cls(width, height, chars, offsets, boxes, np.concatenate([part.conf for part, _, _ in parts]),
+                   np.concatenate(ids))
+
+    def rescaled(self, width, height):
+        # Même résultat rapporté à une image de `width` x `height` (l'image source, quand la page
+        # a été rééchantillonnée avant la reconnaissance)
+        if (width, height) == (self.width, self.height) or not self.width or not self.height:
+            return self
+        factors = np.array([width / self.width, height / self.height] * 2)
+        boxes = np.rint(self.boxes * factors).astype(np.int32)
+        return PageResult(width, height, self.chars, self.offsets, boxes, self.conf, self.ids)
+
+    def transformed(self, matrix, width, height):
+        # Même résultat rapporté à une image de `width` x `height` par la transformation affine
+        # `matrix` (2x3) : chaque boîte devient le rectangle qui englobe ses coins transformés
+        if not len(self):
+            return PageResult(width, height)
+        left, top = self.boxes[:, 0], self.boxes[:, 1]
+        right, bottom = left + self.boxes[:, 2], top + self.boxes[:, 3]
+        xs = np.stack([left, right, left, right], axis=1).astype(np.float64)
+        ys = np.stack([top, top, bottom, bottom], axis=1).astype(np.float64)
+        new_xs = matrix[0, 0] * xs + matrix[0, 1] * ys + matrix[0, 2]
+        new_ys = matrix[1, 0] * xs + matrix[1, 1] * ys + matrix[1, 2]
+        x0 = np.clip(np.floor(new_xs.min(axis=1)), 0, width)
+        y0 = np.clip(np.floor(new_ys.min(axis=1)), 0, height)
+        x1 = np.clip(np.ceil(new_xs.max(axis=1)), 0, width)
+        y1 = np.clip(np.ceil(new_ys.max(axis=1)), 0, height)
+        boxes = np.stack([x0, y0, x1 - x0, y1 - y0], axis=1).astype(np.int32)
+        return PageResult(width, height, self.chars, self.offsets, boxes, self.conf, self.ids)
+
+    @property
+    def mean_confidence(self):
+        known = self.conf[self.conf >= 0]
+        return float(known.mean()) if known.size else 0.0
+
+    @property
+    def text(self):
+        # Une ligne par ligne Tesseract, une ligne vide entre deux paragraphes
+        if self._text is None:
+            paragraphs = []
+            for _, block_paragraphs in self.layout():
+                for _, lines in block_paragraphs:
+                    paragraphs.append("\n".join(" ".join(self.word(index) for index in words)
+                                                for _, words in lines))
+            self._text = "\n\n".join(paragraphs)
+        return self._text
+
+    def layout(self):
+        # Hiérarchie blocs > paragraphes > lignes > indices des mots, dans l'ordre de lecture :
+        # [(bloc, [(paragraphe, [(ligne, [indices])])])]
+        blocks = []
+        previous = None
+        for index, (block, par, line) in enumerate(self.ids.tolist()):
+            if previous is None or block != previous[0]:
+                blocks.append((block, []))
+            if previous is None or (block, par) != previous[:2]:
+                blocks[-1][1].append((par, []))
+            if previous is None or (block, par, line) != previous:
+                blocks[-1][1][-1][1].append((line, []))
+            blocks[-1][1][-1][1][-1][1].append(index)
+            previous = (block, par, line)
+        return blocks
+
+    def bbox(self, indices):
+        # Rectangle englobant (x0, y0, x1, y1) d'un groupe de mots
+        boxes = self.boxes[indices]
+        return (int(boxes[:, 0].min()), int(boxes[:, 1].min()),
+                int((boxes[:, 0] + boxes[:, 2]).max()), int((boxes[:, 1] + boxes[:, 3]).max()))
+
+    def to_dict(self):
+        # Colonnes JSON, un tableau par champ
+        return {
+            "width": self.width,
+            "height": self.height,
+            "text": self.words(),
+            "left": self.boxes[:, 0].tolist(),
+            "top": self.boxes[:, 1].tolist(),
+            "box_width": self.boxes[:, 2].tolist(),
+            "box_height": self.boxes[:, 3].tolist(),
+            "conf": [round(value, 2) for value in self.conf.tolist()],
+            "block": self.ids[:, 0].tolist(),
+            "par": self.ids[:, 1].tolist(),
+            "line": self.ids[:, 2].tolist(),
+        }
@@ -0,0 +1,451 @@
+import argparse
+import base64
+import http.client
+import io
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import replace
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from cache import get_default_cache
+from discovery import configure_tesseract
+from engine import ENGINE_NAMES, OcrCancelled, cancellable_engine_name
+from export import open_writer
+from pages import PAGE_SEPARATOR, TIFF_SIGNATURES
+from pipeline import FALLBACK_MODES, OcrOptions, ocr_results
+from timings import JobTrace
+
+# Service OCR local : python main.py serve [--port 8765 | --unix /chemin/socket]
+#
+#   POST /ocr?lang=fra&format=json   corps = octets de l'image (ou JSON {"image": base64, "options": {...}})
+#                                    format : text (défaut), json (avec les mots positionnés), hocr ou alto
+#   GET  /health                     état de la file et des workers
+#
+# Les requêtes passent par une file bornée à priorités servie par un nombre fixe de workers qui
+# gardent leurs moteurs chauds d'une requête à l'autre. File pleine : 429 ; délai dépassé : 504.
+
+DEFAULT_PORT = 8765
+MAX_BODY_BYTES = 200 * 1024 * 1024
+
+OUTPUT_FORMATS = ("text", "json", "hocr", "alto")
+
+# Paramètres acceptés dans la requête, avec leur conversion
+OPTION_TYPES = {
+    "lang": str,
+    "use_preprocessing": lambda value: str(value).lower() not in ("0", "false", "no", "off"),
+    "brightness": int,
+    "contrast": int,
+    "engine": str,
+    "fallback": str,
+    "tiled": lambda value: str(value).lower() in ("1", "true", "yes", "on"),
+    "text_height": int,
+    "deskew": lambda value: str(value).lower() not in ("0", "false", "no", "off"),
+    "memory_limit": int,
+    "block_size": int,
+    "threshold_c": int,
+    "autotune": lambda value: str(value).lower() in ("1", "true", "yes", "on"),
+}
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, data, options, priority=0, timeout=None):
+        self.data = data
+        self.options = options
+        self.priority = priority
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.done = threading.Event()
+        # Levé quand le client n'attend plus : le travail est abandonné, tesseract compris
+        self.cancel = threading.Event()
+        self.results = None
+        self.trace = None
+        self.error = None
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() > self.deadline
+
+
+class OcrService:
+    def __init__(self, workers=None, queue_size=32, timeout=120, cache=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.cache = cache
+        # (priorité inversée, numéro d'arrivée, travail) : les priorités hautes d'abord, puis l'ordre d'arrivée.
+        # La taille est bornée par les places : une requête réserve la sienne avant d'envoyer son corps
+        self._queue = queue.PriorityQueue()
+        self._slots = threading.Semaphore(queue_size)
+        self._counter = itertools.count()
+        self._threads = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "expired": 0}
+
+    def start(self):
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ocr-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        for _ in self._threads:
+            self._queue.put((float("-inf"), next(self._counter), None))
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def reserve(self):
+        # Réserve une place dans la file ; False (requête refusée) si elle est pleine
+        if self._slots.acquire(blocking=False):
+            return True
+        self._count("rejected")
+        return False
+
+    def release(self):
+        # Rend une place réservée qui ne sera pas utilisée
+        self._slots.release()
+
+    def submit(self, job, reserved=False):
+        # `reserved` : la place a déjà été obtenue avec reserve()
+        if not reserved and not self.reserve():
+            raise QueueFull()
+        self._queue.put((-job.priority, next(self._counter), job))
+        self._count("accepted")
+        return job
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def status(self):
+        with self._lock:
+            return {"status": "ok", "workers": self.workers, "busy": self._busy,
+                    "queued": self._queue.qsize(), "capacity": self.queue_size, **self.stats}
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                return
+            self._slots.release()
+            # Un travail abandonné par son client ou dont le délai est dépassé n'est pas lancé
+            if job.cancel.is_set() or job.expired():
+                job.error = TimeoutError("Délai dépassé avant le début du traitement")
+                self._count("expired")
+                job.done.set()
+                continue
+            with self._lock:
+                self._busy += 1
+            try:
+                job.results, job.trace = self._run(job)
+                self._count("completed")
+            except OcrCancelled:
+                job.error = TimeoutError("Délai de traitement dépassé")
+                self._count("expired")
+            except Exception as e:
+                job.error = e
+                self._count("failed")
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                job.done.set()
+
+    def _run(self, job):
+        # Les lecteurs d'images et de PDF travaillent sur un fichier : copie temporaire du corps.
+        # Ils choisissent d'après l'extension ; un TIFF doit être reconnu pour être lu par bandes
+        # en mode mémoire bornée
+        if job.data[:5] == b"%PDF-":
+            suffix = ".pdf"
+        elif job.data[:4] in TIFF_SIGNATURES:
+            suffix = ".tif"
+        else:
+            suffix = ".img"
+        handle, path = tempfile.mkstemp(prefix="ready-", suffix=suffix)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                f.write(job.data)
+            trace = JobTrace("service")
+            # Un délai dépassé doit arrêter Tesseract sur-le-champ : moteur interruptible
+            options = replace(job.options, engine=cancellable_engine_name(job.options.engine))
+            try:
+                results = [result for _, _, result in ocr_results(path, options, cache=self.cache, trace=trace,
+                                                                  cancel=job.cancel)]
+            except OcrCancelled:
+                raise
+            except Exception as e:
+                # Le fichier temporaire ne concerne pas le client : il est retiré du message
+                if path in str(e):
+                    raise RuntimeError(str(e).replace(path, "<image>")) from e
+                raise
+            return results, trace
+        finally:
+            os.remove(path)
+
+    def process(self, data, options, priority=0, timeout=None, reserved=False):
+        # Soumet et attend le résultat ; lève QueueFull ou TimeoutError
+        timeout = timeout or self.timeout
+        job = self.submit(Job(data, options, priority, timeout), reserved)
+        if not job.done.wait(timeout):
+            job.cancel.set()
+            raise TimeoutError("Délai de traitement dépassé")
+        if job.error is not None:
+            raise job.error
+        return job
+
+
+def parse_options(params):
+    options = OcrOptions()
+    for name, convert in OPTION_TYPES.items():
+        if name in params:
+            setattr(options, name, convert(params[name]))
+    if options.engine not in ENGINE_NAMES:
+        raise ValueError(f"Moteur inconnu: {options.engine}")
+    if options.fallback not in FALLBACK_MODES:
+        raise ValueError(f"Stratégie inconnue: {options.fallback}")
+    return options
+
+
+class OcrRequestHandler(BaseHTTPRequestHandler):
+    server_version = "ReadyOCR/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def address_string(self):
+        # Les sockets Unix n'ont pas d'adresse (client_address vide)
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send(self, status, body, content_type="application/json; charset=utf-8", headers=None):
+        if not isinstance(body, bytes):
+            body = (json.dumps(body, ensure_ascii=False) if "json" in content_type else body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if urlparse(self.path).path == "/health":
+            self._send(200, self.service.status())
+        else:
+            self._send(404, {"error": "Ressource inconnue"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != "/ocr":
+            self._send(404, {"error": "Ressource inconnue"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            self._send(400, {"error": "Corps de requête vide"})
+            return
+        if length > MAX_BODY_BYTES:
+            self._send(413, {"error": "Image trop volumineuse"}, headers={"Connection": "close"})
+            self.close_connection = True
+            return
+        # File pleine : refus avant de recevoir l'image, et connexion fermée puisque le corps n'est pas lu
+        if not self.service.reserve():
+            self._send(429, {"error": "File d'attente pleine, réessayez plus tard"},
+                       headers={"Retry-After": "1", "Connection": "close"})
+            self.close_connection = True
+            return
+
+        try:
+            body = self.rfile.read(length)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                payload = json.loads(body)
+                params.update(payload.get("options", {}))
+                data = base64.b64decode(payload["image"])
+            else:
+                data = body
+            options = parse_options(params)
+            priority = int(params.get("priority", 0))
+            timeout = float(params["timeout"]) if "timeout" in params else None
+            output_format = params.get("format", "text")
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"Format inconnu: {output_format}")
+        except (ValueError, KeyError, TypeError) as e:
+            self.service.release()
+            self._send(400, {"error": f"Requête invalide: {e}"})
+            return
+        except BaseException:
+            self.service.release()
+            raise
+
+        try:
+            job = self.service.process(data, options, priority, timeout, reserved=True)
+        except TimeoutError as e:
+            self._send(504, {"error": str(e)})
+            return
+        except Exception as e:
+            self._send(422, {"error": f"Erreur lors de l'extraction de texte: {e}"})
+            return
+
+        pages = [result.text for result in job.results]
+        if output_format == "json":
+            self._send(200, {"text": PAGE_SEPARATOR.join(pages), "pages": pages,
+                             "words": [result.to_dict() for result in job.results],
+                             "trace": job.trace.to_dict() if params.get("trace") else None})
+        elif output_format in ("hocr", "alto"):
+            output = io.StringIO()
+            writer = open_writer(output, output_format)
+            for result in job.results:
+                writer.add_page(result)
+            writer.close()
+            content_type = "text/html" if output_format == "hocr" else "application/xml"
+            self._send(200, output.getvalue(), f"{content_type}; charset=utf-8")
+        else:
+            self._send(200, PAGE_SEPARATOR.join(pages), "text/plain; charset=utf-8")
+
+
+class OcrHTTPServer(ThreadingHTTPServer):
+    def __init__(self, address, service, quiet=False):
+        self.service = service
+        self.quiet = quiet
+        super().__init__(address, OcrRequestHandler)
+
+
+if hasattr(socket, "AF_UNIX"):
+    class OcrUnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+        def __init__(self, path, service, quiet=False):
+            self.service = service
+            self.quiet = quiet
+            if os.path.exists(path):
+                os.remove(path)
+            super().__init__(path, OcrRequestHandler)
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None, quiet=False):
+    if unix_path:
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("Les sockets Unix ne sont pas disponibles sur ce système : utilisez --host et --port")
+        return OcrUnixServer(unix_path, service, quiet)
+    return OcrHTTPServer((host, port), service, quiet)
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+
+
+class OcrClient:
+    # Client minimal : OcrClient(port=8765).ocr("facture.png", lang="fra")
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_PORT, unix_path=None, timeout=300):
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.timeout = timeout
+
+    def _connection(self):
+        if self.unix_path:
+            return _UnixConnection(self.unix_path, self.timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def _request(self, method, path, body=None, headers=None):
+        connection = self._connection()
+        try:
+            connection.request(method, path, body=body, headers=headers or {})
+            response = connection.getresponse()
+            payload = response.read()
+        finally:
+            connection.close()
+        if response.status != 200:
+            try:
+                message = json.loads(payload)["error"]
+            except (ValueError, KeyError):
+                message = payload.decode("utf-8", "replace")
+            raise ServiceError(response.status, message)
+        return response, payload
+
+    def health(self):
+        return json.loads(self._request("GET", "/health")[1])
+
+    def ocr(self, image, priority=0, timeout=None, structured=False, **options):
+        # `image` : chemin ou octets ; `options` : champs d'OcrOptions (lang, brightness...)
+        if isinstance(image, str):
+            with open(image, "rb") as f:
+                image = f.read()
+        params = dict(options, priority=priority)
+        if timeout is not None:
+            params["timeout"] = timeout
+        if structured:
+            params["format"] = "json"
+        _, payload = self._request("POST", "/ocr?" + urlencode(params), image,
+                                   {"Content-Type": "application/octet-stream"})
+        return json.loads(payload) if structured else payload.decode("utf-8")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py serve", description="Service OCR local")
+    parser.add_argument("--host", default="127.0.0.1", help="Adresse d'écoute (défaut: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (défaut: {DEFAULT_PORT})")
+    parser.add_argument("--unix", default=None, help="Écouter sur une socket Unix plutôt qu'en TCP")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de workers (défaut: nombre de cœurs)")
+    parser.add_argument("--queue-size", type=int, default=32, help="Taille maximale de la file (défaut: 32)")
+    parser.add_argument("--timeout", type=float, default=120, help="Délai maximal par requête en secondes")
+    parser.add_argument("--no-cache", action="store_true", help="Ne pas utiliser le cache des résultats")
+    parser.add_argument("--tesseract-cmd", default=None, help="Chemin de l'exécutable Tesseract")
+    parser.add_argument("--quiet", action="store_true", help="Ne pas journaliser les requêtes")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_tesseract(args.tesseract_cmd)
+    service = OcrService(args.workers, args.queue_size, args.timeout, None if args.no_cache else get_default_cache())
+    where = args.unix or f"http://{args.host}:{args.port}"
+    try:
+        server = make_server(service, args.host, args.port, args.unix, args.quiet)
+    except OSError as e:
+        print(f"Impossible d'écouter sur {where} : {e}", file=sys.stderr)
+        return 1
+    service.start()
+    print(f"Service OCR à l'écoute sur {where} ({service.workers} workers, file de {args.queue_size})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
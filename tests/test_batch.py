@@ -0,0 +1,51 @@
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import batch
+from pipeline import OcrOptions
+
+
+class CountingExecutor(ThreadPoolExecutor):
+    # Pool de threads à la place des processus : compte les fichiers soumis et pas encore traités
+    lock = threading.Lock()
+    outstanding = 0
+    most = 0
+
+    def submit(self, fn, *args, **kwargs):
+        with self.lock:
+            CountingExecutor.outstanding += 1
+            CountingExecutor.most = max(CountingExecutor.most, CountingExecutor.outstanding)
+        return super().submit(fn, *args, **kwargs)
+
+
+def fake_process(path, options, with_trace=False, export=None, regions=None):
+    with CountingExecutor.lock:
+        CountingExecutor.outstanding -= 1
+    if path.endswith("bad.png"):
+        return {"path": path, "text": "", "error": "illisible", "seconds": 0}
+    return {"path": path, "text": "texte de " + path.rsplit("/", 1)[-1], "error": None, "seconds": 0}
+
+
+def test_batch_writes_results_with_bounded_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", CountingExecutor)
+    monkeypatch.setattr(batch, "_process", fake_process)
+    CountingExecutor.outstanding = CountingExecutor.most = 0
+    files = [str(tmp_path / f"page{index}.png") for index in range(9)] + [str(tmp_path / "bad.png")]
+    output = tmp_path / "out"
+    summary = batch.run_batch(files, OcrOptions(), str(output), "jsonl", workers=1, log=lambda message: None)
+    assert (summary["succeeded"], summary["failed"]) == (9, 1)
+    assert CountingExecutor.most <= 2
+    lines = [json.loads(line) for line in (output / "results.jsonl").read_text(encoding="utf-8").splitlines()]
+    assert sorted(line["path"] for line in lines) == sorted(files)
+    assert json.loads((output / "summary.json").read_text(encoding="utf-8"))["failures"][0]["error"] == "illisible"
+
+
+def test_batch_text_output(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", CountingExecutor)
+    monkeypatch.setattr(batch, "_process", fake_process)
+    source = tmp_path / "scans"
+    files = [str(source / "a.png"), str(source / "sous" / "b.png")]
+    batch.run_batch(files, OcrOptions(), str(tmp_path / "out"), workers=2, log=lambda message: None)
+    assert (tmp_path / "out" / "a.txt").read_text(encoding="utf-8") == "texte de a.png"
+    assert (tmp_path / "out" / "sous" / "b.txt").read_text(encoding="utf-8") == "texte de b.png"
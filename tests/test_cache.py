@@ -0,0 +1,55 @@
+import sqlite3
+
+from cache import OcrCache, cache_key
+
+
+def test_cache_key_depends_on_inputs():
+    key = cache_key("abc", {"lang": "fra"}, "cli 5.3.0")
+    assert key == cache_key("abc", {"lang": "fra"}, "cli 5.3.0")
+    assert key != cache_key("abd", {"lang": "fra"}, "cli 5.3.0")
+    assert key != cache_key("abc", {"lang": "eng"}, "cli 5.3.0")
+    assert key != cache_key("abc", {"lang": "fra"}, "cli 5.4.0")
+
+
+def stored_size(cache):
+    return cache._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+
+def test_running_total_follows_entries(tmp_path):
+    cache = OcrCache(str(tmp_path))
+    cache.put("a", "premier texte")
+    cache.put("b", "second texte")
+    cache.put("a", "premier texte, relu plus long que la première fois")
+    assert cache.get("a") == "premier texte, relu plus long que la première fois"
+    assert cache.size() == stored_size(cache)
+    cache.clear()
+    assert cache.size() == 0
+    cache.close()
+
+
+def test_eviction_keeps_recent_entries(tmp_path):
+    # Chaque entrée occupe ~300 octets compressés : le plafond en garde une dizaine
+    cache = OcrCache(str(tmp_path), max_bytes=3000)
+    texts = {f"key{index:02d}": bytes(range(256)).hex()[index:index + 300] + str(index) for index in range(30)}
+    for key, text in texts.items():
+        cache.put(key, text)
+    assert cache.size() == stored_size(cache) <= 3000
+    assert cache.get("key29") == texts["key29"]
+    assert cache.get("key00") is None
+    cache.close()
+
+
+def test_total_computed_for_existing_cache(tmp_path):
+    # Fichier écrit par une version sans total : le total est calculé à l'ouverture
+    path = tmp_path / "ocr-cache.sqlite3"
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE entries (key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+               "last_used REAL NOT NULL)")
+    db.execute("INSERT INTO entries VALUES ('old', x'00', 1234, 0)")
+    db.commit()
+    db.close()
+    cache = OcrCache(str(tmp_path))
+    assert cache.size() == 1234
+    cache.put("new", "texte")
+    assert cache.size() == stored_size(cache)
+    cache.close()
@@ -0,0 +1,50 @@
+import stat
+
+import pytesseract
+import pytest
+
+import batch
+from discovery import TESSERACT_ENV, configure_tesseract
+
+
+@pytest.fixture
+def executable(tmp_path, monkeypatch):
+    # Faux exécutable désigné par la variable d'environnement ; configuration et PATH neutralisés
+    path = tmp_path / "tesseract"
+    path.write_text("#!/bin/sh\n")
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv(TESSERACT_ENV, str(path))
+    monkeypatch.setenv("READY_CONFIG", str(tmp_path / "absent.json"))
+    monkeypatch.setenv("PATH", str(tmp_path / "vide"))
+    monkeypatch.setattr(pytesseract.pytesseract, "tesseract_cmd", "tesseract")
+    return str(path)
+
+
+def test_configure_uses_discovered_path(executable):
+    assert configure_tesseract() == executable
+    assert pytesseract.pytesseract.tesseract_cmd == executable
+
+
+def test_explicit_path_wins(executable):
+    assert configure_tesseract("/opt/tesseract/bin/tesseract") == "/opt/tesseract/bin/tesseract"
+    assert pytesseract.pytesseract.tesseract_cmd == "/opt/tesseract/bin/tesseract"
+
+
+def test_not_found_keeps_default(executable, monkeypatch):
+    monkeypatch.delenv(TESSERACT_ENV)
+    assert configure_tesseract() is None
+    assert pytesseract.pytesseract.tesseract_cmd == "tesseract"
+
+
+def test_batch_passes_discovered_path_to_workers(executable, tmp_path, monkeypatch):
+    captured = {}
+
+    def run_batch(files, options, output_dir, output_format, workers, tesseract_cmd, *args, **kwargs):
+        captured["tesseract_cmd"] = tesseract_cmd
+        return {"seconds": 0, "succeeded": 0, "empty": 0, "failed": 0}
+
+    monkeypatch.setattr(batch, "run_batch", run_batch)
+    image = tmp_path / "page.png"
+    image.write_bytes(b"")
+    batch.main([str(image), "--output", str(tmp_path / "out")])
+    assert captured["tesseract_cmd"] == executable
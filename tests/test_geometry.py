@@ -0,0 +1,66 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from geometry import detect_geometry
+
+LINE = "The quick brown fox jumps over the lazy dog"
+
+
+def rendered_page(angle=0, flip=False):
+    # Page de huit lignes rendues, éventuellement retournée puis légèrement inclinée
+    image = Image.new("L", (800, 400), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=20)
+    for i in range(8):
+        draw.text((20, 20 + i * 45), LINE, fill=0, font=font)
+    if flip:
+        image = image.rotate(180)
+    if angle:
+        image = image.rotate(angle, expand=True, fillcolor=255)
+    return np.array(image)
+
+
+class OsdEngine:
+    # Moteur de test : réponse OSD fixée, appels comptés
+    def __init__(self, rotate, confidence=10.0):
+        self.output = f"Rotate: {rotate}\nOrientation confidence: {confidence}\n"
+        self.calls = 0
+
+    def image_to_osd(self, image, cancel=None):
+        self.calls += 1
+        return self.output
+
+
+def test_upright_page_is_not_flipped():
+    for angle in (0, 4):
+        rotation, skew, _ = detect_geometry(rendered_page(angle))
+        assert rotation == 0
+        assert abs(skew + angle) < 1
+
+
+def test_upright_page_kept_when_osd_disagrees_with_hint():
+    # L'OSD confirme la page droite : l'indice de la vignette ne suffit pas à la retourner
+    assert detect_geometry(rendered_page(4), OsdEngine(0))[0] == 0
+
+
+def test_flipped_page_confirmed_by_osd():
+    rotation, _, method = detect_geometry(rendered_page(4, flip=True), OsdEngine(180))
+    assert (rotation, method) == (180, "osd")
+
+
+def test_flipped_page_left_alone_without_confident_osd():
+    # Sans OSD sûre, une page douteuse reste telle quelle plutôt que d'être retournée à tort
+    page = rendered_page(flip=True)
+    assert detect_geometry(page)[0] == 0
+    assert detect_geometry(page, OsdEngine(180, confidence=0.5))[0] == 0
+
+
+def test_vertical_text_turned_by_quarter():
+    page = np.ascontiguousarray(np.rot90(rendered_page()))
+    assert detect_geometry(page, OsdEngine(90))[0] in (90, 270)
+
+
+def test_blank_page_untouched():
+    engine = OsdEngine(180)
+    assert detect_geometry(np.full((400, 800), 255, np.uint8), engine) == (0, 0.0, None)
+    assert engine.calls == 0
@@ -0,0 +1,47 @@
+import numpy as np
+
+from language import choose_languages, detect_language
+
+FRENCH = "Le chat est dans la maison et il ne sort pas de la cour pour les enfants qui sont avec elle"
+SPANISH = "El perro de la casa no se va por la calle con los niños que son muy buenos para el pueblo"
+
+
+class InstalledEngine:
+    # Moteur de test : quelques modèles installés, texte lu fixé, langue demandée notée
+    def __init__(self, languages, text):
+        self._languages = languages
+        self.text = text
+        self.requested = []
+
+    def languages(self):
+        return self._languages
+
+    def image_to_string(self, image, lang, psm=None, oem=None, cancel=None):
+        self.requested.append(lang)
+        return self.text
+
+
+def test_choose_languages_all_installed():
+    assert choose_languages(FRENCH) == "fra"
+    assert choose_languages(SPANISH) == "spa"
+    assert choose_languages("trop court") == "fra+eng"
+
+
+def test_choose_languages_skips_missing_model():
+    # Sans modèle espagnol, le texte espagnol ne peut pas donner « spa »
+    installed = ["eng", "fra"]
+    assert "spa" not in choose_languages(SPANISH, installed)
+    assert choose_languages(FRENCH, installed) == "fra"
+
+
+def test_undecided_falls_back_to_installed():
+    assert choose_languages("trop court", ["eng"]) == "eng"
+    assert choose_languages(FRENCH, ["eng"]) == "eng"
+    assert choose_languages("trop court", ["deu"]) == "deu"
+
+
+def test_detect_language_probes_with_installed_model():
+    engine = InstalledEngine(["deu", "ita"], "zu kurz")
+    lang, _ = detect_language(engine, np.full((50, 80), 255, dtype=np.uint8))
+    assert engine.requested == ["deu"]
+    assert lang == "deu"
@@ -0,0 +1,63 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from engine import TSV_HEADER
+from layout import TILE_PADDING, find_text_blocks, recognize_tiled
+from memory import memory_budget
+
+
+def two_columns():
+    # Deux colonnes de texte bien séparées sur une page blanche
+    image = Image.new("L", (1200, 600), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=20)
+    for i in range(6):
+        draw.text((40, 40 + i * 24), "colonne gauche", fill=0, font=font)
+        draw.text((760, 40 + i * 24), "colonne droite", fill=0, font=font)
+    return np.array(image)
+
+
+class TileEngine:
+    # Moteur de test : un mot par bloc, placé en (TILE_PADDING, TILE_PADDING) dans la tuile reçue
+    name = "tile"
+
+    def __init__(self):
+        self.sizes = []
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        self.sizes.append(image.shape[:2])
+        word = f"bloc{len(self.sizes)}"
+        return TSV_HEADER + f"\n5\t1\t1\t1\t1\t1\t{TILE_PADDING}\t{TILE_PADDING}\t20\t10\t90\t{word}\n"
+
+
+def test_columns_found():
+    blocks = find_text_blocks(two_columns())
+    assert len(blocks) == 2
+    (left, _, _, _), (right, _, _, _) = sorted(blocks)
+    assert left < 100 and right > 700
+
+
+def test_tiled_words_mapped_to_page():
+    engine = TileEngine()
+    page = recognize_tiled(engine, two_columns(), "fra", workers=2)
+    assert len(engine.sizes) == 2
+    # Le mot placé dans la marge de chaque tuile retombe sur le coin de son bloc dans la page
+    blocks = sorted(find_text_blocks(two_columns()))
+    assert sorted(page.boxes[:, :2].tolist()) == [[x0, y0] for x0, y0, _, _ in blocks]
+    assert sorted(page.words()) == ["bloc1", "bloc2"]
+
+
+def test_budget_single_block_padded():
+    # En mode mémoire bornée, un bloc unique est découpé avec ses marges, pas lu sur la page entière
+    image = two_columns()
+    image[:, 600:] = 255
+    engine = TileEngine()
+    recognize_tiled(engine, image, "fra", budget=memory_budget(64))
+    (x0, y0, x1, y1), = find_text_blocks(image)
+    assert engine.sizes == [(y1 - y0 + 2 * TILE_PADDING, x1 - x0 + 2 * TILE_PADDING)]
+
+
+def test_blank_page_not_sent():
+    engine = TileEngine()
+    page = recognize_tiled(engine, np.full((400, 400), 255, np.uint8), "fra", budget=memory_budget(64))
+    assert engine.sizes == [] and not page.text.strip()
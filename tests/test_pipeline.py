@@ -0,0 +1,56 @@
+import shutil
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+import engine
+from engine import TSV_HEADER, TesseractEngine, cancellable_engine
+from pipeline import recognize_speculative
+
+CONFIDENT_TSV = TSV_HEADER + "\n5\t1\t1\t1\t1\t1\t10\t10\t40\t12\t95\tBonjour\n"
+
+
+class StuckEngine(TesseractEngine):
+    # Moteur de test : le candidat en psm 6 reste bloqué sans regarder `cancel`, les autres
+    # répondent tout de suite avec assurance
+    name = "stuck"
+    cancellable = True
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        if psm == 6:
+            self.release.wait(5)
+        return CONFIDENT_TSV
+
+
+def test_speculative_does_not_wait_for_losers():
+    stub = StuckEngine()
+    image = Image.new("L", (100, 50), 255)
+    start = time.perf_counter()
+    try:
+        page = recognize_speculative(stub, [(image, 6, None), (image, None, None)], "fra")
+    finally:
+        stub.release.set()
+    assert "Bonjour" in page.text
+    assert time.perf_counter() - start < 2
+
+
+class UninterruptibleEngine(TesseractEngine):
+    name = "uninterruptible"
+
+
+@pytest.mark.skipif(shutil.which("tesseract") is None, reason="tesseract absent")
+def test_cancellable_engine_prefers_cli():
+    assert cancellable_engine(UninterruptibleEngine()).name == "cli"
+    cli = engine.get_engine("cli")
+    assert cancellable_engine(cli) is cli
+
+
+def test_cancellable_engine_without_executable(monkeypatch):
+    monkeypatch.setattr(engine.pytesseract.pytesseract, "tesseract_cmd", "/nonexistent/tesseract")
+    stub = UninterruptibleEngine()
+    assert cancellable_engine(stub) is stub
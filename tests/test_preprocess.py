@@ -0,0 +1,42 @@
+import numpy as np
+from PIL import Image
+
+from pipeline import OcrOptions, _fallback_candidates, normalize_scale, preprocess
+
+
+def _page(mode):
+    # Page synthétique : fond clair, quelques traits sombres, niveaux de gris variés
+    rng = np.random.default_rng(0)
+    gray = rng.integers(180, 256, size=(120, 200), dtype=np.uint8)
+    gray[40:52, 20:180] = rng.integers(0, 60, size=(12, 160), dtype=np.uint8)
+    image = Image.fromarray(gray, "L")
+    return image if mode == "L" else image.convert(mode)
+
+
+def test_preprocess_keeps_raw_gray_page():
+    # Une page en niveaux de gris déjà décodée ne doit pas être binarisée par le prétraitement :
+    # l'image brute reste la dernière candidate des essais de secours
+    options = OcrOptions(text_height=0, deskew=False)
+    scaled = np.array(_page("L"))
+    raw = scaled.copy()
+    processed = preprocess(scaled, options)
+    assert np.array_equal(scaled, raw)
+    assert len(np.unique(processed)) <= 2
+    candidate = _fallback_candidates(scaled, processed)[-1][0]
+    assert len(np.unique(candidate)) > 2
+
+
+def test_preprocess_after_normalize_scale_keeps_raw_candidate():
+    options = OcrOptions(deskew=False, brightness=10, contrast=20)
+    scaled = normalize_scale(_page("L"), options)
+    assert isinstance(scaled, np.ndarray)
+    raw = scaled.copy()
+    preprocess(scaled, options)
+    assert np.array_equal(scaled, raw)
+
+
+def test_preprocess_same_result_for_gray_and_rgb():
+    options = OcrOptions(text_height=0, deskew=False)
+    gray = preprocess(np.array(_page("L")), options)
+    rgb = preprocess(np.array(_page("RGB")), options)
+    assert np.array_equal(gray, rgb)
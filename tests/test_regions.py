@@ -0,0 +1,38 @@
+import shutil
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from cache import OcrCache
+from pipeline import OcrOptions
+from regions import Region, ocr_regions
+
+pytestmark = pytest.mark.skipif(shutil.which("tesseract") is None, reason="Tesseract n'est pas installé")
+
+
+class CountingCache(OcrCache):
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.hits = 0
+
+    def get(self, key):
+        value = super().get(key)
+        if value is not None:
+            self.hits += 1
+        return value
+
+
+def test_region_cache_keeps_manual_settings_with_autotune(tmp_path):
+    # Les zones ne sont pas réglées automatiquement : changer la luminosité doit changer la clé
+    path = tmp_path / "page.png"
+    Image.fromarray(np.full((200, 300), 255, dtype=np.uint8), "L").save(path)
+    regions = [Region("zone1", (0.1, 0.1, 0.9, 0.9))]
+    cache = CountingCache(str(tmp_path / "cache"))
+    options = OcrOptions(lang="eng", autotune=True, deskew=False)
+    ocr_regions(str(path), regions, options, cache=cache)
+    ocr_regions(str(path), regions, options, cache=cache)
+    assert cache.hits == 1
+    ocr_regions(str(path), regions, OcrOptions(lang="eng", autotune=True, deskew=False, brightness=20),
+                cache=cache)
+    assert cache.hits == 1
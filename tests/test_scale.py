@@ -0,0 +1,33 @@
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+from pipeline import OcrOptions, normalize_scale, scale_factor
+
+
+def test_scale_factor_band():
+    # Texte lisible (10-40 px) laissé tel quel, hors de la plage ramené vers 24 px
+    assert scale_factor(11, 24) == 1.0
+    assert scale_factor(38, 24) == 1.0
+    assert scale_factor(8, 24) == 3.0
+    assert scale_factor(60, 24) == 0.4
+    assert scale_factor(2, 24) == 4.0
+    assert scale_factor(None, 24) == 1.0
+
+
+def screenshot(size):
+    image = Image.new("L", (900, 300), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.load_default(size=size)
+    for i in range(6):
+        draw.text((10, 10 + i * 2 * size), "Lorem ipsum dolor sit amet, consectetur", fill=0, font=font)
+    return image
+
+
+def test_screenshot_text_not_enlarged():
+    image = screenshot(20)
+    assert normalize_scale(image, OcrOptions()).shape[:2] == (300, 900)
+
+
+def test_tiny_text_enlarged():
+    image = screenshot(6)
+    assert normalize_scale(image, OcrOptions()).shape[0] > 300
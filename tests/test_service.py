@@ -0,0 +1,137 @@
+import http.client
+import io
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import pytest
+from PIL import Image, ImageDraw
+
+import engine
+from engine import TesseractEngine
+from pipeline import OcrOptions
+from service import OcrService, make_server
+
+
+def png_page():
+    image = Image.new("L", (400, 120), 255)
+    ImageDraw.Draw(image).text((20, 40), "Bonjour le monde", fill=0)
+    output = io.BytesIO()
+    image.save(output, "PNG")
+    return output.getvalue()
+
+
+class UninterruptibleEngine(TesseractEngine):
+    # Moteur de test qui ne sait pas s'arrêter en cours de reconnaissance (comme tesserocr)
+    name = "tesserocr"
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        time.sleep(5)
+        return engine.TSV_HEADER + "\n"
+
+    def image_to_osd(self, image, cancel=None):
+        return ""
+
+
+def wait_idle(service, seconds):
+    deadline = time.monotonic() + seconds
+    while service.status()["busy"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return service.status()["busy"] == 0
+
+
+@pytest.mark.skipif(shutil.which("tesseract") is None, reason="tesseract absent")
+def test_timeout_stops_recognition(monkeypatch):
+    # Le délai dépassé doit libérer le processus de traitement tout de suite, même quand le
+    # moteur demandé ne peut pas être interrompu
+    monkeypatch.setitem(engine._engines, "tesserocr", UninterruptibleEngine())
+    monkeypatch.setenv("FAKE_SLEEP", "5")
+    service = OcrService(workers=1, timeout=0.5)
+    service.start()
+    try:
+        with pytest.raises(TimeoutError):
+            service.process(png_page(), OcrOptions(engine="tesserocr", deskew=False))
+        assert wait_idle(service, 1.5)
+    finally:
+        service.stop()
+
+
+class StubEngine(TesseractEngine):
+    # Moteur de test : un mot lu sur toute image
+    name = "cli"
+    cancellable = True
+
+    def version(self):
+        return "stub"
+
+    def languages(self):
+        return ["fra"]
+
+    def image_to_tsv(self, image, lang, psm=None, oem=None, cancel=None):
+        return engine.TSV_HEADER + "\n5\t1\t1\t1\t1\t1\t10\t10\t40\t12\t95\tBonjour\n"
+
+    def image_to_osd(self, image, cancel=None):
+        return ""
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Service sur un port libre, avec le moteur de test à la place de tesseract
+    monkeypatch.setitem(engine._engines, "cli", StubEngine())
+    service = OcrService(workers=1, queue_size=1)
+    service.start()
+    server = make_server(service, port=0, quiet=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.stop()
+
+
+def post(server, body, query="engine=cli&deskew=0"):
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request("POST", f"/ocr?{query}", body)
+    response = connection.getresponse()
+    return response.status, response.read().decode("utf-8"), response
+
+
+def test_ocr_text(server):
+    status, text, _ = post(server, png_page())
+    assert (status, text.strip()) == (200, "Bonjour")
+
+
+def test_unknown_format_rejected(server):
+    status, body, _ = post(server, png_page(), "engine=cli&format=docx")
+    assert status == 400
+    assert "docx" in json.loads(body)["error"]
+
+
+def test_unreadable_image_hides_temporary_file(server):
+    status, body, _ = post(server, b"pas une image")
+    assert status == 422
+    assert tempfile.gettempdir() not in json.loads(body)["error"]
+
+
+def test_full_queue_refused_before_body(server):
+    # La seule place est prise : la requête est refusée sans attendre le corps annoncé
+    assert server.service.reserve()
+    try:
+        with socket.create_connection(server.server_address, timeout=5) as sock:
+            sock.sendall(b"POST /ocr HTTP/1.1\r\nHost: localhost\r\nContent-Length: 1000000\r\n\r\n")
+            response = http.client.HTTPResponse(sock)
+            response.begin()
+            assert response.status == 429
+            assert response.getheader("Connection") == "close"
+    finally:
+        server.service.release()
+    assert post(server, png_page())[0] == 200
+
+
+def test_unix_socket_unavailable(monkeypatch):
+    monkeypatch.delattr(socket, "AF_UNIX", raising=False)
+    with pytest.raises(OSError):
+        make_server(OcrService(workers=1), unix_path="ready.sock")
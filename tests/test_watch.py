@@ -0,0 +1,28 @@
+import os
+import time
+
+from pipeline import OcrOptions
+import watch
+from watch import DONE, FAILED, FolderWatcher
+
+
+def crashing_process(path, options, with_trace=False, export=None, regions=None):
+    # Remplace le traitement dans les processus de travail : « crash.png » tue son processus
+    # pendant que les autres fichiers sont encore en cours
+    if os.path.basename(path) == "crash.png":
+        os._exit(1)
+    time.sleep(0.3)
+    return {"path": path, "text": os.path.basename(path), "error": None, "seconds": 0}
+
+
+def test_pool_crash_fails_only_the_culprit(tmp_path, monkeypatch):
+    monkeypatch.setattr(watch, "_process", crashing_process)
+    for name in ("a.png", "crash.png", "c.png", "d.png"):
+        (tmp_path / name).write_bytes(name.encode())
+    watcher = FolderWatcher(str(tmp_path), OcrOptions(), workers=2, settle=0, interval=0.05, rescan=0,
+                            use_events=False, log=lambda message: None)
+    counts = watcher.run(once=True)
+    assert counts[DONE] == 3
+    assert counts[FAILED] == 1
+    assert (tmp_path / "a.ocr.txt").read_text() == "a.png"
+    assert not (tmp_path / "crash.ocr.txt").exists()
@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Instrumentation légère du pipeline : chaque étape est chronométrée (horloge monotone) avec ses
+# informations utiles (dimensions, octets traités, configuration Tesseract...) dans une trace par
+# traitement, exportable en JSON. L'avancement affiché est calculé à partir de ces étapes.
+
+# Durée attendue de chaque étape (secondes), ajustée après chaque traitement : une étape terminée
+# fait avancer la barre de progression à proportion de ce qu'elle coûte habituellement
+_expected = {
+    "cache": 0.005,
+    "load": 0.05,
+    "deskew": 0.08,
+    "scale": 0.02,
+    "preprocess": 0.05,
+    "autotune": 1.5,
+    "language": 0.3,
+    "recognize": 1.0,
+    "fallback": 1.0,
+}
+_expected_lock = threading.Lock()
+
+# Poids des nouvelles mesures dans la moyenne glissante
+LEARNING_RATE = 0.3
+
+
+def expected_duration(stage):
+    with _expected_lock:
+        return _expected.get(stage, 0.05)
+
+
+def _learn(durations):
+    with _expected_lock:
+        for stage, seconds in durations.items():
+            previous = _expected.get(stage)
+            _expected[stage] = seconds if previous is None else previous + LEARNING_RATE * (seconds - previous)
+
+
+class JobTrace:
+    def __init__(self, job=None, progress=None):
+        self.job = job
+        self.progress = progress
+        self.info = {}
+        self.stages = []
+        self.started_at = time.time()
+        self.total_ms = None
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+        self._planned = 0.0
+        self._done = 0.0
+        self._reported = 0
+
+    def note(self, **info):
+        # Informations générales du traitement (nombre de pages, moteur, réponse du cache...)
+        with self._lock:
+            self.info.update(info)
+
+    def plan(self, *stages, repeat=1):
+        # Annonce des étapes à venir, pour que l'avancement se rapporte à tout le travail prévu
+        with self._lock:
+            self._planned += sum(expected_duration(stage) for stage in stages) * repeat
+
+    def complete(self, *stages, repeat=1):
+        # Étapes prévues qui n'auront pas lieu (page trouvée dans le cache...)
+        with self._lock:
+            self._done += sum(expected_duration(stage) for stage in stages) * repeat
+        self._report()
+
+    @contextmanager
+    def stage(self, name, **info):
+        # with trace.stage("recognize", page=0) as entry: ... entry["bytes"] = ...
+        entry = {"stage": name}
+        entry.update(info)
+        start = time.monotonic()
+        try:
+            yield entry
+        finally:
+            end = time.monotonic()
+            entry["start_ms"] = round((start - self._start) * 1000, 3)
+            entry["ms"] = round((end - start) * 1000, 3)
+            with self._lock:
+                self.stages.append(entry)
+                self._done += expected_duration(name)
+            self._report()
+
+    def _report(self):
+        if self.progress is None:
+            return
+        with self._lock:
+            fraction = self._done / self._planned if self._planned else 0.0
+            percent = min(99, int(fraction * 100))
+            if percent <= self._reported:
+                return
+            self._reported = percent
+        self.progress(percent)
+
+    def elapsed_ms(self):
+        return round((time.monotonic() - self._start) * 1000, 3)
+
+    def finish(self):
+        self.total_ms = self.elapsed_ms()
+        # Mise à jour des durées attendues avec la moyenne observée de chaque étape
+        _learn({name: total["ms"] / total["count"] / 1000
+                for name, total in self.totals().items() if name in _expected})
+        if self.progress is not None:
+            self.progress(100)
+        return self
+
+    def totals(self):
+        totals = {}
+        with self._lock:
+            for entry in self.stages:
+                total = totals.setdefault(entry["stage"], {"ms": 0.0, "count": 0})
+                total["ms"] += entry["ms"]
+                total["count"] += 1
+        for total in totals.values():
+            total["ms"] = round(total["ms"], 3)
+        return totals
+
+    def to_dict(self):
+        with self._lock:
+            stages = list(self.stages)
+            info = dict(self.info)
+        return {"job": self.job, "started_at": self.started_at, "total_ms": self.total_ms,
+                "info": info, "totals": self.totals(), "stages": stages}
+
+    def to_json(self, indent=None):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=indent)
+
+    def format_table(self):
+        # Résumé lisible pour le panneau de statistiques
+        lines = []
+        if self.total_ms is not None:
+            lines.append(f"Total : {self.total_ms:.0f} ms")
+        for name, total in sorted(self.totals().items(), key=lambda item: -item[1]["ms"]):
+            lines.append(f"{name:<12} {total['ms']:>9.1f} ms  ({total['count']}x)")
+        for key, value in self.info.items():
+            lines.append(f"{key} : {value}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def stage(trace, name, **info):
+    # Comme trace.stage(), mais sans effet quand aucune trace n'est demandée
+    if trace is None:
+        yield {}
+    else:
+        with trace.stage(name, **info) as entry:
+            yield entry
@@ -0,0 +1,500 @@
+import argparse
+import collections
+import hashlib
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from batch import IMAGE_EXTENSIONS, _init_worker, _output_path, _process, add_ocr_arguments, \
+    cache_config_from_args, options_from_args
+from cache import hash_file
+from discovery import configure_tesseract
+from export import EXPORT_FORMATS
+from regions import load_template
+
+# Surveillance d'un dossier : python main.py watch <dossier> [--output résultats/]
+# Les images déposées ou modifiées sont traitées dès que leur écriture est terminée, sans relire
+# tout l'arborescence à chaque tour. Un journal sur disque retient ce qui a déjà été traité
+# (taille, date et empreinte du contenu) pour reprendre proprement après un redémarrage.
+
+try:
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
+# Un fichier est considéré complet quand sa taille et sa date n'ont pas bougé pendant ce délai (s)
+SETTLE_SECONDS = 2.0
+
+# Intervalle entre deux tours de la boucle de surveillance (s)
+POLL_INTERVAL = 1.0
+
+# Relecture complète périodique, pour les fichiers réécrits sur place que la scrutation des
+# dossiers ne voit pas (s, 0 pour désactiver)
+RESCAN_INTERVAL = 300.0
+
+# Suffixe des résultats écrits à côté des images (scan.png -> scan.ocr.txt), ignorés à leur tour
+OUTPUT_SUFFIX = ".ocr"
+
+JOURNAL_NAME = ".ready-watch.jsonl"
+
+# Le journal est réécrit au démarrage quand il contient plus de lignes périmées que cela
+JOURNAL_COMPACT_LINES = 1000
+
+DONE, DUPLICATE, FAILED = "done", "duplicate", "failed"
+
+
+def _list_files(directory, recursive, skip_dirs=()):
+    files = []
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return files
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if recursive and entry.path not in skip_dirs:
+                files.extend(_list_files(entry.path, recursive, skip_dirs))
+        elif entry.is_file():
+            files.append(entry.path)
+    return files
+
+
+class DirectoryPoller:
+    # Scrutation sans notifications du système : seuls les dossiers dont la date de modification a
+    # changé (fichier ajouté, renommé ou supprimé) sont relus
+    def __init__(self, root, recursive, skip_dirs=()):
+        self.root = root
+        self.recursive = recursive
+        self.skip_dirs = skip_dirs
+        # dossier -> date de modification lors de la dernière lecture (None : à relire)
+        self.dirs = {root: None}
+
+    def _read(self, directory, files):
+        try:
+            stat = os.stat(directory)
+            entries = list(os.scandir(directory))
+        except OSError:
+            self.dirs.pop(directory, None)
+            return
+        # Sur les systèmes de fichiers à dates grossières (FAT : 2 s), un ajout juste après la
+        # lecture ne changerait pas la date : le dossier reste à relire tant qu'elle est récente
+        recent = time.time() - stat.st_mtime < 2
+        self.dirs[directory] = None if recent else stat.st_mtime_ns
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if self.recursive and entry.path not in self.skip_dirs and entry.path not in self.dirs:
+                    self._read(entry.path, files)
+            elif entry.is_file():
+                files.append(entry.path)
+
+    def changes(self):
+        files = []
+        for directory, mtime in list(self.dirs.items()):
+            try:
+                changed = mtime is None or os.stat(directory).st_mtime_ns != mtime
+            except OSError:
+                self.dirs.pop(directory, None)
+                continue
+            if changed:
+                self._read(directory, files)
+        return files
+
+    def rescan(self):
+        for directory in self.dirs:
+            self.dirs[directory] = None
+
+    def stop(self):
+        pass
+
+
+class EventSource:
+    # Notifications du système (inotify, FSEvents, ReadDirectoryChangesW) reçues par watchdog.
+    # Le traitement des événements reste dans la boucle principale : l'observateur ne fait que
+    # les empiler. Les dossiers apparus d'un coup (déplacés) sont listés en entier
+    def __init__(self, root, recursive, skip_dirs=()):
+        self.recursive = recursive
+        self.skip_dirs = skip_dirs
+        self.events = queue.SimpleQueue()
+        self.observer = Observer()
+        self.observer.schedule(self, root, recursive=recursive)
+        self.observer.start()
+        # Les fichiers déjà présents au démarrage
+        self.events.put(root)
+
+    def dispatch(self, event):
+        if event.event_type in ("created", "modified", "closed"):
+            self.events.put(os.fsdecode(event.src_path))
+        elif event.event_type == "moved":
+            self.events.put(os.fsdecode(event.dest_path))
+
+    def changes(self):
+        files = []
+        while True:
+            try:
+                path = self.events.get_nowait()
+            except queue.Empty:
+                return files
+            if os.path.isdir(path):
+                if path not in self.skip_dirs:
+                    files.extend(_list_files(path, self.recursive, self.skip_dirs))
+            else:
+                files.append(path)
+
+    def rescan(self):
+        pass
+
+    def stop(self):
+        self.observer.stop()
+        self.observer.join()
+
+
+class StateJournal:
+    # Journal JSON Lines, une ligne par fichier vu : chemin, taille, date, empreinte, statut.
+    # Relu au démarrage ; la dernière ligne d'un chemin l'emporte
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        # Empreinte (contenu et réglages) -> chemin déjà traité avec ce résultat
+        self.keys = {}
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        lines = 0
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne tronquée par un arrêt brutal
+                        continue
+                    lines += 1
+                    self._apply(entry)
+        if lines - len(self.entries) > JOURNAL_COMPACT_LINES:
+            self._compact()
+        self.f = open(path, "a", encoding="utf-8")
+
+    def _apply(self, entry):
+        # Un fichier réécrit ne vaut plus pour son ancien contenu
+        previous = self.entries.get(entry["path"])
+        if previous is not None and self.keys.get(previous["key"]) == entry["path"]:
+            del self.keys[previous["key"]]
+        self.entries[entry["path"]] = entry
+        if entry["status"] == DONE:
+            self.keys[entry["key"]] = entry["path"]
+
+    def _compact(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(temporary, self.path)
+
+    def unchanged(self, path, stat):
+        entry = self.entries.get(path)
+        return entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns
+
+    def processed(self, key):
+        return self.keys.get(key)
+
+    def record(self, path, stat, key, status, **details):
+        entry = {"path": path, "size": stat.st_size, "mtime": stat.st_mtime_ns, "key": key,
+                 "status": status, "time": round(time.time(), 3), **details}
+        self.f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.f.flush()
+        self._apply(entry)
+
+    def close(self):
+        self.f.close()
+
+
+def _init_watch_worker(tesseract_cmd, cache_config):
+    # Ctrl+C n'arrête que le processus principal, qui laisse finir les fichiers en cours
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(tesseract_cmd, cache_config)
+
+
+class FolderWatcher:
+    def __init__(self, root, options, output_dir=None, output_format="txt", workers=None, recursive=False,
+                 settle=SETTLE_SECONDS, interval=POLL_INTERVAL, rescan=RESCAN_INTERVAL, state_path=None,
+                 tesseract_cmd=None, cache_config=None, use_events=True, log=print, regions=None):
+        self.root = os.path.abspath(root)
+        self.options = options
+        self.output_dir = os.path.abspath(output_dir) if output_dir else None
+        self.output_format = output_format
+        self.workers = workers or os.cpu_count() or 1
+        self.recursive = recursive
+        self.settle = settle
+        self.interval = interval
+        self.rescan_interval = rescan
+        self.state_path = os.path.abspath(state_path or os.path.join(self.output_dir or self.root, JOURNAL_NAME))
+        self.tesseract_cmd = tesseract_cmd
+        self.cache_config = cache_config
+        self.use_events = use_events and Observer is not None
+        self.log = log
+        self.regions = regions
+        # Les réglages font partie de l'empreinte : les changer fait retraiter les fichiers
+        self.settings = json.dumps({"options": options.to_dict(), "format": output_format,
+                                    "regions": [region.to_dict() for region in regions or ()]}, sort_keys=True)
+        # chemin -> (taille, date, instant depuis lequel elles n'ont pas bougé)
+        self.pending = {}
+        # Fichiers complets en attente d'un processus libre, dans l'ordre d'arrivée
+        self.ready = collections.deque()
+        # future -> (chemin, stat, empreinte) ; au plus deux fichiers par processus sont soumis
+        self.running = {}
+        # Un processus du pool a disparu (mémoire épuisée, plantage de Tesseract) : le pool est à remplacer
+        self.broken = False
+        # Fichiers en cours lors de la chute d'un pool : retraités une fois, seuls, pour savoir
+        # lequel l'a fait tomber
+        self.suspects = set()
+        self.counts = collections.Counter()
+
+    def _skip_dirs(self):
+        return frozenset([self.output_dir]) if self.output_dir else frozenset()
+
+    def _wanted(self, path):
+        lower = path.lower()
+        if not lower.endswith(IMAGE_EXTENSIONS):
+            return False
+        if self.output_dir and path.startswith(self.output_dir + os.sep):
+            return False
+        return not os.path.splitext(lower)[0].endswith(OUTPUT_SUFFIX)
+
+    def output_path(self, path, extension):
+        if self.output_dir:
+            return _output_path(self.output_dir, self.root, path, extension)
+        return os.path.splitext(path)[0] + OUTPUT_SUFFIX + extension
+
+    def _key(self, path):
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(hash_file(path).encode("ascii"))
+        digest.update(self.settings.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _notice(self, path, journal, now):
+        path = os.path.abspath(path)
+        if not self._wanted(path):
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        # Déjà vu sous cette taille et cette date : rien à relire (reprise après redémarrage)
+        if journal.unchanged(path, stat):
+            return
+        signature = (stat.st_size, stat.st_mtime_ns)
+        previous = self.pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self.pending[path] = signature + (now,)
+
+    def _check_pending(self, journal, now):
+        busy = {path for path, _, _ in self.running.values()}
+        busy.update(path for path, _ in self.ready)
+        for path, (size, mtime, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime):
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+                continue
+            # Encore en cours d'écriture, ou déjà en file dans sa version précédente
+            if now - since < self.settle or path in busy:
+                continue
+            del self.pending[path]
+            if stat.st_size == 0 or journal.unchanged(path, stat):
+                continue
+            self.ready.append((path, stat))
+
+    def _submit(self, executor, journal):
+        running_keys = {key for _, _, key in self.running.values()}
+        while self.ready and len(self.running) < 2 * self.workers:
+            # Un fichier suspect occupe le pool à lui seul, et attend que le pool soit vide
+            if any(path in self.suspects for path, _, _ in self.running.values()):
+                return
+            path, stat = self.ready.popleft()
+            if path in self.suspects and self.running:
+                self.ready.appendleft((path, stat))
+                return
+            try:
+                key = self._key(path)
+            except OSError as e:
+                self.log(f"{path} - illisible: {e}")
+                continue
+            original = journal.processed(key)
+            if original == path:
+                # Date changée sans que le contenu change (copie, touch) : le résultat est toujours bon
+                journal.record(path, stat, key, DONE, output=journal.entries[path].get("output"))
+                continue
+            if original is None and key in running_keys:
+                original = next(other for other, _, other_key in self.running.values() if other_key == key)
+            if original is not None:
+                journal.record(path, stat, key, DUPLICATE, same_as=original)
+                self.counts[DUPLICATE] += 1
+                self.log(f"{path} - déjà traité ({original})")
+                continue
+            structured = self.output_format != "txt"
+            export = (self.output_format, self.output_path(path, EXPORT_FORMATS[self.output_format])) \
+                if structured else None
+            try:
+                future = executor.submit(_process, path, self.options, False, export, self.regions)
+            except BrokenProcessPool:
+                # Soumis de nouveau au pool qui remplacera celui-ci
+                self.ready.appendleft((path, stat))
+                self.broken = True
+                return
+            self.running[future] = (path, stat, key)
+            running_keys.add(key)
+
+    def _collect(self, futures, journal):
+        for future in futures:
+            path, stat, key = self.running.pop(future)
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                self.broken = True
+                if path not in self.suspects:
+                    # On ne sait pas quel fichier a fait tomber le processus : chacun de ceux du pool
+                    # cassé est retraité une fois, seul, sur le pool neuf
+                    self.suspects.add(path)
+                    self.ready.appendleft((path, stat))
+                    continue
+                result = {"error": "processus de traitement interrompu (mémoire épuisée ou plantage)",
+                          "seconds": 0}
+            self.suspects.discard(path)
+            if result["error"]:
+                # Retraité seulement si le fichier change : pas de boucle sur une image illisible
+                journal.record(path, stat, key, FAILED, error=result["error"])
+                self.counts[FAILED] += 1
+                self.log(f"{path} ({result['seconds']} s) - erreur: {result['error']}")
+                continue
+            target = self.output_path(path, EXPORT_FORMATS[self.output_format])
+            if self.output_format == "txt":
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with open(target, "w", encoding="utf-8") as f:
+                    f.write(result["text"])
+            journal.record(path, stat, key, DONE, output=target)
+            self.counts[DONE] += 1
+            self.log(f"{path} ({result['seconds']} s) -> {target}")
+
+    def idle(self):
+        return not (self.pending or self.ready or self.running)
+
+    def _executor(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_watch_worker,
+                                   initargs=(self.tesseract_cmd, self.cache_config))
+
+    def _recover(self, executor, journal):
+        # Pool cassé : les fichiers qu'il traitait encore sont remis en file (ou notés en échec
+        # s'ils le faisaient tomber seuls), puis un pool neuf prend la suite sans arrêter la surveillance
+        if not self.broken:
+            return executor
+        self._collect(wait(self.running).done, journal)
+        executor.shutdown(wait=False)
+        self.broken = False
+        self.log("Un processus de traitement s'est arrêté : les processus sont relancés.")
+        return self._executor()
+
+    def run(self, stop=None, once=False):
+        # `once` : traiter les fichiers présents puis rendre la main dès qu'il n'y a plus rien à faire
+        stop = stop or threading.Event()
+        journal = StateJournal(self.state_path)
+        source = (EventSource if self.use_events and not once else DirectoryPoller)(
+            self.root, self.recursive, self._skip_dirs())
+        self.log(f"Surveillance de {self.root} ({'notifications' if isinstance(source, EventSource) else 'scrutation'}"
+                 f", {self.workers} processus). Ctrl+C pour arrêter.")
+        executor = self._executor()
+        last_rescan = time.monotonic()
+        try:
+            while not stop.is_set():
+                executor = self._recover(executor, journal)
+                now = time.monotonic()
+                if self.rescan_interval and now - last_rescan >= self.rescan_interval:
+                    source.rescan()
+                    last_rescan = now
+                for path in source.changes():
+                    self._notice(path, journal, now)
+                self._check_pending(journal, now)
+                self._submit(executor, journal)
+                finished, _ = wait(self.running, timeout=0) if self.running else ((), ())
+                self._collect(finished, journal)
+                if once and self.idle():
+                    break
+                # Attendre le prochain tour, ou la fin d'un fichier si des processus travaillent
+                if self.running:
+                    finished, _ = wait(self.running, timeout=self.interval)
+                    self._collect(finished, journal)
+                else:
+                    stop.wait(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            source.stop()
+            # Les fichiers pas encore commencés seront repris au prochain démarrage
+            for future in list(self.running):
+                if future.cancel():
+                    del self.running[future]
+            if self.running:
+                self.log(f"Arrêt : attente des {len(self.running)} fichier(s) en cours...")
+                self._collect(wait(self.running).done, journal)
+            executor.shutdown()
+            journal.close()
+        return self.counts
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py watch",
+                                     description="Surveiller un dossier et extraire le texte des images déposées")
+    parser.add_argument("folder", help="Dossier à surveiller")
+    parser.add_argument("--output", "-o", default=None,
+                        help="Dossier des résultats, en miroir du dossier surveillé (défaut: à côté des images, "
+                             f"avec le suffixe {OUTPUT_SUFFIX})")
+    parser.add_argument("--format", choices=tuple(EXPORT_FORMATS), default="txt",
+                        help="Format des résultats : texte, hOCR, ALTO XML ou PDF avec couche de texte")
+    parser.add_argument("--recursive", "-r", action="store_true", help="Surveiller aussi les sous-dossiers")
+    parser.add_argument("--workers", type=int, default=None, help="Nombre de processus (défaut: nombre de cœurs)")
+    parser.add_argument("--settle", type=float, default=SETTLE_SECONDS,
+                        help="Secondes sans changement avant de traiter un fichier (défaut: %(default)s)")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL,
+                        help="Secondes entre deux vérifications (défaut: %(default)s)")
+    parser.add_argument("--rescan", type=float, default=RESCAN_INTERVAL,
+                        help="Secondes entre deux relectures complètes, 0 pour désactiver (défaut: %(default)s)")
+    parser.add_argument("--state", default=None,
+                        help=f"Journal des fichiers traités (défaut: {JOURNAL_NAME} dans le dossier des résultats)")
+    parser.add_argument("--poll", action="store_true",
+                        help="Scruter les dossiers même si les notifications du système (watchdog) sont disponibles")
+    parser.add_argument("--once", action="store_true", help="Traiter les fichiers présents puis quitter")
+    add_ocr_arguments(parser)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.isdir(args.folder):
+        print(f"Dossier introuvable : {args.folder}", file=sys.stderr)
+        return 1
+
+    try:
+        regions = load_template(args.regions) if args.regions else None
+    except (OSError, ValueError) as e:
+        print(f"Modèle de zones inutilisable : {e}", file=sys.stderr)
+        return 1
+
+    stop = threading.Event()
+    # Arrêt propre aussi sur SIGTERM (service système, conteneur)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    watcher = FolderWatcher(args.folder, options_from_args(args), args.output, args.format, args.workers,
+                            args.recursive, args.settle, args.interval, args.rescan, args.state,
+                            configure_tesseract(args.tesseract_cmd), cache_config_from_args(args), not args.poll,
+                            regions=regions)
+    counts = watcher.run(stop, args.once)
+    print(f"{counts[DONE]} traité(s), {counts[DUPLICATE]} doublon(s), {counts[FAILED]} en erreur.")
+    return 1 if counts[FAILED] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())